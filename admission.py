@@ -0,0 +1,125 @@
+"""Controle de admissão dos updates recebidos.
+
+`PriorityUpdateProcessor` é o processador de updates da Application
+(`concurrent_updates`): no máximo `concurrency` updates rodam ao mesmo
+tempo e os demais esperam em uma fila ordenada por prioridade, de forma
+que comandos de admin passam à frente de entradas no grupo, que passam à
+frente de mensagens comuns.
+
+Updates repetidos (`duplicate(update)` retorna True) são descartados antes
+de serem classificados, na ordem de chegada: um update que espera vaga já
+foi registrado pelo deduplicador e não pode ser confundido com um repetido
+quando updates mais novos de maior prioridade passam à frente dele.
+
+Quando a fila atinge `shed_depth`, as mensagens de menor prioridade não
+entram nela: vão para `shed(update)`, um caminho reduzido (no bot, só o
+registro da mensagem no buffer de escrita, com amostragem). O total de
+updates dentro do processador é limitado a `concurrency + queue_size`;
+acima disso a própria Application segura os próximos.
+"""
+import asyncio
+import heapq
+import itertools
+import logging
+import time
+from collections import Counter
+
+from telegram.ext import BaseUpdateProcessor
+
+logger = logging.getLogger(__name__)
+
+# Da maior para a menor prioridade
+PRIORITIES = ('admin', 'join', 'command', 'message')
+LOWEST = len(PRIORITIES) - 1
+
+
+class PriorityUpdateProcessor(BaseUpdateProcessor):
+    """Fila de espera por prioridade com descarte das mensagens comuns sob carga"""
+
+    def __init__(self, classify, shed=None, duplicate=None, concurrency=8, queue_size=1000, shed_depth=200, metrics=None):
+        super().__init__(concurrency + queue_size)
+        self.classify = classify
+        self.shed = shed
+        self.duplicate = duplicate
+        self.concurrency = concurrency
+        self.shed_depth = shed_depth
+        self.metrics = metrics
+        self.shed_counts = Counter()
+        self._running = 0
+        self._waiting = []
+        self._depths = [0] * len(PRIORITIES)
+        self._seq = itertools.count()
+
+    @property
+    def depth(self):
+        """Updates aguardando uma vaga"""
+        return sum(self._depths)
+
+    def depth_of(self, priority):
+        return self._depths[PRIORITIES.index(priority)]
+
+    async def initialize(self):
+        pass
+
+    async def shutdown(self):
+        pass
+
+    async def do_process_update(self, update, coroutine):
+        if self.duplicate is not None and self.duplicate(update):
+            coroutine.close()
+            return
+
+        priority = self.classify(update)
+
+        if priority == LOWEST and self.shed is not None and self.depth >= self.shed_depth:
+            coroutine.close()
+            self.shed_counts[PRIORITIES[priority]] += 1
+            if self.metrics:
+                self.metrics.updates_shed.inc(PRIORITIES[priority])
+            self.shed(update)
+            return
+
+        try:
+            await self._acquire(priority)
+        except asyncio.CancelledError:
+            coroutine.close()
+            raise
+        try:
+            await coroutine
+        finally:
+            self._release()
+
+    async def _acquire(self, priority):
+        """Espera uma vaga, atendendo primeiro as prioridades mais altas"""
+        if self._running < self.concurrency and not self._waiting:
+            self._running += 1
+            self._observe_wait(priority, 0.0)
+            return
+
+        waiter = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiting, (priority, next(self._seq), waiter))
+        self._depths[priority] += 1
+        started = time.perf_counter()
+        try:
+            await waiter
+        except asyncio.CancelledError:
+            # A vaga pode ter sido entregue logo antes do cancelamento
+            if waiter.done() and not waiter.cancelled():
+                self._release()
+            raise
+        finally:
+            self._depths[priority] -= 1
+        self._observe_wait(priority, time.perf_counter() - started)
+
+    def _release(self):
+        # Entrega a vaga direto ao próximo da fila (o total em execução não muda)
+        while self._waiting:
+            _, _, waiter = heapq.heappop(self._waiting)
+            if not waiter.done():
+                waiter.set_result(None)
+                return
+        self._running -= 1
+
+    def _observe_wait(self, priority, seconds):
+        if self.metrics:
+            self.metrics.update_wait.observe(seconds, PRIORITIES[priority])
@@ -0,0 +1,149 @@
+"""Contadores de engajamento para o /ranking e o /horarios.
+
+Mantidos no mesmo caminho (e na mesma transação) em que as mensagens são
+gravadas, como os agregados do /stats:
+- `user_daily_counts`: mensagens por dia (UTC) e por usuário
+- `activity_buckets`: mensagens por grupo em cada uma das 168 horas da
+  semana (dia da semana x hora, em UTC)
+
+O ranking soma no máximo `dias x usuários ativos` linhas e o mapa de
+horários lê 168 linhas por grupo, independentemente do tamanho do
+histórico. Os horários são convertidos para o fuso do bot na leitura,
+deslocando as faixas pelo offset atual (em horas inteiras).
+"""
+import functools
+import logging
+from collections import Counter
+from datetime import date
+
+from rollups import history_source
+
+logger = logging.getLogger(__name__)
+
+HOURS_PER_WEEK = 7 * 24
+
+
+def create_analytics_tables(cursor):
+    """Cria as tabelas de contadores; retorna True se são novas (precisam de backfill)"""
+    exists = cursor.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'activity_buckets'"
+    ).fetchone()
+
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS user_daily_counts (
+            day TEXT NOT NULL,
+            user_id INTEGER NOT NULL,
+            message_count INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (day, user_id)
+        ) WITHOUT ROWID
+    ''')
+
+    # slot = dia da semana (0 = segunda) * 24 + hora, em UTC
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS activity_buckets (
+            group_id INTEGER NOT NULL,
+            slot INTEGER NOT NULL,
+            message_count INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (group_id, slot)
+        ) WITHOUT ROWID
+    ''')
+
+    return exists is None
+
+
+@functools.lru_cache(maxsize=64)
+def _weekday(day):
+    return date(int(day[:4]), int(day[5:7]), int(day[8:10])).weekday()
+
+
+def activity_slot(message_date):
+    """'AAAA-MM-DD HH:MM:SS' (UTC) -> faixa da semana (0..167)"""
+    return _weekday(message_date[:10]) * 24 + int(message_date[11:13])
+
+
+def apply_activity_counters(conn, messages):
+    """Atualiza os contadores para um lote de mensagens recém-gravadas.
+
+    `messages` tem o mesmo formato de `rollups.apply_message_rollups`:
+    tuplas (user_id, message_text, message_date, group_id).
+    """
+    if not messages:
+        return
+
+    user_counts = Counter()
+    slot_counts = Counter()
+    for user_id, _, message_date, group_id in messages:
+        user_counts[(message_date[:10], user_id)] += 1
+        slot_counts[(group_id, activity_slot(message_date))] += 1
+
+    conn.executemany('''
+        INSERT INTO user_daily_counts (day, user_id, message_count)
+        VALUES (?, ?, ?)
+        ON CONFLICT(day, user_id) DO UPDATE SET
+            message_count = message_count + excluded.message_count
+    ''', [(day, user_id, count) for (day, user_id), count in user_counts.items()])
+
+    conn.executemany('''
+        INSERT INTO activity_buckets (group_id, slot, message_count)
+        VALUES (?, ?, ?)
+        ON CONFLICT(group_id, slot) DO UPDATE SET
+            message_count = message_count + excluded.message_count
+    ''', [(group_id, slot, count) for (group_id, slot), count in slot_counts.items()])
+
+
+def backfill_analytics(conn):
+    """Recalcula os contadores a partir do histórico de mensagens (tabela quente + arquivo)"""
+    source = history_source(conn)
+
+    conn.execute('DELETE FROM user_daily_counts')
+    conn.execute('DELETE FROM activity_buckets')
+
+    conn.execute(f'''
+        INSERT INTO user_daily_counts (day, user_id, message_count)
+        SELECT date(message_date), user_id, COUNT(*)
+        FROM {source}
+        GROUP BY date(message_date), user_id
+    ''')
+
+    # strftime('%w') começa no domingo; as faixas começam na segunda
+    conn.execute(f'''
+        INSERT INTO activity_buckets (group_id, slot, message_count)
+        SELECT group_id,
+               ((CAST(strftime('%w', message_date) AS INTEGER) + 6) % 7) * 24
+                   + CAST(strftime('%H', message_date) AS INTEGER),
+               COUNT(*)
+        FROM {source}
+        GROUP BY 1, 2
+    ''')
+
+    total = conn.execute('SELECT COALESCE(SUM(message_count), 0) FROM activity_buckets').fetchone()[0]
+    logger.info(f"Contadores de engajamento recalculados ({total} mensagens)")
+    return total
+
+
+def read_ranking(conn, days=7, limit=10):
+    """Top `limit` usuários por mensagens nos últimos `days` dias: (user_id, first_name, username, total)"""
+    return conn.execute('''
+        SELECT c.user_id, u.first_name, u.username, c.total
+        FROM (
+            SELECT user_id, SUM(message_count) AS total
+            FROM user_daily_counts
+            WHERE day > date('now', ?)
+            GROUP BY user_id
+            ORDER BY total DESC
+            LIMIT ?
+        ) c
+        LEFT JOIN users u ON u.user_id = c.user_id
+        ORDER BY c.total DESC
+    ''', (f'-{int(days)} days', limit)).fetchall()
+
+
+def read_activity(conn, group_id, utc_offset_hours=0):
+    """Mensagens por faixa da semana no fuso local: lista de 168 contadores (segunda 00h primeiro)"""
+    counts = [0] * HOURS_PER_WEEK
+    rows = conn.execute(
+        'SELECT slot, message_count FROM activity_buckets WHERE group_id = ?', (group_id,)
+    ).fetchall()
+    for slot, count in rows:
+        counts[(slot + utc_offset_hours) % HOURS_PER_WEEK] += count
+    return counts
@@ -0,0 +1,129 @@
+"""Detecção de flood por usuário no caminho das mensagens.
+
+Cada par (chat, usuário) guarda um anel com os horários das últimas
+`max_messages` mensagens: a posição que vai ser sobrescrita é a mensagem
+mais antiga da janela, então "mais de `max_messages` em `window` segundos"
+é uma única comparação. O mesmo estado guarda o hash do último texto e
+quantas vezes seguidas ele se repetiu. A verificação é O(1) por mensagem.
+
+Quando um limite é ultrapassado começa uma rajada: a primeira mensagem
+retorna o motivo ('flood' ou 'repeat') e as seguintes retornam 'burst'
+até o usuário ficar `window` segundos sem escrever.
+
+A memória é limitada: os estados ficam em ordem de uso (OrderedDict) e
+os que estão ociosos há mais que a maior janela configurada são removidos
+a cada verificação; acima de `max_tracked` o menos recente é descartado.
+"""
+import logging
+import time
+from collections import OrderedDict, namedtuple
+
+logger = logging.getLogger(__name__)
+
+# Mensagens por janela, janela (s), repetições seguidas do mesmo texto e silêncio aplicado (s, 0 = não restringe)
+FloodLimits = namedtuple('FloodLimits', 'max_messages window max_repeats mute_seconds')
+
+
+def parse_group_limits(text, default):
+    """'chat:mensagens:janela:repetições:silêncio,...' -> {chat_id: FloodLimits}
+
+    Campos vazios usam o valor padrão (ex.: '-100123:5::2' muda só mensagens e repetições).
+    """
+    limits = {}
+    for item in text.split(','):
+        item = item.strip()
+        if not item:
+            continue
+        chat_id, *values = item.split(':')
+        if len(values) > len(FloodLimits._fields):
+            raise ValueError(f"Limite de flood inválido: {item}")
+        fields = default._asdict()
+        for name, value in zip(FloodLimits._fields, values):
+            if value.strip():
+                fields[name] = type(fields[name])(value)
+        limits[int(chat_id)] = FloodLimits(**fields)
+    return limits
+
+
+class _UserState:
+    __slots__ = ('times', 'pos', 'last_hash', 'repeats', 'flagged_until', 'last_seen')
+
+    def __init__(self, size):
+        self.times = [float('-inf')] * size
+        self.pos = 0
+        self.last_hash = None
+        self.repeats = 0
+        self.flagged_until = 0.0
+        self.last_seen = 0.0
+
+
+class FloodGuard:
+    """Contadores de janela deslizante por (chat, usuário)"""
+
+    def __init__(self, default, group_limits=None, max_tracked=50000):
+        self.default = default
+        self.group_limits = group_limits or {}
+        self.max_tracked = max_tracked
+        self.bursts = 0
+        self.suppressed = 0
+        self._idle_after = max(limits.window for limits in (default, *self.group_limits.values()))
+        self._states = OrderedDict()
+
+    def __len__(self):
+        return len(self._states)
+
+    def limits_for(self, chat_id):
+        return self.group_limits.get(chat_id, self.default)
+
+    def check(self, chat_id, user_id, text, now=None):
+        """Registra a mensagem; retorna None, o motivo de uma nova rajada ('flood'/'repeat') ou 'burst'"""
+        now = time.monotonic() if now is None else now
+        limits = self.limits_for(chat_id)
+        if limits.max_messages <= 0:
+            return None
+
+        key = (chat_id, user_id)
+        state = self._states.get(key)
+        if state is None or len(state.times) != limits.max_messages:
+            state = self._states[key] = _UserState(limits.max_messages)
+        else:
+            self._states.move_to_end(key)
+        previous, state.last_seen = state.last_seen, now
+        self._evict(now)
+
+        text_hash = hash(text)
+        if text_hash == state.last_hash and now - previous <= limits.window:
+            state.repeats += 1
+        else:
+            state.last_hash = text_hash
+            state.repeats = 1
+
+        # A posição sobrescrita guarda a mais antiga das últimas `max_messages` mensagens
+        oldest = state.times[state.pos]
+        state.times[state.pos] = now
+        state.pos = (state.pos + 1) % limits.max_messages
+
+        if now < state.flagged_until:
+            state.flagged_until = now + limits.window
+            self.suppressed += 1
+            return 'burst'
+
+        if now - oldest < limits.window:
+            reason = 'flood'
+        elif limits.max_repeats > 0 and state.repeats > limits.max_repeats:
+            reason = 'repeat'
+        else:
+            return None
+
+        state.flagged_until = now + limits.window
+        self.bursts += 1
+        self.suppressed += 1
+        return reason
+
+    def _evict(self, now):
+        # Os menos recentes ficam no início: para no primeiro que ainda está ativo
+        while self._states:
+            key, state = next(iter(self._states.items()))
+            if len(self._states) <= self.max_tracked and now - state.last_seen <= self._idle_after:
+                break
+            del self._states[key]
@@ -0,0 +1,140 @@
+"""Servidor local que imita a Bot API do Telegram para os benchmarks.
+
+Responde aos métodos usados pelo bot sem acesso à rede, com latência
+configurável, e serve `getUpdates` a partir de uma fila de updates
+sintéticos (modo polling).
+"""
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs
+
+BOT_USER = {
+    'id': 999000,
+    'is_bot': True,
+    'first_name': 'Auge Bench',
+    'username': 'auge_bench_bot',
+    'can_join_groups': True,
+    'can_read_all_group_messages': True,
+    'supports_inline_queries': False
+}
+
+
+class FakeBotAPI:
+    """Bot API falsa em uma thread: `start()`, `base_url`, `push_updates()` e `stop()`"""
+
+    def __init__(self, latency=0.0, host='127.0.0.1', port=0):
+        self.latency = latency
+        self.calls = {}
+        self.first_call_at = {}  # método -> time.monotonic() da primeira chamada
+        self.webhook_url = None
+        self._updates = []
+        self._cond = threading.Condition()
+        self._message_id = 0
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer((host, port), self._make_handler())
+        self._server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def base_url(self):
+        host, port = self._server.server_address[:2]
+        return f'http://{host}:{port}/bot'
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, name='fake-bot-api', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def push_updates(self, updates):
+        """Disponibiliza updates para o próximo getUpdates"""
+        with self._cond:
+            self._updates.extend(updates)
+            self._cond.notify_all()
+
+    def _next_message(self, params):
+        with self._lock:
+            self._message_id += 1
+            message_id = self._message_id
+        chat_id = params.get('chat_id', 0)
+        return {
+            'message_id': message_id,
+            'date': int(time.time()),
+            'chat': {'id': int(chat_id), 'type': 'supergroup', 'title': 'Bench'},
+            'from': BOT_USER,
+            'text': params.get('text', '')
+        }
+
+    def _get_updates(self, params):
+        offset = int(params.get('offset', 0) or 0)
+        limit = int(params.get('limit', 100) or 100)
+        timeout = min(float(params.get('timeout', 0) or 0), 1.0)
+        deadline = time.monotonic() + timeout
+
+        with self._cond:
+            while True:
+                self._updates = [u for u in self._updates if u['update_id'] >= offset]
+                if self._updates or time.monotonic() >= deadline:
+                    return self._updates[:limit]
+                self._cond.wait(deadline - time.monotonic())
+
+    def handle(self, method, params):
+        """Resultado da chamada `method` (no formato do campo `result` da Bot API)"""
+        with self._lock:
+            self.calls[method] = self.calls.get(method, 0) + 1
+            self.first_call_at.setdefault(method, time.monotonic())
+
+        if method == 'getUpdates':
+            return self._get_updates(params)
+        if self.latency:
+            time.sleep(self.latency)
+        if method == 'getMe':
+            return BOT_USER
+        if method in ('sendMessage', 'sendDocument', 'editMessageText'):
+            return self._next_message(params)
+        if method == 'setWebhook':
+            self.webhook_url = params.get('url')
+        if method == 'getWebhookInfo':
+            return {'url': '', 'has_custom_certificate': False, 'pending_update_count': 0}
+        return True
+
+    def _make_handler(self):
+        api = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                method = self.path.rsplit('/', 1)[-1]
+                length = int(self.headers.get('Content-Length', 0) or 0)
+                body = self.rfile.read(length) if length else b''
+                content_type = self.headers.get('Content-Type', '')
+
+                if 'application/json' in content_type and body:
+                    params = json.loads(body)
+                elif 'x-www-form-urlencoded' in content_type:
+                    params = {k: v[0] for k, v in parse_qs(body.decode()).items()}
+                else:
+                    # multipart (sendDocument): não precisamos do conteúdo
+                    params = {}
+
+                payload = json.dumps({'ok': True, 'result': api.handle(method, params)}).encode()
+                try:
+                    self.send_response(200)
+                    self.send_header('Content-Type', 'application/json')
+                    self.send_header('Content-Length', str(len(payload)))
+                    self.end_headers()
+                    self.wfile.write(payload)
+                except (BrokenPipeError, ConnectionResetError):
+                    # Cliente desistiu (ex.: getUpdates cancelado no desligamento)
+                    pass
+
+            do_GET = do_POST
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
@@ -0,0 +1,387 @@
+"""Benchmark offline dos handlers do AugeTradersBot.
+
+Roda o bot contra uma Bot API falsa local (sem rede), injeta fluxos de
+updates sintéticos e mede vazão, latência dos handlers e tempo de banco,
+nos modos polling e webhook (`setup_flask_webhook`).
+
+Cenários:
+- text_flood: rajada de mensagens de texto (handle_message)
+- join_burst: rajada de entradas no grupo (welcome_new_member)
+- stats_under_load: /stats de admin intercalado com mensagens de texto
+- scheduled_sends: lembretes de reunião agendados (send_scheduled_meeting_message)
+
+Uso:
+    python bench/run_bench.py --mode both --output bench_results.json
+    python bench/run_bench.py --compare bench_results.json
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import sys
+import tempfile
+import threading
+import time
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from fake_bot_api import FakeBotAPI  # noqa: E402
+
+MAIN_CHAT_ID = -1001000000001
+DUVIDAS_CHAT_ID = -1001000000002
+ADMIN_ID = 1000
+
+
+def percentile(values, pct):
+    """Percentil por posição (nearest-rank) de uma lista de números"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = max(0, min(len(ordered) - 1, int(round(pct / 100 * len(ordered) + 0.5)) - 1))
+    return ordered[index]
+
+
+def summarize(latencies):
+    """Resumo em milissegundos de uma lista de latências em segundos"""
+    return {
+        'count': len(latencies),
+        'mean_ms': round(sum(latencies) / len(latencies) * 1000, 3) if latencies else 0.0,
+        'p50_ms': round(percentile(latencies, 50) * 1000, 3),
+        'p95_ms': round(percentile(latencies, 95) * 1000, 3),
+        'p99_ms': round(percentile(latencies, 99) * 1000, 3)
+    }
+
+
+class Recorder:
+    """Coleta latências por handler e tempo gasto com o banco"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.handlers = {}
+            self.db_times = []
+
+    @property
+    def processed(self):
+        return sum(len(latencies) for latencies in self.handlers.values())
+
+    def record(self, name, seconds):
+        with self._lock:
+            self.handlers.setdefault(name, []).append(seconds)
+
+    def record_db(self, seconds):
+        with self._lock:
+            self.db_times.append(seconds)
+
+
+def instrument(bot, application, recorder):
+    """Envolve os handlers e o acesso ao banco com medição de tempo"""
+    for handler in application.handlers[0]:
+        callback = handler.callback
+        name = getattr(callback, '__name__', repr(callback))
+
+        async def timed(update, context, _callback=callback, _name=name):
+            start = time.perf_counter()
+            try:
+                return await _callback(update, context)
+            finally:
+                recorder.record(_name, time.perf_counter() - start)
+
+        handler.callback = timed
+
+    observer = bot.db.observer
+
+    def observe_db(operation, seconds):
+        recorder.record_db(seconds)
+        if observer:
+            observer(operation, seconds)
+
+    bot.db.observer = observe_db
+
+
+class UpdateFactory:
+    """Gera updates sintéticos no formato JSON da Bot API"""
+
+    def __init__(self):
+        self.update_id = 0
+        self.message_id = 0
+
+    def _message(self, user_id, chat_id, **fields):
+        self.update_id += 1
+        self.message_id += 1
+        message = {
+            'message_id': self.message_id,
+            'date': int(time.time()),
+            'chat': {'id': chat_id, 'type': 'supergroup', 'title': 'Auge'},
+            'from': {'id': user_id, 'is_bot': False, 'first_name': f'Trader{user_id}', 'username': f'trader{user_id}'}
+        }
+        message.update(fields)
+        return {'update_id': self.update_id, 'message': message}
+
+    def text(self, user_id, chat_id, text):
+        return self._message(user_id, chat_id, text=text)
+
+    def command(self, user_id, chat_id, command):
+        return self._message(
+            user_id, chat_id, text=command,
+            entities=[{'type': 'bot_command', 'offset': 0, 'length': len(command.split()[0])}]
+        )
+
+    def join(self, chat_id, member_id):
+        member = {'id': member_id, 'is_bot': False, 'first_name': f'Novo{member_id}'}
+        return self._message(member_id, chat_id, new_chat_members=[member])
+
+
+def build_scenarios(args, factory):
+    """Lista de (nome, updates) para cada cenário baseado em updates"""
+    text_flood = [
+        factory.text(2000 + i % args.users, MAIN_CHAT_ID, f'mensagem de teste {i} sobre o setup do dia')
+        for i in range(args.messages)
+    ]
+
+    join_burst = [factory.join(MAIN_CHAT_ID, 500000 + i) for i in range(args.joins)]
+
+    stats_under_load = []
+    for i in range(args.messages):
+        stats_under_load.append(factory.text(2000 + i % args.users, MAIN_CHAT_ID, f'mensagem {i}'))
+        if i % max(1, args.messages // args.stats) == 0:
+            stats_under_load.append(factory.command(ADMIN_ID, MAIN_CHAT_ID, '/stats'))
+
+    return [
+        ('text_flood', text_flood),
+        ('join_burst', join_burst),
+        ('stats_under_load', stats_under_load)
+    ]
+
+
+def scenario_result(recorder, total, seconds):
+    return {
+        'updates': total,
+        'seconds': round(seconds, 4),
+        'updates_per_sec': round(total / seconds, 2) if seconds else 0.0,
+        'latency': summarize([lat for lats in recorder.handlers.values() for lat in lats]),
+        'handlers': {name: summarize(lats) for name, lats in recorder.handlers.items()},
+        'db': {
+            'operations': len(recorder.db_times),
+            'total_ms': round(sum(recorder.db_times) * 1000, 3),
+            'mean_ms': round(sum(recorder.db_times) / len(recorder.db_times) * 1000, 3) if recorder.db_times else 0.0
+        }
+    }
+
+
+def new_bot(bot_module):
+    """Instancia o bot em um diretório temporário (banco limpo)"""
+    os.chdir(tempfile.mkdtemp(prefix='auge-bench-'))
+    return bot_module.AugeTradersBot()
+
+
+async def wait_processed(recorder, target, timeout):
+    deadline = time.monotonic() + timeout
+    while recorder.processed < target and time.monotonic() < deadline:
+        await asyncio.sleep(0.005)
+
+
+async def run_scheduled(bot, application, runs):
+    """Dispara `runs` lembretes agendados e mede cada execução"""
+    from telegram.ext import CallbackContext
+
+    await bot.save_meeting_config_async('https://meet.example.com/bench', '01/01/2030', '20:00')
+    context = CallbackContext(application)
+    latencies = []
+
+    async def one():
+        start = time.perf_counter()
+        await bot.send_scheduled_meeting_message(context)
+        latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(one() for _ in range(runs)))
+    return latencies, time.perf_counter() - start
+
+
+async def bench_polling(bot_module, api, args):
+    """Cenários no modo polling (getUpdates na Bot API falsa)"""
+    bot = new_bot(bot_module)
+    application = bot.build_application(webhook=False)
+    recorder = Recorder()
+    instrument(bot, application, recorder)
+
+    await application.initialize()
+    await application.updater.start_polling(poll_interval=0, timeout=1, drop_pending_updates=False)
+    await application.start()
+
+    results = {}
+    factory = UpdateFactory()
+    try:
+        for name, updates in build_scenarios(args, factory):
+            recorder.reset()
+            start = time.perf_counter()
+            api.push_updates(updates)
+            await wait_processed(recorder, len(updates), args.timeout)
+            results[name] = scenario_result(recorder, len(updates), time.perf_counter() - start)
+
+        recorder.reset()
+        latencies, seconds = await run_scheduled(bot, application, args.scheduled)
+        recorder.handlers['send_scheduled_meeting_message'] = latencies
+        results['scheduled_sends'] = scenario_result(recorder, len(latencies), seconds)
+    finally:
+        await application.updater.stop()
+        await application.stop()
+        await application.post_stop(application)
+        await application.shutdown()
+        await application.post_shutdown(application)
+    return results
+
+
+def bench_webhook(bot_module, api, args):
+    """Cenários no modo webhook (POSTs HTTP reais no Flask de setup_flask_webhook)"""
+    from werkzeug.serving import make_server
+
+    bot = new_bot(bot_module)
+    application = bot.build_application(webhook=True)
+    bot.setup_flask_webhook(application)
+    recorder = Recorder()
+    instrument(bot, application, recorder)
+
+    loop = bot.webhook_loop
+    threading.Thread(target=loop.run_forever, name='webhook-loop', daemon=True).start()
+
+    async def start():
+        await application.initialize()
+        await application.start()
+
+    asyncio.run_coroutine_threadsafe(start(), loop).result()
+
+    server = make_server('127.0.0.1', 0, bot.flask_app, threaded=True)
+    threading.Thread(target=server.serve_forever, name='bench-flask', daemon=True).start()
+    url = f'http://127.0.0.1:{server.server_port}/{bot_module.BOT_TOKEN}'
+
+    def post(update):
+        request = urllib.request.Request(
+            url, data=json.dumps(update).encode(), headers={'Content-Type': 'application/json'}
+        )
+        if bot_module.WEBHOOK_SECRET:
+            request.add_header('X-Telegram-Bot-Api-Secret-Token', bot_module.WEBHOOK_SECRET)
+        start = time.perf_counter()
+        urllib.request.urlopen(request).read()
+        return time.perf_counter() - start
+
+    results = {}
+    factory = UpdateFactory()
+    try:
+        with ThreadPoolExecutor(max_workers=args.webhook_clients) as pool:
+            for name, updates in build_scenarios(args, factory):
+                recorder.reset()
+                start = time.perf_counter()
+                http_latencies = list(pool.map(post, updates))
+                asyncio.run_coroutine_threadsafe(
+                    wait_processed(recorder, len(updates), args.timeout), loop
+                ).result()
+                results[name] = scenario_result(recorder, len(updates), time.perf_counter() - start)
+                results[name]['webhook_response'] = summarize(http_latencies)
+
+        recorder.reset()
+        latencies, seconds = asyncio.run_coroutine_threadsafe(
+            run_scheduled(bot, application, args.scheduled), loop
+        ).result()
+        recorder.handlers['send_scheduled_meeting_message'] = latencies
+        results['scheduled_sends'] = scenario_result(recorder, len(latencies), seconds)
+    finally:
+        server.shutdown()
+        bot.stop_webhook_application(application)
+    return results
+
+
+def compare(current, baseline):
+    """Imprime a variação de vazão e p95 em relação a um resultado anterior"""
+    print(f"{'modo/cenário':<32} {'upd/s':>10} {'Δ':>8} {'p95 ms':>10} {'Δ':>8}")
+    for mode, scenarios in current['results'].items():
+        for name, result in scenarios.items():
+            old = baseline.get('results', {}).get(mode, {}).get(name)
+            ups, p95 = result['updates_per_sec'], result['latency']['p95_ms']
+            if old:
+                d_ups = (ups / old['updates_per_sec'] - 1) * 100 if old['updates_per_sec'] else 0.0
+                d_p95 = (p95 / old['latency']['p95_ms'] - 1) * 100 if old['latency']['p95_ms'] else 0.0
+                print(f"{mode + '/' + name:<32} {ups:>10.1f} {d_ups:>+7.1f}% {p95:>10.3f} {d_p95:>+7.1f}%")
+            else:
+                print(f"{mode + '/' + name:<32} {ups:>10.1f} {'-':>8} {p95:>10.3f} {'-':>8}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark offline do bot Auge Traders')
+    parser.add_argument('--mode', choices=['polling', 'webhook', 'both'], default='both')
+    parser.add_argument('--messages', type=int, default=2000, help='mensagens de texto por cenário')
+    parser.add_argument('--users', type=int, default=200, help='usuários distintos enviando mensagens')
+    parser.add_argument('--joins', type=int, default=200, help='entradas no cenário join_burst')
+    parser.add_argument('--stats', type=int, default=20, help='/stats no cenário stats_under_load')
+    parser.add_argument('--scheduled', type=int, default=3, help='execuções do lembrete agendado (acima de 3 o limite por chat entra em ação)')
+    parser.add_argument('--api-latency', type=float, default=0.005, help='latência simulada da Bot API (s)')
+    parser.add_argument('--webhook-clients', type=int, default=8, help='POSTs simultâneos no modo webhook')
+    parser.add_argument('--timeout', type=float, default=120, help='tempo máximo por cenário (s)')
+    parser.add_argument('--output', default='bench_results.json', help='arquivo JSON com os resultados')
+    parser.add_argument('--compare', help='JSON de uma execução anterior para comparar')
+    parser.add_argument('--log-level', default='WARNING')
+    args = parser.parse_args()
+
+    # Caminhos relativos ao diretório atual (cada cenário roda em um diretório temporário)
+    output = os.path.abspath(args.output)
+    baseline = os.path.abspath(args.compare) if args.compare else None
+
+    api = FakeBotAPI(latency=args.api_latency).start()
+
+    # Configuração do bot antes de importá-lo (bot.py lê o ambiente no import)
+    os.environ.update({
+        'BOT_TOKEN': '123456:BENCHMARK',
+        'GROUP_CHAT_ID': str(MAIN_CHAT_ID),
+        'DUVIDAS_GROUP_CHAT_ID': str(DUVIDAS_CHAT_ID),
+        'ADMIN_IDS': str(ADMIN_ID),
+        'DUVIDAS_GROUP_LINK': 'https://t.me/+bench',
+        'MENTORIA_LINK': 'https://example.com/mentoria',
+        'TELEGRAM_API_BASE_URL': api.base_url,
+        'MESSAGE_RETENTION_DAYS': '0'
+    })
+    import bot as bot_module
+    bot_module.start_logging()
+
+    logging.getLogger().setLevel(args.log_level)
+    logging.getLogger('werkzeug').setLevel(logging.WARNING)
+
+    started_at = time.strftime('%Y-%m-%dT%H:%M:%S')
+    results = {}
+    try:
+        if args.mode in ('polling', 'both'):
+            results['polling'] = asyncio.run(bench_polling(bot_module, api, args))
+        if args.mode in ('webhook', 'both'):
+            results['webhook'] = bench_webhook(bot_module, api, args)
+    finally:
+        api.stop()
+
+    report = {
+        'started_at': started_at,
+        'python': sys.version.split()[0],
+        'params': {k: v for k, v in vars(args).items() if k not in ('output', 'compare')},
+        'api_calls': api.calls,
+        'results': results
+    }
+
+    with open(output, 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=2, ensure_ascii=False)
+    print(f"Resultados salvos em {output}")
+
+    if baseline:
+        with open(baseline, encoding='utf-8') as f:
+            compare(report, json.load(f))
+    else:
+        compare(report, {})
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,134 @@
+"""Mede o tempo até o primeiro update ser atendido após iniciar o bot.
+
+Sobe `python bot.py` como um processo novo, apontado para a Bot API falsa
+local, e cronometra a partir do spawn:
+
+- polling: até o primeiro getUpdates e até a resposta ao /start injetado
+- webhook: até o setWebhook e até a resposta ao /start enviado por POST
+
+Ao final mostra a mediana das execuções e as fases registradas pelo bot
+("Inicialização: ...") na última delas.
+
+Uso:
+    python bench/startup_time.py --mode both --runs 5
+"""
+import argparse
+import json
+import os
+import signal
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from fake_bot_api import FakeBotAPI  # noqa: E402
+from run_bench import ADMIN_ID, DUVIDAS_CHAT_ID, MAIN_CHAT_ID, UpdateFactory  # noqa: E402
+
+BOT_TOKEN = '123456:STARTUP'
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def wait_for(predicate, timeout):
+    deadline = time.monotonic() + timeout
+    while not predicate():
+        if time.monotonic() > deadline:
+            raise TimeoutError
+        time.sleep(0.005)
+
+
+def post_update(url, update):
+    request = urllib.request.Request(
+        url, data=json.dumps(update).encode(), headers={'Content-Type': 'application/json'}
+    )
+    urllib.request.urlopen(request, timeout=5).read()
+
+
+def run_once(mode, timeout):
+    """Inicia o bot uma vez; retorna (tempos em segundos, linhas de fase do log)"""
+    api = FakeBotAPI().start()
+    workdir = tempfile.mkdtemp(prefix='auge-startup-')
+    env = dict(
+        os.environ,
+        BOT_TOKEN=BOT_TOKEN,
+        GROUP_CHAT_ID=str(MAIN_CHAT_ID),
+        DUVIDAS_GROUP_CHAT_ID=str(DUVIDAS_CHAT_ID),
+        ADMIN_IDS=str(ADMIN_ID),
+        TELEGRAM_API_BASE_URL=api.base_url,
+        ENVIRONMENT='production' if mode == 'webhook' else 'development'
+    )
+    if mode == 'webhook':
+        port = free_port()
+        env.update(PORT=str(port), WEBHOOK_URL=f'http://127.0.0.1:{port}')
+
+    log_path = os.path.join(workdir, 'bot.log')
+    update = UpdateFactory().command(ADMIN_ID, MAIN_CHAT_ID, '/start')
+    with open(log_path, 'w') as log:
+        spawned = time.monotonic()
+        process = subprocess.Popen(
+            [sys.executable, os.path.join(ROOT, 'bot.py')],
+            cwd=workdir, env=env, stdout=log, stderr=subprocess.STDOUT
+        )
+
+    timings = {}
+    try:
+        if mode == 'webhook':
+            wait_for(lambda: api.webhook_url, timeout)
+            timings['webhook_registered'] = api.first_call_at['setWebhook'] - spawned
+            post_update(api.webhook_url, update)
+        else:
+            wait_for(lambda: 'getUpdates' in api.first_call_at, timeout)
+            timings['first_get_updates'] = api.first_call_at['getUpdates'] - spawned
+            api.push_updates([update])
+
+        wait_for(lambda: 'sendMessage' in api.first_call_at, timeout)
+        timings['first_reply'] = api.first_call_at['sendMessage'] - spawned
+    finally:
+        process.send_signal(signal.SIGTERM)
+        try:
+            process.wait(timeout=15)
+        except subprocess.TimeoutExpired:
+            process.kill()
+        api.stop()
+
+    with open(log_path, encoding='utf-8', errors='replace') as log:
+        phases = [line.rstrip() for line in log if 'Inicialização:' in line]
+    return timings, phases
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--mode', choices=['polling', 'webhook', 'both'], default='both')
+    parser.add_argument('--runs', type=int, default=3)
+    parser.add_argument('--timeout', type=float, default=60, help='tempo máximo por etapa (s)')
+    args = parser.parse_args()
+
+    modes = ['polling', 'webhook'] if args.mode == 'both' else [args.mode]
+    for mode in modes:
+        samples = {}
+        phases = []
+        for _ in range(args.runs):
+            timings, phases = run_once(mode, args.timeout)
+            for name, value in timings.items():
+                samples.setdefault(name, []).append(value)
+
+        print(f"\n[{mode}] mediana de {args.runs} execuções")
+        for name, values in samples.items():
+            print(f"  {name:<20} {statistics.median(values) * 1000:8.1f} ms")
+        print("  fases da última execução:")
+        for line in phases:
+            print(f"    {line.split('Inicialização: ', 1)[1]}")
+
+
+if __name__ == '__main__':
+    main()
@@ -1,27 +1,80 @@
+import time
+BOOT_STARTED = time.monotonic()  # Referência para medir as fases da inicialização
 import os
 import logging
-import sqlite3
 from datetime import datetime, time as dt_time
-import time
 import asyncio
+import tempfile
+import html
+import functools
+import random
+import atexit
+import signal
+import sys
 import pytz
-from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
-from telegram.ext import Application, CommandHandler, MessageHandler, filters, ContextTypes, JobQueue
+from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup, ChatPermissions
+from telegram.ext import Application, CommandHandler, CallbackQueryHandler, MessageHandler, TypeHandler, filters, ContextTypes, JobQueue
 from telegram.error import NetworkError, TimedOut, Conflict
+from telegram.request import HTTPXRequest
+from apscheduler.jobstores.base import JobLookupError
 from dotenv import load_dotenv
-from flask import Flask, request
 import threading
+from database import Database, AsyncDatabase, UPSERT_USER_SQL
+from user_cache import UserCache
+from broadcast import SendLimiter
+from outbox import Outbox, create_outbox_tables
+from message_templates import TemplateRegistry
+from join_aggregator import JoinBurstAggregator
+from retention import SQL_FUNCTIONS, create_archive_tables, archive_batch
+from rollups import create_rollup_tables, needs_backfill, backfill_rollups, read_stats
+from analytics import create_analytics_tables, backfill_analytics, read_ranking, read_activity
+from write_buffer import WriteBehindBuffer
+from metrics import BotMetrics, MetricsRequest, MetricsServer, CONTENT_TYPE as METRICS_CONTENT_TYPE, authorized as metrics_authorized
+from profiling import SlowUpdateTracer, StartupTimer, record_db_time, profile_loop
+from leader import create_lease_tables, SqliteLeaseBackend, FileLeaseBackend, LeaderElector, JobRunLog
+from antiflood import FloodGuard, FloodLimits, parse_group_limits
+from dedup import UpdateDeduplicator, create_dedup_tables, sync_watermark
+from admission import PriorityUpdateProcessor, PRIORITIES
+from scheduler import (
+    CronExpression, PostScheduler, create_schedule_tables, load_posts, posts_fingerprint,
+    insert_post, delete_post, mark_post_run
+)
+from logging_setup import setup_logging, parse_levels, HOT
+from exporter import (
+    ExportFilters, create_export_tables, export as export_table, state_key,
+    get_last_exported_id, set_last_exported_id
+)
+from search import (
+    HIGHLIGHT_START, HIGHLIGHT_END, SearchPage, SearchSessions,
+    create_search_tables, rebuild_search_index, build_match_query, latest_match, search_page
+)
 
 # Carregar variáveis de ambiente
 load_dotenv()
 
-# Configurar logging
-logging.basicConfig(
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    level=logging.INFO
-)
+# Logging (gravação em thread própria, iniciada em main(); ver logging_setup.py)
+LOG_LEVEL = os.getenv('LOG_LEVEL', 'INFO')
+LOG_LEVELS = os.getenv('LOG_LEVELS', 'httpx=WARNING,apscheduler=WARNING')  # Níveis por componente
+LOG_FORMAT = os.getenv('LOG_FORMAT', 'json' if os.getenv('ENVIRONMENT') == 'production' else 'text')
+LOG_HOT_SAMPLE = float(os.getenv('LOG_HOT_SAMPLE', 1.0))  # Fração das linhas por update mantidas
+LOG_HOT_RATE = int(os.getenv('LOG_HOT_RATE', 50))  # Máximo de linhas por update a cada segundo (0 = sem limite)
+log_listener = None  # QueueListener criado por start_logging()
 logger = logging.getLogger(__name__)
 
+
+def start_logging():
+    """Configura o logging raiz e inicia a thread que grava as linhas (uma vez por processo)"""
+    global log_listener
+    if log_listener is None:
+        log_listener = setup_logging(
+            level=LOG_LEVEL,
+            component_levels=parse_levels(LOG_LEVELS),
+            fmt=LOG_FORMAT,
+            hot_sample=LOG_HOT_SAMPLE,
+            hot_rate=LOG_HOT_RATE
+        )
+    return log_listener
+
 # Configurações do bot
 BOT_TOKEN = os.getenv('BOT_TOKEN')
 GROUP_CHAT_ID = int(os.getenv('GROUP_CHAT_ID', '').strip().replace('=', ''))
@@ -30,24 +83,215 @@ ADMIN_IDS = [int(id.strip()) for id in os.getenv('ADMIN_IDS', '').split(',') if
 DUVIDAS_GROUP_LINK = os.getenv('DUVIDAS_GROUP_LINK')
 MENTORIA_LINK = os.getenv('MENTORIA_LINK')
 
+# Arquivo opcional (.json ou .md) com templates que substituem/complementam os padrões
+TEMPLATES_FILE = os.getenv('TEMPLATES_FILE', '')
+
+# Chats que recebem as mensagens predefinidas (padrão: apenas o grupo principal)
+BROADCAST_CHAT_IDS = [int(id.strip()) for id in os.getenv('BROADCAST_CHAT_IDS', '').split(',') if id.strip()] or [GROUP_CHAT_ID]
+BROADCAST_RATE = float(os.getenv('BROADCAST_RATE', 25))  # mensagens/segundo no total
+BROADCAST_PER_CHAT_PER_MINUTE = int(os.getenv('BROADCAST_PER_CHAT_PER_MINUTE', 20))
+BROADCAST_CONCURRENCY = int(os.getenv('BROADCAST_CONCURRENCY', 10))  # envios simultâneos da fila de envios
+BROADCAST_REPORT_TIMEOUT = float(os.getenv('BROADCAST_REPORT_TIMEOUT', 600))  # segundos acompanhando o resultado para o admin
+
+# Fila de envios (outbox): tentativas por mensagem e espera entre elas (s, dobra a cada falha)
+OUTBOX_MAX_ATTEMPTS = int(os.getenv('OUTBOX_MAX_ATTEMPTS', 5))
+OUTBOX_RETRY_BASE = float(os.getenv('OUTBOX_RETRY_BASE', 2))
+OUTBOX_RETRY_MAX = float(os.getenv('OUTBOX_RETRY_MAX', 300))
+OUTBOX_FAILED_RETENTION_DAYS = float(os.getenv('OUTBOX_FAILED_RETENTION_DAYS', 7))  # envios com falha guardados para consulta
+
 # Configurações do Railway
 PORT = int(os.getenv('PORT', 8000))
 WEBHOOK_URL = os.getenv('WEBHOOK_URL', '')
+WEBHOOK_SECRET = os.getenv('WEBHOOK_SECRET', '')  # Validado no header X-Telegram-Bot-Api-Secret-Token
+TELEGRAM_API_BASE_URL = os.getenv('TELEGRAM_API_BASE_URL', '')  # Servidor Bot API alternativo (ex.: benchmarks)
 ENVIRONMENT = os.getenv('ENVIRONMENT', 'development')  # 'production' para Railway
 
+# Boas-vindas coletivas em rajadas de entrada
+JOIN_BURST_WINDOW = float(os.getenv('JOIN_BURST_WINDOW', 10))  # segundos acumulando membros
+JOIN_BURST_THRESHOLD = int(os.getenv('JOIN_BURST_THRESHOLD', 3))  # entradas toleradas por janela
+JOIN_BURST_RATE_WINDOW = float(os.getenv('JOIN_BURST_RATE_WINDOW', 60))  # janela de medição (segundos)
+JOIN_BURST_MAX_MENTIONS = int(os.getenv('JOIN_BURST_MAX_MENTIONS', 30))
+
+# Configurações do banco de dados
+DB_POOL_SIZE = int(os.getenv('DB_POOL_SIZE', 4))
+DB_READ_WORKERS = int(os.getenv('DB_READ_WORKERS', 2))
+USER_CACHE_SIZE = int(os.getenv('USER_CACHE_SIZE', 10000))
+
+# Retenção de mensagens: mais antigas que isso vão para o arquivo compactado (0 desativa)
+MESSAGE_RETENTION_DAYS = int(os.getenv('MESSAGE_RETENTION_DAYS', 90))
+RETENTION_INTERVAL_HOURS = float(os.getenv('RETENTION_INTERVAL_HOURS', 6))
+RETENTION_BATCH_SIZE = int(os.getenv('RETENTION_BATCH_SIZE', 5000))
+
+# Descarte de updates repetidos: ids recentes em memória e intervalo de gravação da marca d'água (s)
+DEDUP_CAPACITY = int(os.getenv('DEDUP_CAPACITY', 10000))
+DEDUP_SYNC_SECONDS = float(os.getenv('DEDUP_SYNC_SECONDS', 5))
+
+# Admissão de updates: processados ao mesmo tempo, máximo aguardando, fila a partir da qual
+# mensagens comuns só são registradas (sem handlers) e fração delas registrada nesse caso
+UPDATE_CONCURRENCY = int(os.getenv('UPDATE_CONCURRENCY', 8))
+UPDATE_QUEUE_SIZE = int(os.getenv('UPDATE_QUEUE_SIZE', 1000))
+UPDATE_SHED_DEPTH = int(os.getenv('UPDATE_SHED_DEPTH', 200))
+UPDATE_SHED_SAMPLE = float(os.getenv('UPDATE_SHED_SAMPLE', 1.0))
+
+# Antiflood: mais de N mensagens na janela (s) ou mais de N textos iguais seguidos não são registrados;
+# silêncio aplicado ao autor (s, 0 = só deixa de registrar) e limites por grupo
+# ('chat:mensagens:janela:repetições:silêncio', separados por vírgula; campos vazios usam o padrão)
+FLOOD_LIMITS = FloodLimits(
+    max_messages=int(os.getenv('FLOOD_MAX_MESSAGES', 10)),
+    window=float(os.getenv('FLOOD_WINDOW', 10)),
+    max_repeats=int(os.getenv('FLOOD_MAX_REPEATS', 3)),
+    mute_seconds=int(os.getenv('FLOOD_MUTE_SECONDS', 0))
+)
+FLOOD_GROUP_LIMITS = parse_group_limits(os.getenv('FLOOD_GROUP_LIMITS', ''), FLOOD_LIMITS)
+FLOOD_MAX_TRACKED = int(os.getenv('FLOOD_MAX_TRACKED', 50000))  # pares (chat, usuário) em memória
+
+# Envios agendados (/agendar): horários perdidos há menos que isso (s) são enviados ao voltar
+SCHEDULE_MISFIRE_GRACE = int(os.getenv('SCHEDULE_MISFIRE_GRACE', 3600))
+
+# Busca de mensagens (/buscar)
+SEARCH_PAGE_SIZE = int(os.getenv('SEARCH_PAGE_SIZE', 5))
+
+# Engajamento (/ranking)
+RANKING_SIZE = int(os.getenv('RANKING_SIZE', 10))
+
+# Limite de upload de documentos da Bot API (50 MB)
+EXPORT_MAX_UPLOAD_BYTES = int(os.getenv('EXPORT_MAX_UPLOAD_BYTES', 50 * 1024 * 1024))
+
+# Configurações do buffer de escrita (mensagens e usuários)
+WRITE_BUFFER_MAX_BATCH = int(os.getenv('WRITE_BUFFER_MAX_BATCH', 200))
+WRITE_BUFFER_FLUSH_INTERVAL = float(os.getenv('WRITE_BUFFER_FLUSH_INTERVAL', 1.0))
+WRITE_BUFFER_MAX_RETRIES = int(os.getenv('WRITE_BUFFER_MAX_RETRIES', 5))  # Falhas seguidas antes de descartar o lote
+WRITE_BUFFER_MAX_PENDING = int(os.getenv('WRITE_BUFFER_MAX_PENDING', 50000))  # Registros na fila antes de descartar os mais antigos
+
+# Métricas Prometheus (no webhook o /metrics do Flask só responde com METRICS_TOKEN definido)
+METRICS_PORT = int(os.getenv('METRICS_PORT', 0))  # Porta própria para o /metrics (0 desativa)
+METRICS_TOKEN = os.getenv('METRICS_TOKEN', '')  # Exigido como 'Authorization: Bearer <token>'
+
+# Diagnóstico de lentidão
+SLOW_UPDATE_SECONDS = float(os.getenv('SLOW_UPDATE_SECONDS', 2.0))  # Updates acima disso vão para o log
+PROFILE_MAX_SECONDS = int(os.getenv('PROFILE_MAX_SECONDS', 300))  # Duração máxima do /profile
+
+# Jobs agendados com várias réplicas: só a instância com o lease executa
+LEADER_BACKEND = os.getenv('LEADER_BACKEND', 'sqlite')  # 'sqlite' (banco compartilhado) ou 'file' (flock)
+LEADER_LEASE_SECONDS = float(os.getenv('LEADER_LEASE_SECONDS', 30))
+LEADER_LOCK_DIR = os.getenv('LEADER_LOCK_DIR', './data/locks')
+INSTANCE_ID = os.getenv('INSTANCE_ID', '')  # Padrão: host:pid:aleatório
+
 class AugeTradersBot:
     def __init__(self):
+        self.startup = StartupTimer(BOOT_STARTED)
+        self.startup.mark("módulos importados")
+        self._first_update_seen = False
         self.db_path = './data/bot.db'
+        os.makedirs('./data', exist_ok=True)
+        self.metrics = BotMetrics()
+        self.tracer = SlowUpdateTracer(threshold=SLOW_UPDATE_SECONDS)
+        self._profiling = False
+        self.db = Database(
+            self.db_path,
+            pool_size=DB_POOL_SIZE,
+            functions=SQL_FUNCTIONS,
+            observer=self.observe_db
+        )
+        self.async_db = AsyncDatabase(read_workers=DB_READ_WORKERS)
+        self.user_cache = UserCache(max_size=USER_CACHE_SIZE)
         self.init_database()
+        self.startup.mark("banco de dados pronto")
+        self._meeting_cache = (None, None)
+        self.refresh_meeting_cache()
         self.timezone = pytz.timezone('America/Sao_Paulo')
+        if LEADER_BACKEND == 'file':
+            lease_backend = FileLeaseBackend(LEADER_LOCK_DIR)
+        else:
+            lease_backend = SqliteLeaseBackend(self.db)
+        self.leader = LeaderElector(lease_backend, name='scheduler', holder=INSTANCE_ID or None, ttl=LEADER_LEASE_SECONDS)
+        self.job_runs = JobRunLog(self.db)
+        self.search_sessions = SearchSessions()
+        self.dedup = UpdateDeduplicator(capacity=DEDUP_CAPACITY)
+        self.flood_guard = FloodGuard(FLOOD_LIMITS, FLOOD_GROUP_LIMITS, max_tracked=FLOOD_MAX_TRACKED)
+        # Criado em build_application, no event loop que vai processar os updates
+        self.update_processor = None
+        self.post_scheduler = PostScheduler(misfire_grace=SCHEDULE_MISFIRE_GRACE)
+        self._post_timer = None
+        self._posts_fingerprint = None
         self.messages = self.load_predefined_messages()
+        self.templates = TemplateRegistry(
+            self.messages,
+            links={'mentoria_link': MENTORIA_LINK, 'duvidas_link': DUVIDAS_GROUP_LINK},
+            keyboards=self.load_template_keyboards(),
+            source_path=TEMPLATES_FILE or None
+        )
+        self.join_aggregator = JoinBurstAggregator(
+            self.send_join_batch,
+            window=JOIN_BURST_WINDOW,
+            burst_threshold=JOIN_BURST_THRESHOLD,
+            rate_window=JOIN_BURST_RATE_WINDOW
+        )
+        self.send_limiter = SendLimiter(
+            global_rate=BROADCAST_RATE,
+            per_chat_per_minute=BROADCAST_PER_CHAT_PER_MINUTE
+        )
+        self.outbox = Outbox(
+            self.db,
+            self.async_db,
+            self.send_limiter,
+            workers=BROADCAST_CONCURRENCY,
+            max_attempts=OUTBOX_MAX_ATTEMPTS,
+            base_delay=OUTBOX_RETRY_BASE,
+            max_delay=OUTBOX_RETRY_MAX
+        )
+        self.write_buffer = WriteBehindBuffer(
+            self.db,
+            max_batch=WRITE_BUFFER_MAX_BATCH,
+            flush_interval=WRITE_BUFFER_FLUSH_INTERVAL,
+            async_db=self.async_db,
+            max_retries=WRITE_BUFFER_MAX_RETRIES,
+            max_pending=WRITE_BUFFER_MAX_PENDING,
+            on_drop=self.write_buffer_dropped
+        )
+        self.metrics.queue_depth.set_function(lambda: self.write_buffer.depth, 'write_buffer')
+        self.metrics.queue_depth.set_function(lambda: self.join_aggregator.pending_count, 'join_welcomes')
+        self.metrics.queue_depth.set_function(lambda: self.outbox.inflight, 'outbox_sending')
+        self.metrics.cache_hit_ratio.set_function(lambda: self.user_cache.hit_rate)
+        if log_listener is not None:
+            self.metrics.queue_depth.set_function(log_listener.queue.qsize, 'logs')
+        # Garantir que nada fique na fila ao encerrar o processo
+        # (atexit executa em ordem inversa: o buffer esvazia antes de fechar o banco)
+        atexit.register(self.db.close)
+        atexit.register(self.async_db.close)
+        atexit.register(self.write_buffer.close)
+        self.startup.mark("bot criado")
+    
+    def observe_db(self, operation, seconds):
+        """Observador do banco: alimenta as métricas e o rastreamento do update atual"""
+        self.metrics.observe_db(operation, seconds)
+        record_db_time(seconds)
     
     def init_database(self):
         """Inicializa o banco de dados SQLite"""
-        os.makedirs('./data', exist_ok=True)
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        
+        with self.db.transaction() as conn:
+            self._create_tables(conn.cursor())
+            create_archive_tables(conn.cursor())
+            create_rollup_tables(conn.cursor())
+            create_lease_tables(conn.cursor())
+            create_export_tables(conn.cursor())
+            create_schedule_tables(conn.cursor())
+            create_dedup_tables(conn.cursor())
+            create_outbox_tables(conn.cursor())
+            
+            # Índice de busca novo: indexar as mensagens já registradas
+            if create_search_tables(conn.cursor()):
+                rebuild_search_index(conn)
+            
+            # Primeira execução com agregados: calcular a partir do histórico
+            if needs_backfill(conn):
+                backfill_rollups(conn)
+            if create_analytics_tables(conn.cursor()):
+                backfill_analytics(conn)
+        logger.info("Banco de dados inicializado com sucesso")
+    
+    def _create_tables(self, cursor):
+        """Cria as tabelas do bot caso ainda não existam"""
         # Tabela de usuários
         cursor.execute('''
             CREATE TABLE IF NOT EXISTS users (
@@ -83,9 +327,11 @@ class AugeTradersBot:
             )
         ''')
         
-        conn.commit()
-        conn.close()
-        logger.info("Banco de dados inicializado com sucesso")
+        # Índice para localizar a reunião ativa mais recente sem ordenar a tabela
+        cursor.execute('''
+            CREATE INDEX IF NOT EXISTS idx_meetings_active_created
+            ON meetings (is_active, created_at)
+        ''')
     
     def load_predefined_messages(self):
         """Carrega mensagens prontas do sistema"""
@@ -231,52 +477,97 @@ Olá {name}! 👋
 
 🚀 **O sucesso** está mais próximo do que imagina!
 
-💪 **Auge Traders** - juntos somos imparáveis!"""
+💪 **Auge Traders** - juntos somos imparáveis!""",
+            
+            'start': """🎯 *Bem-vindo ao Bot Auge Traders!*
+
+Olá {name}! 👋
+
+Este é o bot oficial da comunidade Auge Traders. Aqui você encontrará:
+
+📊 Análises de mercado em tempo real
+💡 Dicas e estratégias de trading
+🎓 Conteúdo educacional exclusivo
+📈 Sinais e oportunidades
+
+🔗 *Links importantes:*
+[🔗 Grupo de Dúvidas]({duvidas_link})
+[🎯 Mentoria Auge Traders]({mentoria_link})
+
+👥 **Nossa equipe** está pronta para ajudar!
+
+Vamos juntos rumo ao sucesso! 🚀""",
+            
+            'welcome_duvidas': """🔗 *Bem-vindo ao Grupo de Dúvidas, {name}!*
+
+👋 Este é o espaço ideal para suas perguntas sobre trading!
+
+💡 Aqui você pode:
+• Tirar dúvidas sobre análises técnicas
+• Pedir ajuda com estratégias
+• Compartilhar experiências de trading
+• Aprender com a comunidade
+
+🎯 *Link da Mentoria:*
+[🎯 Mentoria Auge Traders]({mentoria_link})
+
+📋 *Dicas para melhor aproveitamento:*
+• Seja específico nas suas perguntas
+• Use prints/gráficos quando necessário
+• Respeite todos os membros
+• Mantenha o foco em aprendizado
+
+👥 **Nossa equipe** está pronta para ajudar!
+
+Vamos aprender juntos! 📚""",
+            
+            'welcome_generic': """👋 Olá {name}!
+
+Bem-vindo ao nosso grupo! 🎯
+
+[🔗 Grupo de Dúvidas]({duvidas_link})
+[🎯 Mentoria Auge Traders]({mentoria_link})
+
+👥 **Nossa equipe** está pronta para ajudar!"""
         }
     
-    def add_user(self, user_id, username=None, first_name=None, last_name=None):
-        """Adiciona ou atualiza usuário no banco"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        
-        cursor.execute('''
-            INSERT OR REPLACE INTO users (user_id, username, first_name, last_name)
-            VALUES (?, ?, ?, ?)
-        ''', (user_id, username, first_name, last_name))
-        
-        conn.commit()
-        conn.close()
+    def load_template_keyboards(self):
+        """Teclados inline de cada template: linhas de (texto do botão, nome do link)"""
+        both_links = [
+            [("📊 Grupo de Dúvidas", 'duvidas_link')],
+            [("🎯 Mentoria Day Trade", 'mentoria_link')]
+        ]
+        return {
+            'start': both_links,
+            'welcome_main': [[("🎯 Mentoria Day Trade", 'mentoria_link')]],
+            'welcome_duvidas': both_links,
+            'welcome_generic': both_links
+        }
     
-    def log_message(self, user_id, message_text, group_id):
-        """Registra mensagem no banco"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        
-        cursor.execute('''
-            INSERT INTO messages (user_id, message_text, group_id)
-            VALUES (?, ?, ?)
-        ''', (user_id, message_text, group_id))
-        
-        conn.commit()
-        conn.close()
+    def _write_user(self, user_id, username, first_name, last_name):
+        """Grava o usuário preservando a data de entrada original"""
+        try:
+            with self.db.transaction() as conn:
+                conn.execute(UPSERT_USER_SQL, (user_id, username, first_name, last_name))
+        except Exception:
+            self.user_cache.invalidate(user_id)
+            raise
     
     def save_meeting_config(self, link, date, time):
         """Salva configuração de reunião no banco de dados"""
         try:
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
-            
-            # Desativar reuniões anteriores
-            cursor.execute('UPDATE meetings SET is_active = 0')
-            
-            # Inserir nova configuração
-            cursor.execute('''
-                INSERT INTO meetings (meeting_link, meeting_date, meeting_time)
-                VALUES (?, ?, ?)
-            ''', (link, date, time))
+            with self.db.transaction() as conn:
+                # Desativar reuniões anteriores
+                conn.execute('UPDATE meetings SET is_active = 0 WHERE is_active = 1')
+                
+                # Inserir nova configuração
+                conn.execute('''
+                    INSERT INTO meetings (meeting_link, meeting_date, meeting_time)
+                    VALUES (?, ?, ?)
+                ''', (link, date, time))
             
-            conn.commit()
-            conn.close()
+            # Write-through: o cache passa a refletir a reunião recém-salva
+            self.set_meeting_cache({'link': link, 'date': date, 'time': time})
             return True
             
         except Exception as e:
@@ -286,19 +577,14 @@ Olá {name}! 👋
     def get_active_meeting(self):
         """Recupera a configuração ativa de reunião"""
         try:
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
-            
-            cursor.execute('''
-                SELECT meeting_link, meeting_date, meeting_time 
-                FROM meetings 
-                WHERE is_active = 1 
-                ORDER BY created_at DESC 
-                LIMIT 1
-            ''')
-            
-            result = cursor.fetchone()
-            conn.close()
+            with self.db.connection() as conn:
+                result = conn.execute('''
+                    SELECT meeting_link, meeting_date, meeting_time 
+                    FROM meetings 
+                    WHERE is_active = 1 
+                    ORDER BY created_at DESC 
+                    LIMIT 1
+                ''').fetchone()
             
             if result:
                 return {
@@ -312,51 +598,36 @@ Olá {name}! 👋
             logger.error(f"Erro ao recuperar configuração de reunião: {e}")
             return None
     
+    # Versões assíncronas para os handlers (executam fora do event loop)
+    async def add_user_async(self, user_id, username=None, first_name=None, last_name=None):
+        """Adiciona ou atualiza usuário sem bloquear o event loop"""
+        if self.user_cache.should_write(user_id, username, first_name, last_name):
+            await self.async_db.write(self._write_user, user_id, username, first_name, last_name)
+    
+    async def save_meeting_config_async(self, link, date, time):
+        """Salva configuração de reunião sem bloquear o event loop"""
+        return await self.async_db.write(self.save_meeting_config, link, date, time)
+    
     async def start_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Comando /start - Mensagem de boas-vindas"""
         user = update.effective_user
         chat = update.effective_chat
         
-        logger.info(f"[DEBUG] Comando /start executado por {user.first_name} ({user.id}) no chat {chat.id}")
+        logger.debug("Comando /start executado por %s (%s) no chat %s", user.first_name, user.id, chat.id, extra=HOT)
         
         try:
-            self.add_user(user.id, user.username, user.first_name, user.last_name)
-            
-            welcome_text = f"""🎯 *Bem-vindo ao Bot Auge Traders!*
-
-Olá {user.first_name}! 👋
-
-Este é o bot oficial da comunidade Auge Traders. Aqui você encontrará:
-
-📊 Análises de mercado em tempo real
-💡 Dicas e estratégias de trading
-🎓 Conteúdo educacional exclusivo
-📈 Sinais e oportunidades
-
-🔗 *Links importantes:*
-[🔗 Grupo de Dúvidas]({DUVIDAS_GROUP_LINK})
-[🎯 Mentoria Auge Traders]({MENTORIA_LINK})
-
-👥 **Nossa equipe** está pronta para ajudar!
-
-Vamos juntos rumo ao sucesso! 🚀"""
-            
-            keyboard = [
-                [InlineKeyboardButton("📊 Grupo de Dúvidas", url=DUVIDAS_GROUP_LINK)],
-                [InlineKeyboardButton("🎯 Mentoria Day Trade", url=MENTORIA_LINK)]
-            ]
-            reply_markup = InlineKeyboardMarkup(keyboard)
+            await self.add_user_async(user.id, user.username, user.first_name, user.last_name)
             
-            logger.info(f"[DEBUG] Enviando mensagem de boas-vindas para {user.first_name}")
+            welcome = self.templates.render('start', name=user.first_name)
             
             await update.message.reply_text(
-                welcome_text,
+                welcome.text,
                 parse_mode='Markdown',
-                reply_markup=reply_markup,
+                reply_markup=welcome.reply_markup,
                 disable_web_page_preview=True
             )
             
-            logger.info(f"[DEBUG] Comando /start executado com sucesso por {user.first_name} ({user.id})")
+            logger.debug("Comando /start respondido para %s (%s)", user.first_name, user.id, extra=HOT)
         except Exception as e:
             logger.error(f"[ERROR] Erro no comando /start: {e}")
             raise
@@ -367,28 +638,74 @@ Vamos juntos rumo ao sucesso! 🚀"""
             await update.message.reply_text("❌ Você não tem permissão para usar este comando.")
             return
         
-        if message_key not in self.messages:
+        if message_key not in self.templates:
             await update.message.reply_text(f"❌ Mensagem '{message_key}' não encontrada.")
             return
         
-        message_text = self.messages[message_key].format(
-            mentoria_link=MENTORIA_LINK,
-            duvidas_link=DUVIDAS_GROUP_LINK
-        )
+        message_text = self.templates.get(message_key).text
         
-        # Enviar para o grupo principal
+        # Enfileirar para todos os grupos configurados, com um único status para o admin
+        status = await update.message.reply_text(
+            f"⏳ Enviando '{message_key}' para {len(BROADCAST_CHAT_IDS)} grupo(s)..."
+        )
+        batch = f"predefinida:{status.chat_id}:{status.message_id}"
         try:
-            await context.bot.send_message(
-                chat_id=GROUP_CHAT_ID,
-                text=message_text,
+            queued = await self.queue_messages(
+                context.bot,
+                BROADCAST_CHAT_IDS,
+                message_text,
+                batch=batch,
                 parse_mode='Markdown',
                 disable_web_page_preview=True
             )
-            await update.message.reply_text(f"✅ Mensagem '{message_key}' enviada com sucesso!")
-            logger.info(f"Mensagem '{message_key}' enviada por admin {update.effective_user.id}")
         except Exception as e:
-            await update.message.reply_text(f"❌ Erro ao enviar mensagem: {str(e)}")
-            logger.error(f"Erro ao enviar mensagem '{message_key}': {e}")
+            await status.edit_text(f"❌ Erro ao enviar mensagem: {str(e)}")
+            logger.error(f"Erro ao enfileirar mensagem '{message_key}': {e}")
+            return
+        
+        logger.info(f"Mensagem '{message_key}' enfileirada por admin {update.effective_user.id} para {queued} grupo(s)")
+        # A outbox entrega em segundo plano; o status é atualizado conforme os envios terminam
+        context.application.create_task(
+            self.report_broadcast(context.application, status, message_key, batch, queued, time.monotonic())
+        )
+    
+    async def report_broadcast(self, application, status, message_key, batch, total, started, interval=2.0):
+        """Acompanha um lote da outbox e edita o status do admin com o progresso e o resumo final"""
+        shown = None
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                remaining, failed = await self.async_db.read(self.outbox.batch_status, batch)
+                done = total - remaining
+                elapsed = time.monotonic() - started
+                
+                if remaining == 0:
+                    summary = f"✅ Mensagem '{message_key}' enviada para {total - len(failed)}/{total} grupo(s) em {elapsed:.1f}s."
+                    if failed:
+                        failures = '\n'.join(f"• {chat_id}: {error}" for chat_id, error in failed.items())
+                        summary += f"\n\n❌ Falhas:\n{failures}"
+                    await status.edit_text(summary)
+                    logger.info(f"Mensagem '{message_key}' enviada para {total - len(failed)}/{total} grupo(s)")
+                    return
+                
+                if elapsed > BROADCAST_REPORT_TIMEOUT or not application.running:
+                    # Os envios continuam na outbox; só o acompanhamento termina
+                    await status.edit_text(
+                        f"⏳ '{message_key}': {done}/{total} grupo(s) concluídos, {remaining} ainda na fila de envios (veja o /stats)."
+                    )
+                    return
+                
+                if done != shown:
+                    await status.edit_text(f"⏳ Enviando '{message_key}': {done}/{total} grupo(s)...")
+                    shown = done
+            except Exception as e:
+                logger.error(f"Erro ao atualizar progresso do envio de '{message_key}': {e}")
+                return
+    
+    async def queue_messages(self, bot, chat_ids, text, **kwargs):
+        """Grava a mensagem na outbox para cada chat e retorna sem esperar o envio"""
+        self.outbox.start(bot)
+        return await self.outbox.enqueue(chat_ids, text, **kwargs)
     
     # Comandos específicos para cada mensagem
     async def cmd_morning_alert(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -427,6 +744,25 @@ Vamos juntos rumo ao sucesso! 🚀"""
         """Comando /motivacao_geral - Mensagem motivacional geral"""
         await self.send_predefined_message(update, context, 'motivation')
     
+    async def cmd_reload_templates(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Comando /reload_templates - Recarrega o arquivo de templates"""
+        if update.effective_user.id not in ADMIN_IDS:
+            await update.message.reply_text("❌ Você não tem permissão para usar este comando.")
+            return
+        
+        if not TEMPLATES_FILE:
+            await update.message.reply_text("ℹ️ Nenhum arquivo de templates configurado (TEMPLATES_FILE).")
+            return
+        
+        if self.templates.reload_if_changed():
+            await update.message.reply_text(f"✅ Templates recarregados de {TEMPLATES_FILE}.")
+        else:
+            await update.message.reply_text("ℹ️ O arquivo de templates não mudou.")
+    
+    async def check_templates_job(self, context: ContextTypes.DEFAULT_TYPE):
+        """Job periódico: recarrega o arquivo de templates se ele foi alterado"""
+        self.templates.reload_if_changed()
+    
     async def cmd_list_messages(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Comando /mensagens - Lista todas as mensagens disponíveis"""
         if update.effective_user.id not in ADMIN_IDS:
@@ -450,18 +786,42 @@ Vamos juntos rumo ao sucesso! 🚀"""
 📝 `/set_meeting` - Configurar reunião (link, data, hora)
 🧪 `/test_meeting` - Testar mensagem de reunião
 
+🗓 **Envios Agendados:**
+⏰ `/agendar morning_alert 0 6 * * 1-5` - Agendar mensagem (cron, opcional `chats=` e `tz=`)
+📅 `/agendamentos` - Listar envios agendados
+🗑 `/desagendar 3` - Remover um agendamento
+
 📋 `/mensagens` - Esta lista
+♻️ `/reload_templates` - Recarregar arquivo de templates
 📊 `/stats` - Estatísticas do bot
-
-💡 **Uso:** Digite o comando para enviar a mensagem correspondente ao grupo principal.
+🔄 `/rebuild_stats` - Recalcular estatísticas do histórico
+🔬 `/profile 60` - Perfilar o bot por N segundos e receber o relatório
+🔎 `/buscar termo` - Buscar nas mensagens registradas
+📤 `/export mensagens jsonl de=2025-01-01` - Exportar mensagens ou usuários
+🏆 `/ranking 30` - Membros mais ativos em 7 ou 30 dias
+🕒 `/horarios` - Horários de maior atividade do grupo
+
+💡 **Uso:** Digite o comando para enviar a mensagem correspondente aos grupos configurados.
         """
         
         await update.message.reply_text(commands_list, parse_mode='Markdown')
         logger.info(f"Lista de comandos solicitada por admin {update.effective_user.id}")
     
     def get_meeting_message(self):
-        """Gera mensagem de reunião com dados atuais"""
-        meeting = self.get_active_meeting()
+        """Mensagem de reunião com dados atuais (servida do cache em memória)"""
+        return self._meeting_cache[1]
+    
+    def set_meeting_cache(self, meeting):
+        """Atualiza a reunião ativa em cache junto com o texto do lembrete já renderizado"""
+        # Uma única atribuição: leitores nunca veem reunião e texto de versões diferentes
+        self._meeting_cache = (meeting, self.render_meeting_message(meeting))
+    
+    def refresh_meeting_cache(self):
+        """Carrega a reunião ativa do banco para o cache"""
+        self.set_meeting_cache(self.get_active_meeting())
+    
+    def render_meeting_message(self, meeting):
+        """Monta o texto do lembrete a partir da configuração de reunião"""
         if not meeting:
             return None
         
@@ -497,7 +857,7 @@ Nossa reunião da Auge acontece em *{meeting['date']}* às *{meeting['time']}*.
         time = context.args[2]
         
         # Salvar configuração
-        if self.save_meeting_config(link, date, time):
+        if await self.save_meeting_config_async(link, date, time):
             await update.message.reply_text(
                 f"✅ *Reunião configurada com sucesso!*\n\n"
                 f"📅 **Data:** {date}\n"
@@ -530,134 +890,359 @@ Nossa reunião da Auge acontece em *{meeting['date']}* às *{meeting['time']}*.
         meeting_message = self.get_meeting_message()
         if meeting_message:
             try:
-                await context.bot.send_message(
-                    chat_id=GROUP_CHAT_ID,
-                    text=meeting_message,
+                await self.queue_messages(
+                    context.bot,
+                    [GROUP_CHAT_ID],
+                    meeting_message,
                     parse_mode='Markdown',
                     disable_web_page_preview=True
                 )
-                logger.info("Mensagem de reunião enviada automaticamente")
+                logger.info("Mensagem de reunião enfileirada automaticamente")
             except Exception as e:
-                logger.error(f"Erro ao enviar mensagem automática de reunião: {e}")
+                logger.error(f"Erro ao enfileirar mensagem automática de reunião: {e}")
+    
+    async def renew_leadership_job(self, context: ContextTypes.DEFAULT_TYPE):
+        """Job periódico: obtém ou renova o lease de líder dos jobs agendados"""
+        was_leader = self.leader.is_leader
+        await self.async_db.write(self.leader.renew)
+        if not self.leader.is_leader:
+            return
+        
+        # Novo líder (retoma os envios perdidos) ou agendamentos alterados por outra réplica
+        fingerprint = await self.async_db.read(self.fetch_posts_fingerprint)
+        if not was_leader or fingerprint != self._posts_fingerprint:
+            await self.reload_post_scheduler(context.job_queue)
+    
+    def leader_job(self, callback, name, daily=False):
+        """Envolve um job para rodar só na réplica líder.
+        
+        Com `daily=True`, a execução também é reservada com a chave
+        '<job>:<data local>', garantindo no máximo um envio por dia.
+        """
+        @functools.wraps(callback)
+        async def run(context):
+            if not self.leader.is_leader:
+                logger.debug(f"Job {name} ignorado: esta instância não é a líder")
+                return
+            
+            run_key = None
+            if daily:
+                run_key = f"{name}:{datetime.now(self.timezone).strftime('%Y-%m-%d')}"
+                claimed = await self.async_db.write(self.job_runs.claim, run_key, self.leader.holder)
+                if not claimed:
+                    logger.info(f"Job {name} já executado ({run_key}), ignorando")
+                    return
+            
+            status = 'failed'
+            try:
+                await callback(context)
+                status = 'done'
+            finally:
+                if run_key:
+                    await self.async_db.write(self.job_runs.finish, run_key, status)
+        
+        return run
     
     def setup_meeting_scheduler(self, job_queue: JobQueue):
         """Configura o agendamento automático de mensagens de reunião"""
         # Horários para envio automático (10:00 e 18:00 horário de Brasília)
-        morning_time = dt_time(hour=10, minute=0, second=0)
-        evening_time = dt_time(hour=18, minute=0, second=0)
+        morning_time = dt_time(hour=10, minute=0, second=0, tzinfo=self.timezone)
+        evening_time = dt_time(hour=18, minute=0, second=0, tzinfo=self.timezone)
         
-        # Agendar envios diários
+        # Agendar envios diários (apenas na réplica líder, uma vez por dia)
         job_queue.run_daily(
-            self.send_scheduled_meeting_message,
+            self.metrics.track_job(self.leader_job(self.send_scheduled_meeting_message, 'meeting_morning', daily=True), 'meeting_morning'),
             time=morning_time,
             name='meeting_morning'
         )
         
         job_queue.run_daily(
-            self.send_scheduled_meeting_message,
+            self.metrics.track_job(self.leader_job(self.send_scheduled_meeting_message, 'meeting_evening', daily=True), 'meeting_evening'),
             time=evening_time,
             name='meeting_evening'
         )
         
-        logger.info("Agendamento automático de reuniões configurado para 10:00 e 18:00")
+        logger.info(f"Agendamento automático de reuniões configurado para 10:00 e 18:00 ({self.timezone.zone})")
     
-    async def welcome_new_member(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
-        """Mensagem automática para novos membros"""
-        for new_member in update.message.new_chat_members:
-            self.add_user(new_member.id, new_member.username, new_member.first_name, new_member.last_name)
-            
-            if update.effective_chat.id == GROUP_CHAT_ID:
-                # Mensagem para grupo principal usando mensagem predefinida
-                welcome_text = self.messages['welcome_main'].format(
-                    name=new_member.first_name,
-                    mentoria_link=MENTORIA_LINK,
-                    duvidas_link=DUVIDAS_GROUP_LINK
-                )
-                
-                keyboard = [
-                    [InlineKeyboardButton("🎯 Mentoria Day Trade", url=MENTORIA_LINK)]
-                ]
-                reply_markup = InlineKeyboardMarkup(keyboard)
-                
-                await update.message.reply_text(
-                    welcome_text,
+    def load_scheduled_posts(self):
+        """Lê todos os agendamentos (uma consulta) e guarda a impressão digital da tabela"""
+        with self.db.connection() as conn:
+            posts = load_posts(conn)
+        self._posts_fingerprint = (len(posts), max((post.id for post in posts), default=0))
+        return posts
+    
+    def fetch_posts_fingerprint(self):
+        with self.db.connection() as conn:
+            return posts_fingerprint(conn)
+    
+    async def reload_post_scheduler(self, job_queue):
+        posts = await self.async_db.read(self.load_scheduled_posts)
+        self.post_scheduler.load(posts, time.time())
+        self.arm_post_scheduler(job_queue)
+        logger.info(f"{len(self.post_scheduler)} agendamento(s) carregado(s)")
+    
+    def arm_post_scheduler(self, job_queue):
+        """(Re)arma o timer único para o próximo envio agendado"""
+        if self._post_timer is not None:
+            try:
+                self._post_timer.schedule_removal()
+            except JobLookupError:
+                # O timer já disparou
+                pass
+            self._post_timer = None
+        
+        next_run = self.post_scheduler.next_run_time()
+        if next_run is None:
+            return
+        # Sem limite de atraso: um envio vencido durante a inicialização ainda é feito
+        self._post_timer = job_queue.run_once(
+            self.metrics.track_job(self.run_scheduled_posts_job, 'scheduled_posts'),
+            when=max(next_run - time.time(), 0),
+            name='scheduled_posts',
+            job_kwargs={'misfire_grace_time': None}
+        )
+    
+    async def run_scheduled_posts_job(self, context: ContextTypes.DEFAULT_TYPE):
+        """Timer único: envia os agendamentos vencidos e rearma para o próximo"""
+        self._post_timer = None
+        try:
+            due = self.post_scheduler.pop_due(time.time())
+            if not due:
+                return
+            if not self.leader.is_leader:
+                logger.debug(f"{len(due)} envio(s) agendado(s) ignorado(s): esta instância não é a líder")
+                return
+            await asyncio.gather(*(self.send_scheduled_post(context.bot, post, run_at) for post, run_at in due))
+        finally:
+            self.arm_post_scheduler(context.job_queue)
+    
+    async def send_scheduled_post(self, bot, post, run_at):
+        """Envia um agendamento uma única vez por horário (chave em `job_runs`)"""
+        run_key = f"agendamento:{post.id}:{int(run_at)}"
+        try:
+            claimed = await self.async_db.write(self.job_runs.claim, run_key, self.leader.holder)
+            if not claimed:
+                logger.info(f"Agendamento {post.id} já enviado ({run_key}), ignorando")
+                return
+            
+            status = 'failed'
+            try:
+                if post.template_key not in self.templates:
+                    logger.error(f"Agendamento {post.id}: mensagem '{post.template_key}' não encontrada")
+                    return
+                queued = await self.queue_messages(
+                    bot,
+                    post.chat_ids,
+                    self.templates.get(post.template_key).text,
                     parse_mode='Markdown',
-                    reply_markup=reply_markup,
                     disable_web_page_preview=True
                 )
-                
+                status = 'done'
+                logger.info(f"Agendamento {post.id} ('{post.template_key}') enfileirado para {queued} grupo(s)")
+            finally:
+                await self.async_db.write(self.job_runs.finish, run_key, status)
+                await self.async_db.write(self.mark_scheduled_post_run, post.id, run_at)
+        except Exception as e:
+            logger.error(f"Erro no agendamento {post.id} ('{post.template_key}'): {e}")
+    
+    def save_scheduled_post(self, template_key, chat_ids, cron, timezone, created_by, now):
+        with self.db.transaction() as conn:
+            return insert_post(conn, template_key, chat_ids, cron, timezone, created_by, now)
+    
+    def remove_scheduled_post(self, post_id):
+        with self.db.transaction() as conn:
+            return delete_post(conn, post_id)
+    
+    def mark_scheduled_post_run(self, post_id, run_at):
+        with self.db.transaction() as conn:
+            mark_post_run(conn, post_id, run_at)
+    
+    async def cmd_schedule_post(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Comando /agendar <mensagem> <cron> [chats=ID,ID] [tz=Fuso] - Agenda uma mensagem predefinida"""
+        if update.effective_user.id not in ADMIN_IDS:
+            await update.message.reply_text("❌ Você não tem permissão para usar este comando.")
+            return
+        
+        options = {}
+        cron_parts = []
+        for arg in context.args[1:]:
+            key, sep, value = arg.partition('=')
+            if sep and key in ('chats', 'tz'):
+                options[key] = value
+            else:
+                cron_parts.append(arg)
+        
+        if len(cron_parts) != 5:
+            await update.message.reply_text(
+                "❌ Uso: `/agendar morning_alert 0 6 * * 1-5 [chats=ID,ID] [tz=America/Sao_Paulo]`",
+                parse_mode='Markdown'
+            )
+            return
+        
+        template_key = context.args[0]
+        if template_key not in self.templates:
+            await update.message.reply_text(f"❌ Mensagem '{template_key}' não encontrada.")
+            return
+        
+        try:
+            chat_ids = [int(c) for c in options['chats'].split(',') if c.strip()] if 'chats' in options else BROADCAST_CHAT_IDS
+            timezone = options.get('tz', self.timezone.zone)
+            cron = CronExpression(' '.join(cron_parts))
+            cron.next_after(time.time(), pytz.timezone(timezone))
+        except pytz.UnknownTimeZoneError:
+            await update.message.reply_text(f"❌ Fuso horário desconhecido: {options.get('tz')}")
+            return
+        except ValueError as e:
+            await update.message.reply_text(f"❌ {e}")
+            return
+        
+        now = time.time()
+        post = await self.async_db.write(
+            self.save_scheduled_post, template_key, chat_ids, cron.expression, timezone, update.effective_user.id, now
+        )
+        next_run = self.post_scheduler.add(post, now)
+        self._posts_fingerprint = None
+        self.arm_post_scheduler(context.job_queue)
+        
+        await update.message.reply_text(
+            f"✅ Agendamento #{post.id}: '{template_key}' em `{cron.expression}` ({timezone}) "
+            f"para {len(chat_ids)} grupo(s).\nPróximo envio: {self.post_scheduler.format_time(next_run, timezone)}",
+            parse_mode='Markdown'
+        )
+        logger.info(f"Agendamento {post.id} ('{template_key}', {cron.expression}) criado por admin {update.effective_user.id}")
+    
+    async def cmd_list_scheduled_posts(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Comando /agendamentos - Lista os envios agendados"""
+        if update.effective_user.id not in ADMIN_IDS:
+            await update.message.reply_text("❌ Você não tem permissão para usar este comando.")
+            return
+        
+        posts = sorted(self.post_scheduler.posts(), key=lambda post: post.id)
+        if not posts:
+            await update.message.reply_text("📭 Nenhum envio agendado. Use /agendar para criar.")
+            return
+        
+        lines = ["🗓 <b>Envios agendados</b>", ""]
+        for post in posts:
+            next_run = self.post_scheduler.next_run_of(post.id)
+            lines.append(
+                f"#{post.id} <b>{html.escape(post.template_key)}</b> — <code>{html.escape(post.cron)}</code> "
+                f"({html.escape(post.timezone)}), {len(post.chat_ids)} grupo(s)"
+            )
+            if next_run is not None:
+                lines.append(f"    próximo: {self.post_scheduler.format_time(next_run, post.timezone)}")
+        await update.message.reply_text('\n'.join(lines), parse_mode='HTML')
+    
+    async def cmd_unschedule_post(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Comando /desagendar <id> - Remove um envio agendado"""
+        if update.effective_user.id not in ADMIN_IDS:
+            await update.message.reply_text("❌ Você não tem permissão para usar este comando.")
+            return
+        
+        try:
+            post_id = int(context.args[0].lstrip('#'))
+        except (IndexError, ValueError):
+            await update.message.reply_text("❌ Uso: /desagendar <id> (veja /agendamentos)")
+            return
+        
+        removed = await self.async_db.write(self.remove_scheduled_post, post_id)
+        self.post_scheduler.remove(post_id)
+        self._posts_fingerprint = None
+        self.arm_post_scheduler(context.job_queue)
+        
+        if removed:
+            await update.message.reply_text(f"✅ Agendamento #{post_id} removido.")
+            logger.info(f"Agendamento {post_id} removido por admin {update.effective_user.id}")
+        else:
+            await update.message.reply_text(f"❌ Agendamento #{post_id} não encontrado.")
+    
+    def welcome_template_key(self, chat_id):
+        """Template de boas-vindas usado em cada grupo"""
+        if chat_id == GROUP_CHAT_ID:
+            # Mensagem para grupo principal usando mensagem predefinida
+            return 'welcome_main'
+        elif chat_id == DUVIDAS_GROUP_CHAT_ID:
+            # Mensagem para grupo de dúvidas
+            return 'welcome_duvidas'
+        # Mensagem genérica para outros grupos
+        return 'welcome_generic'
+    
+    async def welcome_new_member(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Mensagem automática para novos membros"""
+        chat_id = update.effective_chat.id
+        new_members = update.message.new_chat_members
+        
+        for new_member in new_members:
+            await self.add_user_async(new_member.id, new_member.username, new_member.first_name, new_member.last_name)
+        
+        # Em rajadas de entrada, a saudação vai em uma única mensagem coletiva
+        if not self.join_aggregator.add(context.bot, chat_id, new_members):
+            logger.info(f"{len(new_members)} novo(s) membro(s) aguardando boas-vindas coletivas no chat {chat_id}")
+            return
+        
+        # Respostas à mensagem de entrada, enviadas pela outbox na ordem em que foram enfileiradas
+        reply = dict(
+            reply_to_message_id=update.message.message_id,
+            allow_sending_without_reply=True,
+            disable_web_page_preview=True
+        )
+        for new_member in new_members:
+            welcome = self.templates.render(self.welcome_template_key(chat_id), name=new_member.first_name)
+            await self.queue_messages(
+                context.bot,
+                [chat_id],
+                welcome.text,
+                parse_mode='Markdown',
+                reply_markup=welcome.reply_markup,
+                **reply
+            )
+            
+            if chat_id == GROUP_CHAT_ID:
                 # Enviar mensagem de reunião se configurada
                 meeting_message = self.get_meeting_message()
                 if meeting_message:
-                    await update.message.reply_text(
-                        meeting_message,
-                        parse_mode='Markdown',
-                        disable_web_page_preview=True
-                    )
-            
-            elif update.effective_chat.id == DUVIDAS_GROUP_CHAT_ID:
-                # Mensagem para grupo de dúvidas
-                welcome_text = f"""🔗 *Bem-vindo ao Grupo de Dúvidas, {new_member.first_name}!*
-
-👋 Este é o espaço ideal para suas perguntas sobre trading!
-
-💡 Aqui você pode:
-• Tirar dúvidas sobre análises técnicas
-• Pedir ajuda com estratégias
-• Compartilhar experiências de trading
-• Aprender com a comunidade
-
-🎯 *Link da Mentoria:*
-[🎯 Mentoria Auge Traders]({MENTORIA_LINK})
-
-📋 *Dicas para melhor aproveitamento:*
-• Seja específico nas suas perguntas
-• Use prints/gráficos quando necessário
-• Respeite todos os membros
-• Mantenha o foco em aprendizado
-
-👥 **Nossa equipe** está pronta para ajudar!
-
-Vamos aprender juntos! 📚"""
-                
-                keyboard = [
-                    [InlineKeyboardButton("📊 Grupo de Dúvidas", url=DUVIDAS_GROUP_LINK)],
-                    [InlineKeyboardButton("🎯 Mentoria Day Trade", url=MENTORIA_LINK)]
-                ]
-                reply_markup = InlineKeyboardMarkup(keyboard)
-                
-                await update.message.reply_text(
-                    welcome_text,
-                    parse_mode='Markdown',
-                    reply_markup=reply_markup,
-                    disable_web_page_preview=True
-                )
+                    await self.queue_messages(context.bot, [chat_id], meeting_message, parse_mode='Markdown', **reply)
             
-            else:
-                # Mensagem genérica para outros grupos
-                welcome_text = f"""👋 Olá {new_member.first_name}!
-
-Bem-vindo ao nosso grupo! 🎯
-
-[🔗 Grupo de Dúvidas]({DUVIDAS_GROUP_LINK})
-[🎯 Mentoria Auge Traders]({MENTORIA_LINK})
-
-👥 **Nossa equipe** está pronta para ajudar!"""
-                
-                keyboard = [
-                    [InlineKeyboardButton("📊 Grupo de Dúvidas", url=DUVIDAS_GROUP_LINK)],
-                    [InlineKeyboardButton("🎯 Mentoria Day Trade", url=MENTORIA_LINK)]
-                ]
-                reply_markup = InlineKeyboardMarkup(keyboard)
-                
-                await update.message.reply_text(
-                    welcome_text,
+            logger.info(f"Mensagem de boas-vindas enfileirada para {new_member.first_name} ({new_member.id})")
+    
+    async def send_join_batch(self, bot, chat_id, members):
+        """Envia uma única saudação para todos os membros que entraram durante uma rajada"""
+        mentions = [
+            f"[{self.mention_name(member.first_name)}](tg://user?id={member.id})"
+            for member in members[:JOIN_BURST_MAX_MENTIONS]
+        ]
+        if len(members) > JOIN_BURST_MAX_MENTIONS:
+            mentions.append(f"mais {len(members) - JOIN_BURST_MAX_MENTIONS} pessoas")
+        names = mentions[0] if len(mentions) == 1 else f"{', '.join(mentions[:-1])} e {mentions[-1]}"
+        
+        welcome = self.templates.render(self.welcome_template_key(chat_id), name=names)
+        await self.queue_messages(
+            bot,
+            [chat_id],
+            welcome.text,
+            parse_mode='Markdown',
+            reply_markup=welcome.reply_markup,
+            disable_web_page_preview=True
+        )
+        
+        if chat_id == GROUP_CHAT_ID:
+            # Um único lembrete de reunião para o grupo todo
+            meeting_message = self.get_meeting_message()
+            if meeting_message:
+                await self.queue_messages(
+                    bot,
+                    [chat_id],
+                    meeting_message,
                     parse_mode='Markdown',
-                    reply_markup=reply_markup,
                     disable_web_page_preview=True
                 )
-            
-            logger.info(f"Mensagem de boas-vindas enviada para {new_member.first_name} ({new_member.id})")
+        
+        logger.info(f"Boas-vindas coletivas enfileiradas para {len(members)} membros no chat {chat_id}")
+    
+    @staticmethod
+    def mention_name(name):
+        """Remove caracteres que quebrariam o link de menção em Markdown"""
+        return ''.join(ch for ch in (name or 'membro') if ch not in '[]()*_`') or 'membro'
     
     async def admin_stats(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Comando /stats - Estatísticas do bot (apenas admins)"""
@@ -665,89 +1250,534 @@ Bem-vindo ao nosso grupo! 🎯
             await update.message.reply_text("❌ Você não tem permissão para usar este comando.")
             return
         
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        
-        # Total de usuários
-        cursor.execute("SELECT COUNT(*) FROM users")
-        total_users = cursor.fetchone()[0]
-        
-        # Usuários ativos (últimos 30 dias)
-        cursor.execute("""
-            SELECT COUNT(DISTINCT user_id) FROM messages 
-            WHERE message_date >= datetime('now', '-30 days')
-        """)
-        active_users = cursor.fetchone()[0]
-        
-        # Total de mensagens
-        cursor.execute("SELECT COUNT(*) FROM messages")
-        total_messages = cursor.fetchone()[0]
-        
-        # Mensagens hoje
-        cursor.execute("""
-            SELECT COUNT(*) FROM messages 
-            WHERE date(message_date) = date('now')
-        """)
-        today_messages = cursor.fetchone()[0]
-        
-        conn.close()
+        stats = await self.async_db.read(self.fetch_stats)
+        outbox = await self.async_db.read(self.outbox.counts)
         
         stats_text = f"""📊 *Estatísticas do Bot Auge Traders*
 
-👥 Total de usuários: {total_users}
-🟢 Usuários ativos (30 dias): {active_users}
-💬 Total de mensagens: {total_messages}
-📅 Mensagens hoje: {today_messages}
+👥 Total de usuários: {stats['total_users']}
+🟢 Usuários ativos (30 dias): {stats['active_users']}
+💬 Total de mensagens: {stats['total_messages']}
+📅 Mensagens hoje: {stats['today_messages']}
+📥 Fila de gravação: {self.write_buffer.depth} ({self.write_buffer.dropped} registros descartados após falhas)
+🧠 Cache de usuários: {self.user_cache.hit_rate:.0%} de escritas evitadas ({len(self.user_cache)} em cache)
+🚦 Fila de entrada: {self.update_processor.depth} aguardando, {sum(self.update_processor.shed_counts.values())} mensagens só registradas sob carga
+📤 Fila de envios: {outbox.get('pending', 0) + outbox.get('sending', 0)} pendente(s), {outbox.get('failed', 0)} com falha ({self.outbox.sent} enviadas desde o início)
+🌊 Antiflood: {self.flood_guard.suppressed} mensagens não registradas em {self.flood_guard.bursts} rajada(s)
+🔁 Updates repetidos ignorados: {self.dedup.duplicates} (recentes: {self.dedup.duplicates_recent}, marca d'água: {self.dedup.duplicates_watermark})
 
 📅 Atualizado em: {datetime.now().strftime('%d/%m/%Y %H:%M')}"""
         
         await update.message.reply_text(stats_text, parse_mode='Markdown')
         logger.info(f"Estatísticas solicitadas por admin {update.effective_user.id}")
     
+    async def cmd_search(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Comando /buscar <termo> - Busca nas mensagens registradas"""
+        if update.effective_user.id not in ADMIN_IDS:
+            await update.message.reply_text("❌ Você não tem permissão para usar este comando.")
+            return
+        
+        term = ' '.join(context.args).strip()
+        match = build_match_query(term)
+        if not match:
+            await update.message.reply_text("❌ Uso: /buscar <termo>")
+            return
+        
+        try:
+            high, page = await self.async_db.read(self.fetch_search_page, match)
+        except Exception as e:
+            logger.error(f"Erro na busca por '{term}': {e}")
+            await update.message.reply_text(f"❌ Erro na busca: {str(e)}")
+            return
+        
+        if not page.results:
+            await update.message.reply_text(f"🔎 Nenhuma mensagem encontrada para \"{term}\".")
+            return
+        
+        session_id = self.search_sessions.create(term, match, high)
+        text, markup = self.render_search_page(term, page, session_id)
+        await update.message.reply_text(text, parse_mode='HTML', reply_markup=markup, disable_web_page_preview=True)
+    
+    async def search_callback(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Botões de página do /buscar (callback_data 'buscar:<sessão>:<n|p>:<score>:<id>')"""
+        query = update.callback_query
+        if query.from_user.id not in ADMIN_IDS:
+            await query.answer("Sem permissão.")
+            return
+        
+        try:
+            _, session_id, direction, score, message_id = query.data.split(':')
+            cursor = (float(score), int(message_id))
+        except ValueError:
+            await query.answer()
+            return
+        
+        session = self.search_sessions.get(session_id)
+        if session is None:
+            await query.answer("Busca expirada, use /buscar novamente.")
+            return
+        
+        term, match, high = session
+        kwargs = {'after': cursor} if direction == 'n' else {'before': cursor}
+        _, page = await self.async_db.read(self.fetch_search_page, match, high, **kwargs)
+        await query.answer()
+        if not page.results:
+            return
+        
+        text, markup = self.render_search_page(term, page, session_id)
+        await query.edit_message_text(text, parse_mode='HTML', reply_markup=markup, disable_web_page_preview=True)
+    
+    def fetch_search_page(self, match, high=None, after=None, before=None):
+        """Consulta uma página da busca; na primeira, fixa o maior id que casa"""
+        with self.db.connection() as conn:
+            if high is None:
+                high = latest_match(conn, match)
+                if high is None:
+                    return None, SearchPage([], has_prev=False, has_next=False)
+            page = search_page(conn, match, high, after=after, before=before, page_size=SEARCH_PAGE_SIZE)
+        return high, page
+    
+    def render_search_page(self, term, page, session_id):
+        """Texto (HTML) e botões de navegação de uma página de resultados"""
+        lines = [f"🔎 <b>Resultados para \"{html.escape(term)}\"</b>", ""]
+        for result in page.results:
+            author = html.escape(result.first_name or f"Usuário {result.user_id}")
+            if result.username:
+                author += f" (@{html.escape(result.username)})"
+            snippet = html.escape(result.snippet or '')
+            snippet = snippet.replace(HIGHLIGHT_START, '<b>').replace(HIGHLIGHT_END, '</b>')
+            lines.append(f"👤 {author} — {self.format_message_date(result.message_date)}")
+            lines.append(f"💬 {snippet}")
+            lines.append("")
+        
+        buttons = []
+        first, last = page.results[0], page.results[-1]
+        if page.has_prev:
+            buttons.append(InlineKeyboardButton("⬅️ Anteriores", callback_data=f"buscar:{session_id}:p:{first.score!r}:{first.message_id}"))
+        if page.has_next:
+            buttons.append(InlineKeyboardButton("Próximos ➡️", callback_data=f"buscar:{session_id}:n:{last.score!r}:{last.message_id}"))
+        return '\n'.join(lines).strip(), InlineKeyboardMarkup([buttons]) if buttons else None
+    
+    def format_message_date(self, value):
+        """Data gravada em UTC ('AAAA-MM-DD HH:MM:SS') no fuso do bot"""
+        try:
+            moment = pytz.utc.localize(datetime.strptime(str(value)[:19], '%Y-%m-%d %H:%M:%S'))
+            return moment.astimezone(self.timezone).strftime('%d/%m/%Y %H:%M')
+        except ValueError:
+            return str(value)
+    
+    async def cmd_ranking(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Comando /ranking [7|30] - Membros que mais escreveram no período"""
+        if update.effective_user.id not in ADMIN_IDS:
+            await update.message.reply_text("❌ Você não tem permissão para usar este comando.")
+            return
+        
+        days = context.args[0] if context.args else '7'
+        if days not in ('7', '30'):
+            await update.message.reply_text("❌ Uso: /ranking [7|30]")
+            return
+        
+        ranking = await self.async_db.read(self.fetch_ranking, int(days))
+        if not ranking:
+            await update.message.reply_text(f"📭 Nenhuma mensagem registrada nos últimos {days} dias.")
+            return
+        
+        medals = {1: '🥇', 2: '🥈', 3: '🥉'}
+        lines = [f"🏆 <b>Membros mais ativos ({days} dias)</b>", ""]
+        for position, (user_id, first_name, username, total) in enumerate(ranking, 1):
+            name = html.escape(first_name or f"Usuário {user_id}")
+            if username:
+                name += f" (@{html.escape(username)})"
+            lines.append(f"{medals.get(position, f'{position}.')} {name} — {total} mensagens")
+        await update.message.reply_text('\n'.join(lines), parse_mode='HTML')
+    
+    def fetch_ranking(self, days):
+        with self.db.connection() as conn:
+            return read_ranking(conn, days, RANKING_SIZE)
+    
+    async def cmd_activity_hours(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Comando /horarios [chat_id] - Quando o grupo está mais ativo (fuso do bot)"""
+        if update.effective_user.id not in ADMIN_IDS:
+            await update.message.reply_text("❌ Você não tem permissão para usar este comando.")
+            return
+        
+        try:
+            chat_id = int(context.args[0]) if context.args else GROUP_CHAT_ID
+        except ValueError:
+            await update.message.reply_text("❌ Uso: /horarios [chat_id]")
+            return
+        
+        offset = int(datetime.now(self.timezone).utcoffset().total_seconds() // 3600)
+        counts = await self.async_db.read(self.fetch_activity, chat_id, offset)
+        total = sum(counts)
+        if not total:
+            await update.message.reply_text("📭 Ainda não há mensagens registradas neste grupo.")
+            return
+        
+        weekdays = ['Segunda', 'Terça', 'Quarta', 'Quinta', 'Sexta', 'Sábado', 'Domingo']
+        by_hour = [sum(counts[day * 24 + hour] for day in range(7)) for hour in range(24)]
+        by_day = [sum(counts[day * 24:day * 24 + 24]) for day in range(7)]
+        top_slots = sorted((slot for slot in range(len(counts)) if counts[slot]), key=lambda slot: -counts[slot])[:5]
+        
+        def bar(value, peak):
+            return '█' * max(1, round(value * 12 / peak)) if value else ''
+        
+        lines = [f"🕒 <b>Atividade do grupo</b> ({total} mensagens, fuso {self.timezone.zone})", "", "<b>Melhores horários:</b>"]
+        for slot in top_slots:
+            lines.append(f"• {weekdays[slot // 24]} {slot % 24:02d}h — {counts[slot]} mensagens")
+        
+        lines += ["", "<b>Por hora do dia:</b>", "<pre>"]
+        lines += [f"{hour:02d}h {bar(value, max(by_hour)):<12} {value}" for hour, value in enumerate(by_hour)]
+        lines += ["</pre>", "<b>Por dia da semana:</b>", "<pre>"]
+        lines += [f"{weekdays[day][:3]} {bar(value, max(by_day)):<12} {value}" for day, value in enumerate(by_day)]
+        lines.append("</pre>")
+        await update.message.reply_text('\n'.join(lines), parse_mode='HTML')
+    
+    def fetch_activity(self, chat_id, offset):
+        with self.db.connection() as conn:
+            return read_activity(conn, chat_id, offset)
+    
+    async def cmd_export(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Comando /export - Envia mensagens ou usuários como arquivo.
+        
+        Uso: /export [mensagens|usuarios] [csv|jsonl] [de=AAAA-MM-DD] [ate=AAAA-MM-DD]
+        [chat=ID] [usuario=ID] [novos]
+        """
+        if update.effective_user.id not in ADMIN_IDS:
+            await update.message.reply_text("❌ Você não tem permissão para usar este comando.")
+            return
+        
+        table, fmt, incremental = 'messages', 'jsonl', False
+        options = {}
+        for arg in context.args:
+            key, _, value = arg.partition('=')
+            if arg in ('mensagens', 'usuarios'):
+                table = 'messages' if arg == 'mensagens' else 'users'
+            elif arg in ('csv', 'jsonl'):
+                fmt = arg
+            elif arg == 'novos':
+                incremental = True
+            elif key in ('de', 'ate', 'chat', 'usuario') and value:
+                options[key] = value
+            else:
+                await update.message.reply_text(
+                    "❌ Uso: /export [mensagens|usuarios] [csv|jsonl] [de=AAAA-MM-DD] "
+                    "[ate=AAAA-MM-DD] [chat=ID] [usuario=ID] [novos]"
+                )
+                return
+        
+        try:
+            filters = ExportFilters(
+                date_from=options.get('de'),
+                date_to=options.get('ate'),
+                chat_id=int(options['chat']) if 'chat' in options else None,
+                user_id=int(options['usuario']) if 'usuario' in options else None
+            )
+            for value in (filters.date_from, filters.date_to):
+                if value:
+                    datetime.strptime(value, '%Y-%m-%d')
+        except ValueError:
+            await update.message.reply_text("❌ Datas no formato AAAA-MM-DD e ids numéricos.")
+            return
+        
+        await update.message.reply_text("⏳ Gerando exportação...")
+        suffix = '.csv' if fmt == 'csv' else '.jsonl.gz'
+        filename = f"{table}-{datetime.now(self.timezone).strftime('%Y%m%d-%H%M%S')}{suffix}"
+        with tempfile.TemporaryDirectory(prefix='auge-export-') as workdir:
+            path = os.path.join(workdir, filename)
+            try:
+                key = state_key(table, 'telegram')
+                since_id = await self.async_db.read(self.last_exported_id, key) if incremental else 0
+                result = await self.async_db.read(export_table, self.db, table, path, fmt, filters, since_id)
+                
+                if not result.rows:
+                    await update.message.reply_text("📭 Nenhum registro para exportar com esses filtros.")
+                    return
+                
+                if os.path.getsize(path) > EXPORT_MAX_UPLOAD_BYTES:
+                    await update.message.reply_text(
+                        "❌ O arquivo passou do limite de envio do Telegram. "
+                        "Use filtros ou `python exporter.py` no servidor.",
+                        parse_mode='Markdown'
+                    )
+                    return
+                
+                with open(path, 'rb') as document:
+                    await update.message.reply_document(
+                        document=document,
+                        filename=filename,
+                        caption=f"📤 {result.rows} registros" + (f" (até o id {result.last_id})" if table == 'messages' else '')
+                    )
+                
+                # Só avança o marcador depois que o arquivo foi entregue
+                if incremental:
+                    await self.async_db.write(self.save_last_exported_id, key, result.last_id)
+                logger.info(f"Exportação de {table} ({result.rows} registros) enviada para admin {update.effective_user.id}")
+            except Exception as e:
+                logger.error(f"Erro na exportação de {table}: {e}")
+                await update.message.reply_text(f"❌ Erro na exportação: {str(e)}")
+    
+    def last_exported_id(self, key):
+        with self.db.connection() as conn:
+            return get_last_exported_id(conn, key)
+    
+    def save_last_exported_id(self, key, last_id):
+        with self.db.transaction() as conn:
+            set_last_exported_id(conn, key, last_id)
+    
+    def fetch_stats(self):
+        """Consulta os números exibidos no /stats (a partir dos agregados)"""
+        with self.db.connection() as conn:
+            return read_stats(conn)
+    
+    def rebuild_stats(self):
+        """Recalcula os agregados do /stats a partir do histórico completo"""
+        with self.db.transaction() as conn:
+            backfill_analytics(conn)
+            return backfill_rollups(conn)
+    
+    def archive_old_messages(self, cutoff):
+        """Move um lote de mensagens anteriores a `cutoff` para o arquivo compactado"""
+        with self.db.transaction() as conn:
+            return archive_batch(conn, cutoff, RETENTION_BATCH_SIZE)
+    
+    async def compact_messages_job(self, context: ContextTypes.DEFAULT_TYPE):
+        """Job periódico: move mensagens antigas para o arquivo, um lote por transação"""
+        cutoff = time.strftime('%Y-%m-%d %H:%M:%S', time.gmtime(time.time() - MESSAGE_RETENTION_DAYS * 86400))
+        total = 0
+        started = time.monotonic()
+        
+        # Cada lote vai para a fila de escrita separadamente, intercalando com as gravações normais
+        while True:
+            moved = await self.async_db.write(self.archive_old_messages, cutoff)
+            total += moved
+            if moved < RETENTION_BATCH_SIZE:
+                break
+        
+        if total:
+            logger.info(f"Retenção: {total} mensagens anteriores a {cutoff} arquivadas em {time.monotonic() - started:.1f}s")
+    
+    async def cmd_rebuild_stats(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Comando /rebuild_stats - Recalcula as estatísticas a partir do histórico"""
+        if update.effective_user.id not in ADMIN_IDS:
+            await update.message.reply_text("❌ Você não tem permissão para usar este comando.")
+            return
+        
+        await update.message.reply_text("⏳ Recalculando estatísticas...")
+        try:
+            # Roda na thread de escrita para não competir com os lotes do buffer
+            total = await self.async_db.write(self.rebuild_stats)
+            await update.message.reply_text(f"✅ Estatísticas recalculadas ({total} mensagens).")
+            logger.info(f"Estatísticas recalculadas por admin {update.effective_user.id}")
+        except Exception as e:
+            await update.message.reply_text(f"❌ Erro ao recalcular estatísticas: {str(e)}")
+            logger.error(f"Erro ao recalcular estatísticas: {e}")
+    
+    async def cmd_profile(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Comando /profile N - Perfila o bot por N segundos e envia o relatório"""
+        if update.effective_user.id not in ADMIN_IDS:
+            await update.message.reply_text("❌ Você não tem permissão para usar este comando.")
+            return
+        
+        try:
+            seconds = int(context.args[0]) if context.args else 30
+        except ValueError:
+            await update.message.reply_text("❌ Uso: /profile [segundos]")
+            return
+        seconds = max(1, min(seconds, PROFILE_MAX_SECONDS))
+        
+        if self._profiling:
+            await update.message.reply_text("ℹ️ Já existe um perfil em andamento.")
+            return
+        
+        self._profiling = True
+        await update.message.reply_text(f"🔬 Perfilando por {seconds}s...")
+        logger.info(f"Perfil de {seconds}s iniciado por admin {update.effective_user.id}")
+        # Em segundo plano: os updates seguintes precisam continuar sendo processados
+        context.application.create_task(self.send_profile(update.message, seconds))
+    
+    async def send_profile(self, message, seconds):
+        """Executa o perfil e responde com o relatório em anexo"""
+        try:
+            report = await profile_loop(seconds)
+            filename = f"profile-{datetime.now(self.timezone).strftime('%Y%m%d-%H%M%S')}.txt"
+            await message.reply_document(
+                document=report.encode('utf-8'),
+                filename=filename,
+                caption=f"🔬 Perfil de {seconds}s ({self.tracer.slow_count} updates lentos desde o início)"
+            )
+        except Exception as e:
+            logger.error(f"Erro ao gerar perfil: {e}")
+            await message.reply_text(f"❌ Erro ao gerar perfil: {str(e)}")
+        finally:
+            self._profiling = False
+    
     async def handle_message(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Processa mensagens do grupo"""
         if update.message and update.message.text:
-            user = update.effective_user
-            chat = update.effective_chat
-            
-            logger.info(f"[DEBUG] Mensagem recebida de {user.first_name} ({user.id}) no chat {chat.id}: {update.message.text[:50]}...")
-            
+            reason = self.flood_check(update)
+            if reason is not None:
+                if reason != 'burst':
+                    await self.restrict_flooder(context.bot, update.effective_chat.id, update.effective_user)
+                return
             try:
-                # Adicionar usuário se não existir
-                self.add_user(user.id, user.username, user.first_name, user.last_name)
-                
-                # Registrar mensagem
-                self.log_message(user.id, update.message.text, chat.id)
-                logger.info(f"[DEBUG] Mensagem processada e logada com sucesso")
+                self.log_text_message(update)
             except Exception as e:
                 logger.error(f"[ERROR] Erro ao processar mensagem: {e}")
                 raise
     
+    def write_buffer_dropped(self, reason, count, user_ids):
+        """Chamado pelo buffer ao descartar registros: os usuários perdidos voltam a ser gravados"""
+        for user_id in user_ids:
+            self.user_cache.invalidate(user_id)
+        self.metrics.write_buffer_dropped.inc(reason, amount=count)
+    
+    def log_text_message(self, update):
+        """Enfileira usuário (só se mudou) e mensagem, gravados em lote pelo buffer"""
+        user = update.effective_user
+        chat = update.effective_chat
+        if self.user_cache.should_write(user.id, user.username, user.first_name, user.last_name):
+            self.write_buffer.add_user(user.id, user.username, user.first_name, user.last_name)
+        self.write_buffer.add_message(user.id, update.message.text, chat.id)
+        logger.debug(
+            "Mensagem de %s (%s) no chat %s enfileirada (fila: %s)",
+            user.first_name, user.id, chat.id, self.write_buffer.depth, extra=HOT
+        )
+    
+    def flood_check(self, update):
+        """Motivo para não registrar a mensagem (flood/repetição), ou None"""
+        user = update.effective_user
+        if user is None or user.id in ADMIN_IDS:
+            return None
+        chat = update.effective_chat
+        reason = self.flood_guard.check(chat.id, user.id, update.message.text)
+        if reason is not None:
+            self.metrics.flood_messages.inc(reason)
+            if reason != 'burst':
+                logger.warning(f"Flood de {user.first_name} ({user.id}) no chat {chat.id} ({reason}): mensagens não serão registradas")
+        return reason
+    
+    async def restrict_flooder(self, bot, chat_id, user):
+        """Silencia o autor de uma nova rajada, se configurado para o grupo"""
+        mute_seconds = self.flood_guard.limits_for(chat_id).mute_seconds
+        if mute_seconds <= 0:
+            return
+        try:
+            await bot.restrict_chat_member(
+                chat_id,
+                user.id,
+                ChatPermissions(can_send_messages=False),
+                until_date=int(time.time()) + mute_seconds
+            )
+            logger.info(f"{user.first_name} ({user.id}) silenciado por {mute_seconds}s no chat {chat_id}")
+        except Exception as e:
+            logger.error(f"Erro ao silenciar {user.id} no chat {chat_id}: {e}")
+    
+    def update_priority(self, update):
+        """Classe de prioridade do update (índice em PRIORITIES)"""
+        user = getattr(update, 'effective_user', None)
+        message = getattr(update, 'effective_message', None)
+        is_command = getattr(update, 'callback_query', None) is not None or bool(
+            message and message.text and message.text.startswith('/')
+        )
+        if is_command and user and user.id in ADMIN_IDS:
+            return PRIORITIES.index('admin')
+        if message and message.new_chat_members:
+            return PRIORITIES.index('join')
+        if is_command:
+            return PRIORITIES.index('command')
+        return PRIORITIES.index('message')
+    
+    def shed_update(self, update):
+        """Caminho reduzido sob carga: só registra a mensagem (amostrada), sem passar pelos handlers"""
+        try:
+            if not (update.message and update.message.text) or self.flood_check(update) is not None:
+                return
+            if random.random() < UPDATE_SHED_SAMPLE:
+                self.log_text_message(update)
+        except Exception as e:
+            logger.error(f"Erro ao registrar mensagem adiada: {e}")
+    
     def run(self):
         """Inicia o bot"""
         if not BOT_TOKEN:
             logger.error("Token do bot não encontrado! Verifique o arquivo .env")
             return
         
+        webhook = ENVIRONMENT == 'production'
+        application = self.build_application(webhook=webhook)
+        
+        logger.info("🎯 Bot Auge Traders iniciado com sucesso!")
+        logger.info(f"Bot configurado para grupos: {GROUP_CHAT_ID}, {DUVIDAS_GROUP_CHAT_ID}")
+        
+        if METRICS_PORT:
+            MetricsServer(self.metrics, METRICS_PORT, token=METRICS_TOKEN).start()
+
+        # Escolher método de execução baseado no ambiente
+        if webhook:
+            logger.info("🚀 Iniciando bot em modo WEBHOOK (Railway)")
+            self.run_webhook(application)
+        else:
+            logger.info("🔄 Iniciando bot em modo POLLING (desenvolvimento)")
+            self.run_polling(application)
+    
+    def build_application(self, webhook=False):
+        """Cria a Application com todos os handlers e jobs registrados"""
+        if webhook:
+            # Loop único e permanente do modo webhook. Precisa existir antes da
+            # Application para que a update_queue fique associada a ele.
+            self.webhook_loop = asyncio.new_event_loop()
+            asyncio.set_event_loop(self.webhook_loop)
+        
+        # O semáforo do PTB (e, no Python 3.9, qualquer primitiva do asyncio) fica
+        # associado ao loop atual na criação: por isso o processador nasce aqui
+        self.update_processor = PriorityUpdateProcessor(
+            classify=self.update_priority,
+            shed=self.shed_update,
+            duplicate=self.is_duplicate_update,
+            concurrency=UPDATE_CONCURRENCY,
+            queue_size=UPDATE_QUEUE_SIZE,
+            shed_depth=UPDATE_SHED_DEPTH,
+            metrics=self.metrics
+        )
+        for priority in PRIORITIES:
+            self.metrics.queue_depth.set_function(functools.partial(self.update_processor.depth_of, priority), f'inbound_{priority}')
+        
         # Configurar application com timeouts mais robustos e retry
-        application = (
+        builder = (
             Application.builder()
             .token(BOT_TOKEN)
-            .read_timeout(30)
-            .write_timeout(30)
-            .connect_timeout(30)
-            .pool_timeout(30)
-            .get_updates_read_timeout(30)
-            .build()
+            .request(MetricsRequest(
+                self.metrics,
+                connection_pool_size=256,
+                read_timeout=30,
+                write_timeout=30,
+                connect_timeout=30,
+                pool_timeout=30
+            ))
+            .get_updates_request(HTTPXRequest(connection_pool_size=1, read_timeout=30))
+            .concurrent_updates(self.update_processor)
+            .post_init(self.on_start)
+            .post_stop(self.on_stop)
+            .post_shutdown(self.on_shutdown)
         )
-        
-        # Configurar Flask para webhook (Railway)
-        if ENVIRONMENT == 'production':
-            self.setup_flask_webhook(application)
+        if TELEGRAM_API_BASE_URL:
+            builder = builder.base_url(TELEGRAM_API_BASE_URL)
+        application = builder.build()
         
         # Handlers de comandos
         application.add_handler(CommandHandler("start", self.start_command))
         application.add_handler(CommandHandler("stats", self.admin_stats))
+        application.add_handler(CommandHandler("rebuild_stats", self.cmd_rebuild_stats))
+        application.add_handler(CommandHandler("profile", self.cmd_profile))
+        application.add_handler(CommandHandler("buscar", self.cmd_search))
+        application.add_handler(CommandHandler("export", self.cmd_export))
+        application.add_handler(CommandHandler("ranking", self.cmd_ranking))
+        application.add_handler(CommandHandler("horarios", self.cmd_activity_hours))
+        application.add_handler(CommandHandler("agendar", self.cmd_schedule_post))
+        application.add_handler(CommandHandler("agendamentos", self.cmd_list_scheduled_posts))
+        application.add_handler(CommandHandler("desagendar", self.cmd_unschedule_post))
+        application.add_handler(CallbackQueryHandler(self.search_callback, pattern=r'^buscar:'))
         
         # Handlers de mensagens predefinidas (apenas admins)
         application.add_handler(CommandHandler("morning", self.cmd_morning_alert))
@@ -760,6 +1790,7 @@ Bem-vindo ao nosso grupo! 🎯
         application.add_handler(CommandHandler("weekend", self.cmd_weekend))
         application.add_handler(CommandHandler("motivacao_geral", self.cmd_motivation))
         application.add_handler(CommandHandler("mensagens", self.cmd_list_messages))
+        application.add_handler(CommandHandler("reload_templates", self.cmd_reload_templates))
         
         # Handlers de reunião
         application.add_handler(CommandHandler("set_meeting", self.cmd_set_meeting))
@@ -771,48 +1802,164 @@ Bem-vindo ao nosso grupo! 🎯
         # Handler para todas as mensagens (logging)
         application.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, self.handle_message))
         
+        # Medir duração e erros de todos os handlers e registrar os updates lentos
+        self.tracer.instrument_handlers(application)
+        self.metrics.instrument_handlers(application)
+        self.metrics.queue_depth.set_function(application.update_queue.qsize, 'updates')
+        
+        # Marca o tempo até o primeiro update (grupo -1: roda antes dos demais, sem bloqueá-los)
+        application.add_handler(TypeHandler(Update, self.mark_first_update), group=-1)
+        
+        # Updates repetidos são descartados pelo processador de updates, na chegada
+        # (antes da fila por prioridade), sem passar por nenhum handler
+        self.sync_update_watermark()
+        application.job_queue.run_repeating(
+            self.metrics.track_job(self.update_watermark_job, 'update_watermark'),
+            interval=DEDUP_SYNC_SECONDS,
+            first=DEDUP_SYNC_SECONDS,
+            name='update_watermark'
+        )
+        
         logger.info("Handlers configurados com sucesso")
         logger.info(f"Total de handlers registrados: {len(application.handlers[0])}")
         
+        # Lease de líder: tentativa imediata e renovação bem antes de expirar
+        self.leader.renew()
+        application.job_queue.run_repeating(
+            self.renew_leadership_job,
+            interval=max(LEADER_LEASE_SECONDS / 3, 1),
+            name='leader_lease'
+        )
+        
+        # Fila de envios: inicia o despachante e entrega o que ficou pendente antes do reinício
+        application.job_queue.run_repeating(
+            self.outbox_watchdog_job,
+            interval=30,
+            first=1,
+            name='outbox_watchdog'
+        )
+        if OUTBOX_FAILED_RETENTION_DAYS > 0:
+            application.job_queue.run_repeating(
+                self.metrics.track_job(self.outbox_cleanup_job, 'outbox_cleanup'),
+                interval=3600,
+                first=60,
+                name='outbox_cleanup'
+            )
+        
         # Configurar agendamento automático de reuniões
         self.setup_meeting_scheduler(application.job_queue)
         
-        logger.info("🎯 Bot Auge Traders iniciado com sucesso!")
-        logger.info(f"Bot configurado para grupos: {GROUP_CHAT_ID}, {DUVIDAS_GROUP_CHAT_ID}")
+        # Envios agendados: todos lidos de uma vez, com um único timer para o próximo vencimento
+        self.post_scheduler.load(self.load_scheduled_posts(), time.time())
+        self.arm_post_scheduler(application.job_queue)
+        logger.info(f"{len(self.post_scheduler)} envio(s) agendado(s) carregado(s)")
         
-        # Escolher método de execução baseado no ambiente
-        if ENVIRONMENT == 'production':
-            logger.info("🚀 Iniciando bot em modo WEBHOOK (Railway)")
-            self.run_webhook(application)
-        else:
-            logger.info("🔄 Iniciando bot em modo POLLING (desenvolvimento)")
-            self.run_polling(application)
+        # Compactação periódica das mensagens antigas
+        if MESSAGE_RETENTION_DAYS > 0:
+            application.job_queue.run_repeating(
+                self.metrics.track_job(self.leader_job(self.compact_messages_job, 'messages_retention'), 'messages_retention'),
+                interval=RETENTION_INTERVAL_HOURS * 3600,
+                first=60,
+                name='messages_retention'
+            )
+        
+        # Verificar alterações no arquivo de templates
+        if TEMPLATES_FILE:
+            application.job_queue.run_repeating(
+                self.metrics.track_job(self.check_templates_job, 'templates_reload'),
+                interval=60,
+                first=60,
+                name='templates_reload'
+            )
+        
+        return application
+    
+    async def on_start(self, application):
+        """Chamado pelo run_polling depois de application.initialize()"""
+        self.startup.mark("application inicializada")
+    
+    def is_duplicate_update(self, update):
+        """True se o update_id já foi tratado (chamado na chegada, antes da fila de admissão)"""
+        update_id = getattr(update, 'update_id', None)
+        if update_id is None:
+            return False
+        reason = self.dedup.check(update_id)
+        if reason is None:
+            return False
+        self.metrics.duplicate_updates.inc(reason)
+        logger.info(f"Update {update_id} repetido ignorado ({reason})")
+        return True
+    
+    def sync_update_watermark(self):
+        """Grava o maior update_id tratado e adota como piso o valor salvo até então"""
+        with self.db.transaction() as conn:
+            stored = sync_watermark(conn, self.dedup.highest)
+        self.dedup.adopt_floor(stored)
+    
+    async def update_watermark_job(self, context: ContextTypes.DEFAULT_TYPE):
+        await self.async_db.write(self.sync_update_watermark)
+    
+    async def mark_first_update(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Registra a fase 'primeiro update' uma única vez"""
+        if not self._first_update_seen:
+            self._first_update_seen = True
+            self.startup.mark("primeiro update recebido")
+    
+    async def outbox_watchdog_job(self, context: ContextTypes.DEFAULT_TYPE):
+        """Mantém o despachante da outbox rodando (também após reinícios e falhas)"""
+        if not self.outbox.running:
+            self.outbox.start(context.bot)
+    
+    async def outbox_cleanup_job(self, context: ContextTypes.DEFAULT_TYPE):
+        """Job periódico: apaga os envios com falha mais antigos que OUTBOX_FAILED_RETENTION_DAYS"""
+        removed = await self.async_db.write(self.outbox.prune_failed, OUTBOX_FAILED_RETENTION_DAYS * 86400)
+        if removed:
+            logger.info(f"Outbox: {removed} envio(s) com falha removido(s)")
+    
+    async def on_stop(self, application):
+        """Envia o que ainda está pendente enquanto o bot ainda pode falar com o Telegram"""
+        await self.join_aggregator.flush_all()
+        # O que não couber no prazo continua na outbox para o próximo início
+        await self.outbox.stop()
+    
+    async def on_shutdown(self, application):
+        """Grava os dados pendentes e fecha o banco quando a aplicação é encerrada"""
+        # Liberar o lease deixa outra réplica assumir sem esperar a expiração
+        self.leader.release()
+        self.sync_update_watermark()
+        self.write_buffer.close()
+        self.async_db.close()
+        self.db.close()
     
     def setup_flask_webhook(self, application):
         """Configura Flask para receber webhooks do Telegram"""
+        # Importado só aqui: o modo polling não precisa do Flask
+        from flask import Flask, request
+        
         self.flask_app = Flask(__name__)
         self.application = application
         
         @self.flask_app.route(f'/{BOT_TOKEN}', methods=['POST'])
         def webhook():
-            """Processa updates do webhook"""
+            """Valida o update e o coloca na fila da Application (responde na hora)"""
+            if WEBHOOK_SECRET and request.headers.get('X-Telegram-Bot-Api-Secret-Token') != WEBHOOK_SECRET:
+                logger.warning("Webhook recebido com secret token inválido")
+                return 'FORBIDDEN', 403
+            
+            update_data = request.get_json(force=True, silent=True)
+            if not isinstance(update_data, dict) or not isinstance(update_data.get('update_id'), int):
+                logger.warning("Webhook recebido com payload inválido")
+                return 'BAD REQUEST', 400
+            
             try:
-                update_data = request.get_json(force=True)
                 update = Update.de_json(update_data, self.application.bot)
-                
-                # Processar update de forma síncrona
-                import asyncio
-                loop = asyncio.new_event_loop()
-                asyncio.set_event_loop(loop)
-                loop.run_until_complete(self.application.process_update(update))
-                loop.close()
-                
-                return 'OK'
             except Exception as e:
-                logger.error(f"Erro ao processar webhook: {e}")
-                import traceback
-                logger.error(f"Traceback: {traceback.format_exc()}")
-                return 'ERROR', 500
+                logger.error(f"Erro ao decodificar update {update_data.get('update_id')}: {e}")
+                return 'BAD REQUEST', 400
+            
+            # Os handlers rodam no loop permanente; o Telegram não espera por eles
+            self.webhook_loop.call_soon_threadsafe(self.application.update_queue.put_nowait, update)
+            return 'OK'
         
         @self.flask_app.route('/health', methods=['GET'])
         def health_check():
@@ -835,46 +1982,86 @@ Bem-vindo ao nosso grupo! 🎯
                 "flask_ready": True,
                 "port": PORT
             }, 200
+        
+        @self.flask_app.route('/metrics', methods=['GET'])
+        def metrics():
+            """Métricas no formato do Prometheus (a porta é pública: exige METRICS_TOKEN)"""
+            if not METRICS_TOKEN:
+                return 'NOT FOUND', 404
+            if not metrics_authorized(request.headers.get('Authorization'), METRICS_TOKEN):
+                logger.warning("Pedido de /metrics sem token válido")
+                return 'UNAUTHORIZED', 401, {'WWW-Authenticate': 'Bearer'}
+            return self.metrics.render(), 200, {'Content-Type': METRICS_CONTENT_TYPE}
     
     def run_webhook(self, application):
         """Executa o bot usando webhook (Railway)"""
+        from werkzeug.serving import make_server
+        
+        # O loop permanente roda em uma thread própria; o servidor HTTP fica na principal
+        loop_thread = threading.Thread(target=self.webhook_loop.run_forever, name='webhook-loop', daemon=True)
+        loop_thread.start()
+        
+        # A Application se conecta ao Telegram enquanto o servidor HTTP sobe
+        started = asyncio.run_coroutine_threadsafe(self.start_webhook_application(application), self.webhook_loop)
+        
+        server = None
         try:
-            logger.info(f"Iniciando servidor Flask na porta {PORT}")
+            self.setup_flask_webhook(application)
+            server = make_server('0.0.0.0', PORT, self.flask_app, threaded=True)
+            self.startup.mark(f"servidor HTTP escutando na porta {PORT}")
             
-            # Configurar webhook em background após Flask estar rodando
-            def setup_webhook_background():
-                import time
-                time.sleep(5)  # Aguardar Flask estar totalmente operacional
-                
-                try:
-                    webhook_url = f"{WEBHOOK_URL}/{BOT_TOKEN}"
-                    logger.info(f"Configurando webhook em background: {webhook_url}")
-                    
-                    async def setup_webhook():
-                        await application.initialize()
-                        await application.start()
-                        await application.bot.set_webhook(url=webhook_url)
-                        logger.info("Webhook configurado com sucesso!")
-                    
-                    import asyncio
-                    asyncio.run(setup_webhook())
-                    
-                except Exception as e:
-                    logger.error(f"Erro ao configurar webhook em background: {e}")
+            # Porta aberta: o webhook pode ser registrado assim que a Application estiver pronta
+            asyncio.run_coroutine_threadsafe(self.register_webhook(application, started), self.webhook_loop)
             
-            # Iniciar configuração do webhook em thread separada
-            import threading
-            webhook_thread = threading.Thread(target=setup_webhook_background, daemon=True)
-            webhook_thread.start()
+            # SIGTERM (redeploy no Railway) deve passar pelo atexit para esvaziar o buffer
+            signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
             
-            # Iniciar Flask imediatamente (prioridade máxima)
-            logger.info("Flask iniciando imediatamente...")
-            self.flask_app.run(host='0.0.0.0', port=PORT, debug=False, threaded=True, use_reloader=False)
+            server.serve_forever()
             
         except Exception as e:
-            logger.error(f"Erro ao iniciar Flask: {e}")
+            logger.error(f"Erro ao iniciar servidor HTTP: {e}")
             import traceback
             logger.error(f"Traceback: {traceback.format_exc()}")
+        finally:
+            if server:
+                server.server_close()
+            self.stop_webhook_application(application)
+    
+    async def start_webhook_application(self, application):
+        """Inicializa a Application no loop permanente"""
+        await application.initialize()
+        await application.start()
+        self.startup.mark("application inicializada")
+    
+    async def register_webhook(self, application, started):
+        """Registra o webhook quando a Application (`started`) e o servidor HTTP estão prontos"""
+        try:
+            await asyncio.wrap_future(started)
+            
+            webhook_url = f"{WEBHOOK_URL}/{BOT_TOKEN}"
+            logger.info(f"Configurando webhook: {webhook_url}")
+            await application.bot.set_webhook(url=webhook_url, secret_token=WEBHOOK_SECRET or None)
+            self.startup.mark("webhook registrado")
+        except Exception as e:
+            logger.error(f"Erro ao configurar webhook: {e}")
+    
+    def stop_webhook_application(self, application):
+        """Encerra a Application (processando o que já está na fila) e o loop permanente"""
+        async def shutdown():
+            if application.running:
+                await application.stop()
+                if application.post_stop:
+                    await application.post_stop(application)
+            await application.shutdown()
+            if application.post_shutdown:
+                await application.post_shutdown(application)
+        
+        try:
+            asyncio.run_coroutine_threadsafe(shutdown(), self.webhook_loop).result(timeout=30)
+        except Exception as e:
+            logger.error(f"Erro ao encerrar a Application: {e}")
+        finally:
+            self.webhook_loop.call_soon_threadsafe(self.webhook_loop.stop)
     
     def run_polling(self, application):
         """Executa o bot usando polling (desenvolvimento)"""
@@ -888,7 +2075,7 @@ Bem-vindo ao nosso grupo! 🎯
                 # Usar configurações mais específicas para evitar conflitos
                 application.run_polling(
                     drop_pending_updates=True,
-                    allowed_updates=['message', 'chat_member'],
+                    allowed_updates=['message', 'chat_member', 'callback_query'],
                     timeout=30,
                     poll_interval=2.0,
                     bootstrap_retries=3
@@ -919,6 +2106,12 @@ Bem-vindo ao nosso grupo! 🎯
                 logger.error(f"Traceback completo: {traceback.format_exc()}")
                 break
 
-if __name__ == '__main__':
+def main():
+    """Ponto de entrada: inicia o logging e roda o bot"""
+    start_logging()
     bot = AugeTradersBot()
-    bot.run()
\ No newline at end of file
+    bot.run()
+
+
+if __name__ == '__main__':
+    main()
\ No newline at end of file
@@ -0,0 +1,84 @@
+import asyncio
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+
+def retry_after_seconds(error):
+    """Extrai o tempo de espera (em segundos) de um RetryAfter"""
+    retry_after = error.retry_after
+    if hasattr(retry_after, 'total_seconds'):
+        return retry_after.total_seconds()
+    return float(retry_after)
+
+
+class TokenBucket:
+    """Limitador token bucket para uso em corrotinas.
+
+    Libera até `capacity` envios de uma vez e repõe `rate` tokens por segundo.
+    `pause()` bloqueia o bucket inteiro (usado quando o Telegram manda esperar).
+    """
+
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self._paused_until = 0.0
+        # Criado no primeiro uso, dentro do event loop que vai usá-lo
+        self._lock = None
+
+    def pause(self, seconds):
+        """Suspende a liberação de tokens por `seconds` segundos"""
+        self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+
+    async def acquire(self):
+        """Aguarda até haver um token disponível e o consome"""
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                if now < self._paused_until:
+                    await asyncio.sleep(self._paused_until - now)
+                    continue
+
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+
+class SendLimiter:
+    """Limites de envio do Telegram, compartilhados por todos os envios do bot.
+
+    Um bucket global limita o total de mensagens por segundo e um bucket por
+    chat respeita o limite de mensagens por minuto em grupos. Um `RetryAfter`
+    pausa o bucket global pelo tempo pedido.
+    """
+
+    def __init__(self, global_rate=25, per_chat_per_minute=20):
+        self.global_bucket = TokenBucket(rate=global_rate, capacity=global_rate)
+        self.per_chat_per_minute = per_chat_per_minute
+        self._chat_buckets = {}
+
+    def _chat_bucket(self, chat_id):
+        bucket = self._chat_buckets.get(chat_id)
+        if bucket is None:
+            bucket = TokenBucket(rate=self.per_chat_per_minute / 60, capacity=3)
+            self._chat_buckets[chat_id] = bucket
+        return bucket
+
+    async def throttle(self, chat_id):
+        """Aguarda a vez de enviar para `chat_id` (limite do chat e limite global)"""
+        await self._chat_bucket(chat_id).acquire()
+        await self.global_bucket.acquire()
+
+    def pause(self, seconds):
+        """Suspende todos os envios (RetryAfter do Telegram)"""
+        self.global_bucket.pause(seconds)
@@ -0,0 +1,174 @@
+import asyncio
+import contextvars
+import functools
+import logging
+import queue
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+# Upsert de usuário: preserva join_date/is_active e só reescreve a linha se algo mudou
+UPSERT_USER_SQL = '''
+    INSERT INTO users (user_id, username, first_name, last_name)
+    VALUES (?, ?, ?, ?)
+    ON CONFLICT(user_id) DO UPDATE SET
+        username = excluded.username,
+        first_name = excluded.first_name,
+        last_name = excluded.last_name
+    WHERE users.username IS NOT excluded.username
+       OR users.first_name IS NOT excluded.first_name
+       OR users.last_name IS NOT excluded.last_name
+'''
+
+# Pragmas aplicados em toda conexão nova
+CONNECTION_PRAGMAS = (
+    'PRAGMA synchronous = NORMAL',     # Seguro com WAL e evita fsync a cada commit
+    'PRAGMA cache_size = -20000',      # ~20 MB de cache de páginas por conexão
+    'PRAGMA mmap_size = 268435456',    # Até 256 MB mapeados em memória
+    'PRAGMA temp_store = MEMORY',
+    'PRAGMA busy_timeout = 5000',
+)
+
+
+class Database:
+    """Gerenciador de conexões SQLite persistentes.
+
+    Mantém um pequeno pool de conexões reaproveitadas entre chamadas (e entre
+    threads), com WAL ativado para que leituras como o /stats não bloqueiem
+    as escritas. Cada conexão guarda em cache os statements preparados.
+    `functions` são tuplas (nome, nº de argumentos, função) registradas como
+    funções SQL em toda conexão. `observer(operação, segundos)`, se definido,
+    é chamado ao devolver cada conexão ('connection' ou 'transaction').
+    """
+
+    def __init__(self, db_path, pool_size=4, cached_statements=256, functions=(), observer=None):
+        self.db_path = db_path
+        self.pool_size = pool_size
+        self.cached_statements = cached_statements
+        self.functions = tuple(functions)
+        self.observer = observer
+
+        self._pool = queue.LifoQueue()
+        self._connections = []
+        self._lock = threading.Lock()
+        self._closed = False
+
+        # journal_mode é persistente no arquivo; basta ativar uma vez
+        with self.connection() as conn:
+            mode = conn.execute('PRAGMA journal_mode = WAL').fetchone()[0]
+        logger.info(f"Banco de dados aberto em {db_path} (journal_mode={mode}, pool={pool_size})")
+
+    def _connect(self):
+        """Abre uma nova conexão já com os pragmas ajustados"""
+        conn = sqlite3.connect(
+            self.db_path,
+            check_same_thread=False,
+            cached_statements=self.cached_statements
+        )
+        for pragma in CONNECTION_PRAGMAS:
+            conn.execute(pragma)
+        for name, num_params, func in self.functions:
+            conn.create_function(name, num_params, func, deterministic=True)
+        return conn
+
+    def _acquire(self):
+        """Retira uma conexão do pool, criando uma nova se houver espaço"""
+        try:
+            return self._pool.get_nowait()
+        except queue.Empty:
+            pass
+
+        with self._lock:
+            if self._closed:
+                raise sqlite3.ProgrammingError("Banco de dados já foi fechado")
+            if len(self._connections) < self.pool_size:
+                conn = self._connect()
+                self._connections.append(conn)
+                return conn
+
+        return self._pool.get()
+
+    def _release(self, conn):
+        """Devolve a conexão ao pool, descartando transações abertas"""
+        if conn.in_transaction:
+            conn.rollback()
+        self._pool.put(conn)
+
+    @contextmanager
+    def _borrow(self, operation):
+        start = time.perf_counter()
+        conn = self._acquire()
+        try:
+            yield conn
+        finally:
+            self._release(conn)
+            if self.observer:
+                self.observer(operation, time.perf_counter() - start)
+
+    @contextmanager
+    def connection(self):
+        """Empresta uma conexão do pool (para leituras)"""
+        with self._borrow('connection') as conn:
+            yield conn
+
+    @contextmanager
+    def transaction(self):
+        """Empresta uma conexão e executa o bloco em uma transação (commit/rollback)"""
+        with self._borrow('transaction') as conn:
+            with conn:
+                yield conn
+
+    def close(self):
+        """Fecha todas as conexões do pool"""
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+            connections, self._connections = self._connections, []
+
+        for conn in connections:
+            try:
+                conn.close()
+            except Exception as e:
+                logger.error(f"Erro ao fechar conexão com o banco: {e}")
+        logger.info("Conexões com o banco de dados encerradas")
+
+
+class AsyncDatabase:
+    """Fachada assíncrona para executar operações do banco fora do event loop.
+
+    Todas as escritas passam por uma única thread dedicada, o que preserva a
+    ordem em que foram solicitadas; leituras usam um pequeno pool próprio.
+    """
+
+    def __init__(self, read_workers=2):
+        self._writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix='db-writer')
+        self._readers = ThreadPoolExecutor(max_workers=read_workers, thread_name_prefix='db-reader')
+
+    def submit_write(self, fn, *args, **kwargs):
+        """Agenda uma escrita na thread de escrita (para código síncrono)"""
+        return self._writer.submit(fn, *args, **kwargs)
+
+    @staticmethod
+    async def _run(executor, fn, args, kwargs):
+        # Propaga o contexto (ex.: rastreamento do update) para a thread, como asyncio.to_thread
+        loop = asyncio.get_running_loop()
+        context = contextvars.copy_context()
+        return await loop.run_in_executor(executor, functools.partial(context.run, fn, *args, **kwargs))
+
+    async def write(self, fn, *args, **kwargs):
+        """Executa uma escrita na thread de escrita sem bloquear o event loop"""
+        return await self._run(self._writer, fn, args, kwargs)
+
+    async def read(self, fn, *args, **kwargs):
+        """Executa uma leitura no pool de leitura sem bloquear o event loop"""
+        return await self._run(self._readers, fn, args, kwargs)
+
+    def close(self):
+        """Aguarda as operações pendentes e encerra as threads"""
+        self._writer.shutdown(wait=True)
+        self._readers.shutdown(wait=True)
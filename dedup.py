@@ -0,0 +1,103 @@
+"""Descarte de updates repetidos pelo `update_id`.
+
+O Telegram reenvia um update quando o webhook demora ou responde com erro,
+e durante um deploy duas instâncias podem receber o mesmo update. O
+`UpdateDeduplicator` é consultado antes de qualquer handler:
+
+- caminho rápido: os últimos `capacity` ids vistos, em um anel (deque +
+  set) com memória limitada
+- marca d'água: o maior `update_id` tratado, gravado na tabela
+  `update_watermark` a cada poucos segundos. Ao iniciar (e a cada
+  gravação) a instância adota o valor já salvo como piso: ids até ele já
+  foram tratados por esta ou por outra réplica.
+
+O piso é sempre o valor lido do banco na gravação anterior, então updates
+fora de ordem que chegam poucos segundos depois dos seguintes não são
+descartados. Como o Telegram volta a sortear os ids depois de uma semana
+sem updates, uma marca mais antiga que isso é ignorada.
+"""
+import logging
+import time
+from collections import deque
+
+logger = logging.getLogger(__name__)
+
+# Sem updates por uma semana, o próximo update_id é aleatório
+WATERMARK_MAX_AGE = 7 * 86400
+
+WATERMARK_NAME = 'updates'
+
+
+def create_dedup_tables(cursor):
+    """Cria a tabela da marca d'água de updates"""
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS update_watermark (
+            name TEXT PRIMARY KEY,
+            update_id INTEGER NOT NULL,
+            updated_at REAL NOT NULL
+        ) WITHOUT ROWID
+    ''')
+
+
+def sync_watermark(conn, update_id, now=None):
+    """Grava `update_id` se for maior que o salvo; retorna o valor salvo antes (ou None)"""
+    now = time.time() if now is None else now
+    row = conn.execute(
+        'SELECT update_id, updated_at FROM update_watermark WHERE name = ?', (WATERMARK_NAME,)
+    ).fetchone()
+    stored = row[0] if row and now - row[1] <= WATERMARK_MAX_AGE else None
+
+    if update_id is not None and (stored is None or update_id > stored):
+        conn.execute('''
+            INSERT INTO update_watermark (name, update_id, updated_at) VALUES (?, ?, ?)
+            ON CONFLICT(name) DO UPDATE SET update_id = excluded.update_id, updated_at = excluded.updated_at
+        ''', (WATERMARK_NAME, update_id, now))
+    return stored
+
+
+class UpdateDeduplicator:
+    """Anel dos ids recentes mais o piso vindo da marca d'água persistida"""
+
+    def __init__(self, capacity=10000):
+        self.capacity = capacity
+        self.floor = None
+        self.highest = None
+        self.duplicates_recent = 0
+        self.duplicates_watermark = 0
+        self._ring = deque()
+        self._seen = set()
+        self._last_seen_at = None
+
+    @property
+    def duplicates(self):
+        return self.duplicates_recent + self.duplicates_watermark
+
+    def check(self, update_id):
+        """Registra o id; retorna None se for novo ou o motivo ('recent'/'watermark') se repetido"""
+        now = time.monotonic()
+        if self._last_seen_at is not None and now - self._last_seen_at > WATERMARK_MAX_AGE:
+            # Os ids podem ter sido sorteados de novo: esquecer o que foi visto
+            self.floor = self.highest = None
+            self._ring.clear()
+            self._seen.clear()
+        self._last_seen_at = now
+
+        if update_id in self._seen:
+            self.duplicates_recent += 1
+            return 'recent'
+        if self.floor is not None and update_id <= self.floor:
+            self.duplicates_watermark += 1
+            return 'watermark'
+
+        self._seen.add(update_id)
+        self._ring.append(update_id)
+        if len(self._ring) > self.capacity:
+            self._seen.discard(self._ring.popleft())
+        if self.highest is None or update_id > self.highest:
+            self.highest = update_id
+        return None
+
+    def adopt_floor(self, stored):
+        """Usa a marca lida do banco como piso (nunca recua)"""
+        if stored is not None and (self.floor is None or stored > self.floor):
+            self.floor = stored
@@ -0,0 +1,251 @@
+"""Exportação de mensagens e usuários para CSV ou JSONL compactado.
+
+As linhas são lidas em lotes por chave (`id > último lido ORDER BY id
+LIMIT n`), cada lote em uma consulta curta: a memória usada não depende do
+tamanho da tabela e nenhuma transação de leitura fica aberta durante a
+exportação inteira. Mensagens vêm das partições mensais do arquivo
+compactado e da tabela quente (nessa ordem, cada uma por id).
+
+Exportações incrementais guardam o último cursor exportado na tabela
+`export_state`, por nome de consumidor. Para mensagens o cursor é o id;
+para usuários é a ordem de cadastro (`user_export_order`, preenchida por
+trigger), já que o `user_id` do Telegram não cresce com o tempo e um membro
+novo com id menor ficaria de fora.
+
+Uso pela linha de comando:
+    python exporter.py messages --format jsonl --output mensagens.jsonl.gz --incremental
+    python exporter.py users --format csv --output usuarios.csv
+"""
+import argparse
+import csv
+import gzip
+import json
+import logging
+import sys
+from collections import namedtuple
+from datetime import datetime, timedelta
+
+from retention import ARCHIVE_PREFIX, list_archive_tables
+
+logger = logging.getLogger(__name__)
+
+FORMATS = ('csv', 'jsonl')
+
+# tabela -> (colunas exportadas, coluna do cursor, coluna de data, fontes na ordem de leitura)
+# Cada fonte é (tabela, FROM, colunas lidas); a primeira coluna lida é o cursor e não vai para o arquivo.
+# ARCHIVE_PREFIX representa todas as partições do arquivo, da mais antiga para a mais recente
+EXPORTS = {
+    'messages': (
+        ('id', 'user_id', 'group_id', 'message_date', 'message_text'),
+        'id', 'message_date',
+        (
+            (ARCHIVE_PREFIX, ARCHIVE_PREFIX, 'id, id, user_id, group_id, message_date, unzip_text(message_text)'),
+            ('messages', 'messages', 'id, id, user_id, group_id, message_date, message_text'),
+        )
+    ),
+    'users': (
+        ('user_id', 'username', 'first_name', 'last_name', 'join_date', 'is_active'),
+        'seq', 'join_date',
+        (
+            ('users', 'users JOIN user_export_order ON member_id = user_id',
+             'seq, user_id, username, first_name, last_name, join_date, is_active'),
+        )
+    ),
+}
+
+ExportFilters = namedtuple('ExportFilters', 'date_from date_to chat_id user_id', defaults=(None, None, None, None))
+
+ExportResult = namedtuple('ExportResult', 'path rows last_id')  # last_id: último cursor exportado
+
+
+def create_export_tables(cursor):
+    """Cria a tabela com o último cursor exportado por consumidor e a ordem de cadastro dos usuários"""
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS export_state (
+            name TEXT PRIMARY KEY,
+            last_id INTEGER NOT NULL,
+            exported_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        ) WITHOUT ROWID
+    ''')
+
+    exists = cursor.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'user_export_order'"
+    ).fetchone()
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS user_export_order (
+            seq INTEGER PRIMARY KEY AUTOINCREMENT,
+            member_id INTEGER NOT NULL UNIQUE
+        )
+    ''')
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS users_export_order AFTER INSERT ON users
+        BEGIN
+            INSERT OR IGNORE INTO user_export_order (member_id) VALUES (NEW.user_id);
+        END
+    ''')
+
+    if exists is None:
+        # Usuários já cadastrados entram em ordem de user_id, a ordem do cursor antigo:
+        # os marcadores gravados (user_id) são convertidos sem perder nem repetir ninguém
+        cursor.execute('INSERT INTO user_export_order (member_id) SELECT user_id FROM users ORDER BY user_id')
+        cursor.execute('''
+            UPDATE export_state SET last_id = (
+                SELECT COALESCE(MAX(seq), 0) FROM user_export_order WHERE member_id <= export_state.last_id
+            )
+            WHERE name LIKE 'users:%'
+        ''')
+
+
+def state_key(table, name='default'):
+    return f'{table}:{name}'
+
+
+def get_last_exported_id(conn, key):
+    row = conn.execute('SELECT last_id FROM export_state WHERE name = ?', (key,)).fetchone()
+    return row[0] if row else 0
+
+
+def set_last_exported_id(conn, key, last_id):
+    conn.execute('''
+        INSERT INTO export_state (name, last_id) VALUES (?, ?)
+        ON CONFLICT(name) DO UPDATE SET last_id = excluded.last_id, exported_at = CURRENT_TIMESTAMP
+    ''', (key, last_id))
+
+
+def parse_date(value):
+    """'AAAA-MM-DD' -> 'AAAA-MM-DD 00:00:00' (UTC, mesmo formato gravado no banco)"""
+    return datetime.strptime(value, '%Y-%m-%d').strftime('%Y-%m-%d %H:%M:%S')
+
+
+def _where(table, filters, date_column):
+    clauses, params = [], []
+    if filters.date_from:
+        clauses.append(f'{date_column} >= ?')
+        params.append(parse_date(filters.date_from))
+    if filters.date_to:
+        # Data final inclusiva
+        end = datetime.strptime(filters.date_to, '%Y-%m-%d') + timedelta(days=1)
+        clauses.append(f'{date_column} < ?')
+        params.append(end.strftime('%Y-%m-%d %H:%M:%S'))
+    if filters.user_id is not None:
+        clauses.append('user_id = ?')
+        params.append(filters.user_id)
+    if filters.chat_id is not None and table == 'messages':
+        clauses.append('group_id = ?')
+        params.append(filters.chat_id)
+    return clauses, params
+
+
+def iter_rows(db, table, filters=ExportFilters(), since_id=0, chunk_size=5000):
+    """Gera (cursor, linha) da exportação, lote a lote, com cursor maior que `since_id`"""
+    _, cursor_column, date_column, sources = EXPORTS[table]
+    clauses, params = _where(table, filters, date_column)
+
+    for from_clause, columns in _resolve_sources(db, sources):
+        sql = f'''
+            SELECT {columns} FROM {from_clause}
+            WHERE {' AND '.join([f'{cursor_column} > ?'] + clauses)}
+            ORDER BY {cursor_column} LIMIT ?
+        '''
+        last_id = since_id
+        while True:
+            with db.connection() as conn:
+                rows = conn.execute(sql, [last_id] + params + [chunk_size]).fetchall()
+            if not rows:
+                break
+            for row in rows:
+                yield row[0], row[1:]
+            last_id = rows[-1][0]
+            if len(rows) < chunk_size:
+                break
+
+
+def _resolve_sources(db, sources):
+    """(FROM, colunas) das fontes que existem no banco, com o arquivo expandido em partições"""
+    resolved = []
+    with db.connection() as conn:
+        for source, from_clause, columns in sources:
+            if source == ARCHIVE_PREFIX:
+                resolved += [(table, columns) for table in list_archive_tables(conn)]
+            elif conn.execute("SELECT 1 FROM sqlite_master WHERE name = ?", (source,)).fetchone():
+                resolved.append((from_clause, columns))
+    return resolved
+
+
+def open_output(path):
+    """Arquivo de saída em texto, compactado com gzip quando termina em .gz"""
+    if path.endswith('.gz'):
+        return gzip.open(path, 'wt', encoding='utf-8', newline='')
+    return open(path, 'w', encoding='utf-8', newline='')
+
+
+def export(db, table, path, fmt='csv', filters=ExportFilters(), since_id=0, chunk_size=5000):
+    """Exporta `table` para `path`; retorna ExportResult com o total e o último cursor"""
+    if fmt not in FORMATS:
+        raise ValueError(f"Formato inválido: {fmt} (use {', '.join(FORMATS)})")
+    columns = EXPORTS[table][0]
+
+    total = 0
+    last_id = since_id
+    with open_output(path) as out:
+        if fmt == 'csv':
+            writer = csv.writer(out)
+            writer.writerow(columns)
+            write = writer.writerow
+        else:
+            def write(row):
+                out.write(json.dumps(dict(zip(columns, row)), ensure_ascii=False) + '\n')
+
+        for cursor, row in iter_rows(db, table, filters, since_id, chunk_size):
+            write(row)
+            total += 1
+            last_id = max(last_id, cursor)
+
+    logger.info(f"Exportação de {table}: {total} linhas em {path} (último cursor {last_id})")
+    return ExportResult(path, total, last_id)
+
+
+def main(argv=None):
+    from database import Database
+    from retention import SQL_FUNCTIONS
+
+    parser = argparse.ArgumentParser(description='Exporta mensagens ou usuários do bot')
+    parser.add_argument('table', choices=sorted(EXPORTS))
+    parser.add_argument('--format', choices=FORMATS, default='csv')
+    parser.add_argument('--output', help='arquivo de saída (.gz compacta); padrão: <tabela>.<formato>')
+    parser.add_argument('--from', dest='date_from', help='data inicial AAAA-MM-DD (UTC)')
+    parser.add_argument('--to', dest='date_to', help='data final AAAA-MM-DD (UTC, inclusiva)')
+    parser.add_argument('--chat', type=int, help='apenas mensagens deste chat')
+    parser.add_argument('--user', type=int, help='apenas este usuário')
+    parser.add_argument('--since-id', type=int, default=0, help='apenas cursores maiores que este (id da mensagem; ordem de cadastro do usuário)')
+    parser.add_argument('--incremental', action='store_true', help='continuar do último cursor exportado')
+    parser.add_argument('--state-name', default='default', help='nome do consumidor da exportação incremental')
+    parser.add_argument('--db', default='./data/bot.db')
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(
+        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+        level=logging.INFO
+    )
+    output = args.output or f'{args.table}.{args.format}' + ('.gz' if args.format == 'jsonl' else '')
+    filters = ExportFilters(args.date_from, args.date_to, args.chat, args.user)
+    db = Database(args.db, pool_size=1, functions=SQL_FUNCTIONS)
+    key = state_key(args.table, args.state_name)
+
+    try:
+        with db.transaction() as conn:
+            create_export_tables(conn.cursor())
+            since_id = get_last_exported_id(conn, key) if args.incremental else args.since_id
+
+        result = export(db, args.table, output, args.format, filters, since_id)
+
+        if args.incremental and result.rows:
+            with db.transaction() as conn:
+                set_last_exported_id(conn, key, result.last_id)
+    finally:
+        db.close()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,78 @@
+import asyncio
+import logging
+import time
+from collections import deque
+
+logger = logging.getLogger(__name__)
+
+
+class JoinBurstAggregator:
+    """Agrupa as boas-vindas de novos membros durante rajadas de entrada.
+
+    Com tráfego calmo (até `burst_threshold` entradas em `rate_window`
+    segundos no mesmo chat), `add` retorna True e a saudação individual é
+    enviada na hora. Acima disso, os membros são acumulados por `window`
+    segundos e `send_batch(bot, chat_id, members)` é chamado uma única vez
+    com todos eles.
+    """
+
+    def __init__(self, send_batch, window=10.0, burst_threshold=3, rate_window=60.0):
+        self.send_batch = send_batch
+        self.window = window
+        self.burst_threshold = burst_threshold
+        self.rate_window = rate_window
+        # Só precisamos saber se houve mais de `burst_threshold` entradas na janela
+        self._recent = {}
+        self._pending = {}
+        self._tasks = {}
+
+    @property
+    def pending_count(self):
+        """Membros aguardando a próxima saudação coletiva"""
+        return sum(len(members) for _, members in self._pending.values())
+
+    def add(self, bot, chat_id, members):
+        """Registra novos membros; retorna True se devem ser saudados individualmente agora"""
+        now = time.monotonic()
+        recent = self._recent.get(chat_id)
+        if recent is None:
+            recent = self._recent[chat_id] = deque(maxlen=self.burst_threshold + 1)
+        for _ in members:
+            recent.append(now)
+
+        if chat_id in self._pending:
+            self._pending[chat_id][1].extend(members)
+            return False
+
+        in_window = sum(1 for joined_at in recent if joined_at >= now - self.rate_window)
+        if in_window <= self.burst_threshold:
+            return True
+
+        logger.info(f"Rajada de entradas no chat {chat_id}: agrupando boas-vindas por {self.window}s")
+        self._pending[chat_id] = (bot, list(members))
+        self._tasks[chat_id] = asyncio.ensure_future(self._flush_later(chat_id))
+        return False
+
+    async def _flush_later(self, chat_id):
+        await asyncio.sleep(self.window)
+        await self._flush(chat_id)
+
+    async def _flush(self, chat_id):
+        """Envia a saudação coletiva pendente do chat"""
+        self._tasks.pop(chat_id, None)
+        pending = self._pending.pop(chat_id, None)
+        if not pending:
+            return
+
+        bot, members = pending
+        try:
+            await self.send_batch(bot, chat_id, members)
+        except Exception as e:
+            logger.error(f"Erro ao enviar boas-vindas coletivas no chat {chat_id}: {e}")
+
+    async def flush_all(self):
+        """Envia imediatamente todas as saudações pendentes (usado no desligamento)"""
+        for task in self._tasks.values():
+            task.cancel()
+        for chat_id in list(self._pending):
+            await self._flush(chat_id)
@@ -0,0 +1,178 @@
+"""Eleição de líder para os jobs agendados com várias réplicas.
+
+Só a instância que detém o lease executa os jobs marcados como exclusivos.
+O lease expira se não for renovado em `ttl` segundos, então outra réplica
+assume quando o líder cai. Há dois backends com a mesma interface
+(`acquire(nome, dono, ttl)` / `release(nome, dono)`):
+
+- `SqliteLeaseBackend`: linha na tabela `leases` do banco compartilhado
+- `FileLeaseBackend`: `flock` em um arquivo (réplicas na mesma máquina/volume)
+
+Cada execução diária também é registrada em `job_runs` com uma chave de
+idempotência (job + data), o que evita envio duplo mesmo se dois processos
+se acharem líderes ao mesmo tempo ou se o bot reiniciar perto do horário.
+"""
+import logging
+import os
+import socket
+import time
+import uuid
+
+logger = logging.getLogger(__name__)
+
+# Execuções registradas há mais tempo que isso são descartadas
+JOB_RUNS_RETENTION_SECONDS = 30 * 86400
+
+
+def default_holder_id():
+    """Identificador único desta instância"""
+    return f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+
+
+def create_lease_tables(cursor):
+    """Cria as tabelas de leases e de execuções de jobs"""
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS leases (
+            name TEXT PRIMARY KEY,
+            holder TEXT NOT NULL,
+            expires_at REAL NOT NULL
+        ) WITHOUT ROWID
+    ''')
+
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS job_runs (
+            run_key TEXT PRIMARY KEY,
+            holder TEXT NOT NULL,
+            started_at REAL NOT NULL,
+            status TEXT NOT NULL DEFAULT 'running'
+        ) WITHOUT ROWID
+    ''')
+
+
+class SqliteLeaseBackend:
+    """Lease guardado em uma linha da tabela `leases`"""
+
+    def __init__(self, db):
+        self.db = db
+
+    def acquire(self, name, holder, ttl):
+        """Obtém ou renova o lease; retorna True se `holder` é o dono"""
+        now = time.time()
+        with self.db.transaction() as conn:
+            # Só toma o lease se ele é nosso ou já expirou
+            conn.execute('''
+                INSERT INTO leases (name, holder, expires_at) VALUES (?, ?, ?)
+                ON CONFLICT(name) DO UPDATE SET
+                    holder = excluded.holder,
+                    expires_at = excluded.expires_at
+                WHERE leases.holder = excluded.holder OR leases.expires_at < ?
+            ''', (name, holder, now + ttl, now))
+            row = conn.execute('SELECT holder FROM leases WHERE name = ?', (name,)).fetchone()
+        return row is not None and row[0] == holder
+
+    def release(self, name, holder):
+        with self.db.transaction() as conn:
+            conn.execute('DELETE FROM leases WHERE name = ? AND holder = ?', (name, holder))
+
+
+class FileLeaseBackend:
+    """Lease representado por um `flock` exclusivo, liberado pelo SO se o processo morrer"""
+
+    def __init__(self, directory):
+        import fcntl  # Apenas POSIX
+
+        self._fcntl = fcntl
+        self.directory = directory
+        self._files = {}
+        os.makedirs(directory, exist_ok=True)
+
+    def acquire(self, name, holder, ttl):
+        if name in self._files:
+            return True
+
+        lock_file = open(os.path.join(self.directory, f'{name}.lock'), 'a+')
+        try:
+            self._fcntl.flock(lock_file.fileno(), self._fcntl.LOCK_EX | self._fcntl.LOCK_NB)
+        except OSError:
+            lock_file.close()
+            return False
+
+        lock_file.seek(0)
+        lock_file.truncate()
+        lock_file.write(holder)
+        lock_file.flush()
+        self._files[name] = lock_file
+        return True
+
+    def release(self, name, holder):
+        lock_file = self._files.pop(name, None)
+        if lock_file:
+            self._fcntl.flock(lock_file.fileno(), self._fcntl.LOCK_UN)
+            lock_file.close()
+
+
+class LeaderElector:
+    """Mantém o lease `name` enquanto `renew()` for chamado com frequência menor que `ttl`"""
+
+    def __init__(self, backend, name='scheduler', holder=None, ttl=30.0):
+        self.backend = backend
+        self.name = name
+        self.holder = holder or default_holder_id()
+        self.ttl = ttl
+        self._expires_at = 0.0
+
+    @property
+    def is_leader(self):
+        return time.time() < self._expires_at
+
+    def renew(self):
+        """Tenta obter/renovar o lease; retorna se esta instância é a líder"""
+        was_leader = self.is_leader
+        try:
+            acquired = self.backend.acquire(self.name, self.holder, self.ttl)
+        except Exception as e:
+            logger.error(f"Erro ao renovar lease '{self.name}': {e}")
+            acquired = False
+
+        if acquired:
+            self._expires_at = time.time() + self.ttl
+        else:
+            self._expires_at = 0.0
+
+        if acquired and not was_leader:
+            logger.info(f"Instância {self.holder} assumiu o lease '{self.name}'")
+        elif was_leader and not acquired:
+            logger.warning(f"Instância {self.holder} perdeu o lease '{self.name}'")
+        return acquired
+
+    def release(self):
+        """Libera o lease para outra réplica assumir imediatamente"""
+        if not self._expires_at:
+            return
+        self._expires_at = 0.0
+        try:
+            self.backend.release(self.name, self.holder)
+            logger.info(f"Lease '{self.name}' liberado por {self.holder}")
+        except Exception as e:
+            logger.error(f"Erro ao liberar lease '{self.name}': {e}")
+
+
+class JobRunLog:
+    """Registro de execuções com chave de idempotência na tabela `job_runs`"""
+
+    def __init__(self, db):
+        self.db = db
+
+    def claim(self, run_key, holder):
+        """Reserva a execução; retorna False se ela já foi feita (ou está em andamento)"""
+        now = time.time()
+        with self.db.transaction() as conn:
+            conn.execute('DELETE FROM job_runs WHERE started_at < ?', (now - JOB_RUNS_RETENTION_SECONDS,))
+            cursor = conn.execute('''
+                INSERT OR IGNORE INTO job_runs (run_key, holder, started_at) VALUES (?, ?, ?)
+            ''', (run_key, holder, now))
+            return cursor.rowcount == 1
+
+    def finish(self, run_key, status):
+        with self.db.transaction() as conn:
+            conn.execute('UPDATE job_runs SET status = ? WHERE run_key = ?', (status, run_key))
@@ -0,0 +1,148 @@
+"""Configuração de logging fora do event loop.
+
+`setup_logging` troca o handler síncrono do `basicConfig` por um
+`QueueHandler`: o event loop só enfileira o registro e uma thread
+(`QueueListener`) formata e escreve. A mensagem é montada somente nessa
+thread, então chamadas no estilo `logger.debug("... %s", valor)` não custam
+formatação no caminho do update.
+
+Linhas de diagnóstico por update devem ser marcadas com `extra=HOT`; elas
+passam por amostragem (`hot_sample`) e por um limite por segundo
+(`hot_rate`). A próxima linha aceita informa quantas foram omitidas.
+"""
+import atexit
+import json
+import logging
+import queue
+import random
+import sys
+import threading
+import time
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener
+
+TEXT_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+
+# Marca para logs de diagnóstico emitidos a cada update
+HOT = {'hot': True}
+
+# Atributos padrão de LogRecord; o resto veio de `extra` e vai para o JSON
+_RECORD_ATTRS = frozenset(vars(logging.LogRecord('', 0, '', 0, '', (), None))) | {'message', 'asctime', 'hot'}
+
+
+class JsonFormatter(logging.Formatter):
+    """Uma linha JSON por registro, incluindo os campos passados em `extra`"""
+
+    def format(self, record):
+        entry = {
+            'time': datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage()
+        }
+        for key, value in record.__dict__.items():
+            if key not in _RECORD_ATTRS:
+                entry[key] = value
+        if record.exc_info:
+            entry['exc'] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class TextFormatter(logging.Formatter):
+    """Formato texto tradicional, indicando quantas linhas foram omitidas pela amostragem"""
+
+    def format(self, record):
+        text = super().format(record)
+        omitted = getattr(record, 'omitted', 0)
+        return f"{text} (+{omitted} linhas omitidas)" if omitted else text
+
+
+class HotPathSampler(logging.Filter):
+    """Amostra e limita por segundo os registros marcados com `extra=HOT`"""
+
+    def __init__(self, sample=1.0, rate=50):
+        super().__init__()
+        self.sample = sample
+        self.rate = rate
+        self.dropped = 0
+        self._window = 0
+        self._count = 0
+        self._lock = threading.Lock()
+
+    def filter(self, record):
+        if not getattr(record, 'hot', False):
+            return True
+        if self.sample < 1.0 and random.random() >= self.sample:
+            self._drop()
+            return False
+
+        now = int(time.monotonic())
+        with self._lock:
+            if now != self._window:
+                self._window = now
+                self._count = 0
+            if self.rate and self._count >= self.rate:
+                self.dropped += 1
+                return False
+            self._count += 1
+            dropped, self.dropped = self.dropped, 0
+
+        if dropped:
+            record.omitted = dropped
+        return True
+
+    def _drop(self):
+        with self._lock:
+            self.dropped += 1
+
+
+class NonBlockingQueueHandler(QueueHandler):
+    """QueueHandler que não formata na thread de origem e descarta se a fila encher"""
+
+    def __init__(self, log_queue):
+        super().__init__(log_queue)
+        self.overflow = 0
+
+    def prepare(self, record):
+        # A fila é local ao processo: o registro segue intacto e é formatado na thread do listener
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.overflow += 1
+
+
+def parse_levels(spec):
+    """'httpx=WARNING,bot=DEBUG' -> {'httpx': 'WARNING', 'bot': 'DEBUG'}"""
+    levels = {}
+    for item in spec.split(','):
+        if '=' in item:
+            name, level = item.split('=', 1)
+            levels[name.strip()] = level.strip().upper()
+    return levels
+
+
+def setup_logging(level='INFO', component_levels=None, fmt='text', hot_sample=1.0, hot_rate=50, queue_size=10000):
+    """Configura o logging raiz com fila, formato (`text`/`json`) e níveis por componente"""
+    stream = logging.StreamHandler(sys.stderr)
+    stream.setFormatter(JsonFormatter() if fmt == 'json' else TextFormatter(TEXT_FORMAT))
+
+    handler = NonBlockingQueueHandler(queue.Queue(maxsize=queue_size))
+    handler.addFilter(HotPathSampler(sample=hot_sample, rate=hot_rate))
+
+    root = logging.getLogger()
+    for existing in list(root.handlers):
+        root.removeHandler(existing)
+    root.addHandler(handler)
+    root.setLevel(level.upper())
+
+    for name, component_level in (component_levels or {}).items():
+        logging.getLogger(name).setLevel(component_level)
+
+    listener = QueueListener(handler.queue, stream, respect_handler_level=True)
+    listener.start()
+    # Registrado antes dos demais atexit: roda por último e escreve o que sobrou na fila
+    atexit.register(listener.stop)
+    return listener
@@ -0,0 +1,167 @@
+import json
+import logging
+import os
+import re
+import unicodedata
+from collections import namedtuple
+
+from telegram import InlineKeyboardButton, InlineKeyboardMarkup
+
+logger = logging.getLogger(__name__)
+
+RenderedTemplate = namedtuple('RenderedTemplate', ['text', 'reply_markup'])
+
+# Títulos do mensagens_prontas_auge_traders.md -> chaves das mensagens padrão do bot
+HEADING_KEYS = {
+    'boas_vindas_principal': 'welcome_main',
+    'aviso_matinal': 'morning_alert',
+    'alerta_de_mercado': 'market_alert',
+    'motivacional': 'motivational',
+    'engajamento': 'engagement',
+    'lembrete_grupo_de_duvidas': 'doubts_reminder',
+    'promocao_mentoria': 'mentoria_promo',
+    'disciplina': 'discipline',
+    'fim_de_semana': 'weekend',
+    'motivacao_geral': 'motivation',
+}
+
+_MD_SECTION = re.compile(
+    r'^###\s+(.+?)\s*\n(?:<!--\s*key:\s*([\w-]+)\s*-->\s*\n)?```[^\n]*\n(.*?)\n```',
+    flags=re.M | re.S
+)
+
+
+class _KeepMissing(dict):
+    """Mantém placeholders desconhecidos (ex.: {name}) para a etapa por usuário"""
+
+    def __missing__(self, key):
+        return '{' + key + '}'
+
+
+def _slugify(title):
+    """Converte o título de uma seção em chave ('Aviso Matinal' -> 'aviso_matinal')"""
+    title = unicodedata.normalize('NFKD', title).encode('ascii', 'ignore').decode()
+    return re.sub(r'[^a-z0-9]+', '_', title.lower()).strip('_')
+
+
+def load_templates_file(path):
+    """Carrega templates de um arquivo .json ({chave: texto}) ou .md.
+
+    No Markdown, cada seção `### Título` seguida de um bloco ``` vira um
+    template. A chave vem de um marcador `<!-- key: morning_alert -->` na
+    linha seguinte ao título; sem ele, o texto após o último ' - ' do título
+    é normalizado e, se for um título conhecido (`HEADING_KEYS`), trocado
+    pela chave da mensagem padrão (ex.: '### Mensagem 3 - Aviso Matinal' ->
+    'morning_alert'; títulos desconhecidos viram chaves novas, como
+    'boas_vindas_alternativa').
+    """
+    with open(path, encoding='utf-8') as f:
+        content = f.read()
+
+    if path.endswith('.json'):
+        return {str(key): str(text) for key, text in json.loads(content).items()}
+
+    templates = {}
+    for title, key, body in _MD_SECTION.findall(content):
+        if not key:
+            slug = _slugify(title.rsplit(' - ', 1)[-1])
+            key = HEADING_KEYS.get(slug, slug)
+        templates[key] = body
+    return templates
+
+
+class TemplateRegistry:
+    """Registro de mensagens pré-renderizadas com o teclado já montado.
+
+    Cada template é renderizado uma única vez com os links atuais e fica em
+    cache junto com seu InlineKeyboardMarkup. O cache só é descartado quando
+    o arquivo de templates é alterado (`reload_if_changed`). Placeholders por usuário, como {name}, são
+    preenchidos em `render`.
+    """
+
+    def __init__(self, templates, links, keyboards=None, source_path=None):
+        self._builtin = dict(templates)
+        self._keyboards = keyboards or {}
+        self.links = dict(links)
+        self.source_path = source_path
+        self._source_mtime = None
+        self._sources = dict(self._builtin)
+        self._rendered = {}
+
+        if source_path:
+            self.reload_if_changed()
+
+    def __contains__(self, key):
+        return key in self._sources
+
+    def keys(self):
+        return self._sources.keys()
+
+    def source(self, key):
+        """Texto bruto do template"""
+        return self._sources[key]
+
+    def get(self, key):
+        """Template renderizado com os links atuais (texto e teclado)"""
+        rendered = self._rendered.get(key)
+        if rendered is None:
+            rendered = self._render_links(key)
+            self._rendered[key] = rendered
+        return rendered
+
+    def render(self, key, name=None):
+        """Template renderizado com os dados do usuário, se houver"""
+        rendered = self.get(key)
+        if name is None:
+            return rendered
+        return RenderedTemplate(rendered.text.replace('{name}', str(name)), rendered.reply_markup)
+
+    def _render_links(self, key):
+        source = self._sources[key]
+        try:
+            text = source.format_map(_KeepMissing(self.links))
+        except (ValueError, IndexError, AttributeError) as e:
+            # Chaves soltas em texto editado à mão: substitui só os links conhecidos
+            logger.warning(f"Template '{key}' com chaves inválidas ({e}); usando o texto sem formatação")
+            text = source
+            for name, link in self.links.items():
+                text = text.replace('{' + name + '}', str(link))
+
+        reply_markup = None
+        layout = self._keyboards.get(key)
+        if layout:
+            reply_markup = InlineKeyboardMarkup([
+                [InlineKeyboardButton(label, url=self.links.get(link)) for label, link in row]
+                for row in layout
+            ])
+        return RenderedTemplate(text, reply_markup)
+
+    def reload_if_changed(self):
+        """Recarrega o arquivo de templates se ele foi modificado desde a última leitura"""
+        if not self.source_path:
+            return False
+
+        try:
+            mtime = os.path.getmtime(self.source_path)
+        except OSError:
+            if self._source_mtime is not None:
+                logger.warning(f"Arquivo de templates {self.source_path} não encontrado; usando os padrões")
+                self._source_mtime = None
+                self._sources = dict(self._builtin)
+                self._rendered.clear()
+            return False
+
+        if mtime == self._source_mtime:
+            return False
+
+        try:
+            loaded = load_templates_file(self.source_path)
+        except Exception as e:
+            logger.error(f"Erro ao carregar templates de {self.source_path}: {e}")
+            return False
+
+        self._source_mtime = mtime
+        self._sources = dict(self._builtin, **loaded)
+        self._rendered.clear()
+        logger.info(f"{len(loaded)} templates carregados de {self.source_path}")
+        return True
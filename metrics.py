@@ -0,0 +1,380 @@
+"""Métricas do bot no formato texto do Prometheus.
+
+Implementação mínima e sem dependências: contadores, gauges (valor fixo ou
+calculado na hora da coleta) e histogramas com buckets fixos. Registrar uma
+amostra custa uma busca binária e um lock curto, então pode ficar ligado no
+caminho de cada update.
+
+No modo webhook a saída é servida pela rota `/metrics` do Flask; com
+`METRICS_PORT`, `MetricsServer` sobe um servidor HTTP mínimo em uma thread.
+As duas exigem `Authorization: Bearer <token>` quando há um token
+configurado (veja `authorized`).
+"""
+import bisect
+import functools
+import hmac
+import logging
+import threading
+import time
+
+from telegram.request import HTTPXRequest
+
+from profiling import record_api_time
+
+logger = logging.getLogger(__name__)
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+# Buckets (segundos) pensados para handlers, consultas e chamadas à Bot API
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+JOB_BUCKETS = (0.01, 0.05, 0.1, 0.5, 1.0, 5.0, 10.0, 30.0, 60.0, 300.0)
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(names, values):
+    if not names:
+        return ''
+    pairs = ','.join(f'{name}="{_escape(value)}"' for name, value in zip(names, values))
+    return '{' + pairs + '}'
+
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    kind = ''
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def _key(self, labels):
+        if len(labels) != len(self.labelnames):
+            raise ValueError(f"{self.name} espera os rótulos {self.labelnames}")
+        return tuple(labels)
+
+    def header(self):
+        return [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} {self.kind}']
+
+
+class Counter(_Metric):
+    kind = 'counter'
+
+    def __init__(self, name, documentation, labelnames=()):
+        super().__init__(name, documentation, labelnames)
+        self._values = {}
+
+    def inc(self, *labels, amount=1):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, *labels):
+        return self._values.get(tuple(labels), 0)
+
+    def collect(self):
+        with self._lock:
+            items = sorted(self._values.items())
+        return [
+            f'{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}'
+            for key, value in items
+        ]
+
+
+class Gauge(_Metric):
+    """Gauge com valor definido por `set` ou calculado por `set_function` na coleta"""
+    kind = 'gauge'
+
+    def __init__(self, name, documentation, labelnames=()):
+        super().__init__(name, documentation, labelnames)
+        self._values = {}
+        self._functions = {}
+
+    def set(self, value, *labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def set_function(self, function, *labels):
+        key = self._key(labels)
+        with self._lock:
+            self._functions[key] = function
+
+    def collect(self):
+        with self._lock:
+            values = dict(self._values)
+            functions = list(self._functions.items())
+        for key, function in functions:
+            try:
+                values[key] = function()
+            except Exception as e:
+                logger.debug(f"Erro ao calcular {self.name}: {e}")
+        return [
+            f'{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}'
+            for key, value in sorted(values.items())
+        ]
+
+
+class Histogram(_Metric):
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # rótulos -> [contagem por bucket (não acumulada), soma, total]
+        self._series = {}
+
+    def observe(self, value, *labels):
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    def count(self, *labels):
+        series = self._series.get(tuple(labels))
+        return series[2] if series else 0
+
+    def collect(self):
+        with self._lock:
+            items = sorted((key, (list(s[0]), s[1], s[2])) for key, s in self._series.items())
+
+        lines = []
+        bucket_labels = self.labelnames + ('le',)
+        for key, (counts, total_sum, total_count) in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += count
+                lines.append(
+                    f'{self.name}_bucket{_format_labels(bucket_labels, key + (_format_value(float(bound)),))} {cumulative}'
+                )
+            labels = _format_labels(self.labelnames, key)
+            lines.append(f'{self.name}_sum{labels} {_format_value(total_sum)}')
+            lines.append(f'{self.name}_count{labels} {total_count}')
+        return lines
+
+
+class Registry:
+    """Conjunto de métricas exportadas juntas"""
+
+    def __init__(self):
+        self._metrics = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def counter(self, name, documentation, labelnames=()):
+        return self.register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name, documentation, labelnames=()):
+        return self.register(Gauge(name, documentation, labelnames))
+
+    def histogram(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        return self.register(Histogram(name, documentation, labelnames, buckets))
+
+    def render(self):
+        """Texto no formato de exposição do Prometheus"""
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.header())
+            lines.extend(metric.collect())
+        return '\n'.join(lines) + '\n'
+
+
+class BotMetrics:
+    """Métricas do bot e utilitários para instrumentar handlers, jobs e o banco"""
+
+    def __init__(self):
+        self.registry = Registry()
+        self.handler_duration = self.registry.histogram(
+            'bot_handler_duration_seconds', 'Tempo de execução dos handlers', ('handler',)
+        )
+        self.handler_errors = self.registry.counter(
+            'bot_handler_errors_total', 'Exceções levantadas pelos handlers', ('handler',)
+        )
+        self.db_duration = self.registry.histogram(
+            'bot_db_operation_duration_seconds', 'Tempo com uma conexão do SQLite emprestada', ('operation',)
+        )
+        self.api_duration = self.registry.histogram(
+            'bot_telegram_request_duration_seconds', 'Latência das chamadas à Bot API', ('method',)
+        )
+        self.api_errors = self.registry.counter(
+            'bot_telegram_request_errors_total', 'Chamadas à Bot API que falharam', ('method',)
+        )
+        self.job_duration = self.registry.histogram(
+            'bot_job_duration_seconds', 'Duração dos jobs agendados', ('job',), buckets=JOB_BUCKETS
+        )
+        self.job_errors = self.registry.counter(
+            'bot_job_errors_total', 'Jobs agendados que falharam', ('job',)
+        )
+        self.queue_depth = self.registry.gauge(
+            'bot_queue_depth', 'Itens aguardando processamento', ('queue',)
+        )
+        self.update_wait = self.registry.histogram(
+            'bot_update_wait_seconds', 'Espera dos updates por uma vaga de processamento', ('priority',)
+        )
+        self.updates_shed = self.registry.counter(
+            'bot_updates_shed_total', 'Updates desviados para o caminho reduzido sob carga', ('priority',)
+        )
+        self.duplicate_updates = self.registry.counter(
+            'bot_duplicate_updates_total', 'Updates repetidos descartados pelo update_id', ('reason',)
+        )
+        self.flood_messages = self.registry.counter(
+            'bot_flood_messages_total', 'Mensagens não registradas pelo antiflood', ('reason',)
+        )
+        self.write_buffer_dropped = self.registry.counter(
+            'bot_write_buffer_dropped_total', 'Registros descartados pelo buffer de escrita', ('reason',)
+        )
+        self.cache_hit_ratio = self.registry.gauge(
+            'bot_user_cache_hit_ratio', 'Fração das gravações de usuário evitadas pelo cache'
+        )
+
+    def render(self):
+        return self.registry.render()
+
+    def observe_db(self, operation, seconds):
+        """Observador para `Database(observer=...)`"""
+        self.db_duration.observe(seconds, operation)
+
+    def track_handler(self, callback, name=None):
+        """Envolve o callback de um handler medindo duração e erros"""
+        name = name or getattr(callback, '__name__', repr(callback))
+        duration, errors = self.handler_duration, self.handler_errors
+
+        @functools.wraps(callback)
+        async def tracked(update, context):
+            start = time.perf_counter()
+            try:
+                return await callback(update, context)
+            except Exception:
+                errors.inc(name)
+                raise
+            finally:
+                duration.observe(time.perf_counter() - start, name)
+
+        return tracked
+
+    def track_job(self, callback, name=None):
+        """Envolve o callback de um job medindo duração e erros"""
+        name = name or getattr(callback, '__name__', repr(callback))
+        duration, errors = self.job_duration, self.job_errors
+
+        @functools.wraps(callback)
+        async def tracked(context):
+            start = time.perf_counter()
+            try:
+                return await callback(context)
+            except Exception:
+                errors.inc(name)
+                raise
+            finally:
+                duration.observe(time.perf_counter() - start, name)
+
+        return tracked
+
+    def instrument_handlers(self, application):
+        """Passa a medir todos os handlers já registrados na Application"""
+        for handlers in application.handlers.values():
+            for handler in handlers:
+                handler.callback = self.track_handler(handler.callback)
+
+
+class MetricsRequest(HTTPXRequest):
+    """HTTPXRequest que mede a latência e os erros de cada chamada à Bot API"""
+
+    def __init__(self, metrics, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._metrics = metrics
+
+    async def do_request(self, url, method, request_data=None, **kwargs):
+        api_method = url.rsplit('/', 1)[-1]
+        start = time.perf_counter()
+        try:
+            code, payload = await super().do_request(url, method, request_data, **kwargs)
+        except Exception:
+            self._metrics.api_errors.inc(api_method)
+            raise
+        finally:
+            elapsed = time.perf_counter() - start
+            self._metrics.api_duration.observe(elapsed, api_method)
+            record_api_time(elapsed)
+        if code >= 400:
+            self._metrics.api_errors.inc(api_method)
+        return code, payload
+
+
+def authorized(header, token):
+    """True se o header Authorization traz `Bearer <token>` (comparação em tempo constante)"""
+    scheme, _, value = (header or '').partition(' ')
+    if scheme.lower() != 'bearer':
+        return False
+    return hmac.compare_digest(value.strip().encode('utf-8'), token.encode('utf-8'))
+
+
+class MetricsServer:
+    """Servidor HTTP mínimo que expõe `/metrics` em uma porta própria"""
+
+    def __init__(self, metrics, port, host='0.0.0.0', token=''):
+        from http.server import ThreadingHTTPServer  # Só usado com METRICS_PORT
+
+        handler = self._make_handler(metrics, token)
+        self._server = ThreadingHTTPServer((host, port), handler)
+        self._server.daemon_threads = True
+        self._thread = None
+        self.host = host
+
+    @property
+    def port(self):
+        return self._server.server_address[1]
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, name='metrics-http', daemon=True)
+        self._thread.start()
+        logger.info(f"Métricas disponíveis em http://{self.host}:{self.port}/metrics")
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    @staticmethod
+    def _make_handler(metrics, token):
+        from http.server import BaseHTTPRequestHandler
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split('?', 1)[0] != '/metrics':
+                    self.send_error(404)
+                    return
+                if token and not authorized(self.headers.get('Authorization'), token):
+                    self.send_response(401)
+                    self.send_header('WWW-Authenticate', 'Bearer')
+                    self.send_header('Content-Length', '0')
+                    self.end_headers()
+                    return
+                payload = metrics.render().encode('utf-8')
+                self.send_response(200)
+                self.send_header('Content-Type', CONTENT_TYPE)
+                self.send_header('Content-Length', str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
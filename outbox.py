@@ -0,0 +1,331 @@
+"""Fila durável de mensagens enviadas ao Telegram (outbox).
+
+Os handlers e jobs só gravam a mensagem na tabela `outbox` e seguem em
+frente; um despachante assíncrono lê os envios prontos e os entrega com até
+`workers` envios simultâneos, respeitando os limites do `SendLimiter`.
+
+- Ordem por chat: só a mensagem mais antiga ainda não entregue de cada chat
+  pode ser enviada, então um chat nunca recebe mensagens fora de ordem.
+- `RetryAfter`: pausa todos os envios pelo tempo pedido e reagenda a
+  mensagem, sem contar como tentativa.
+- Falhas de rede: nova tentativa com espera exponencial (com jitter), até
+  `max_attempts`; erros permanentes (chat inexistente, bot removido,
+  mensagem inválida) marcam a mensagem como `failed` na hora.
+
+Mensagens pendentes sobrevivem a reinícios. A entrega é "pelo menos uma
+vez": se o processo cair entre o envio e a confirmação, a mensagem volta a
+ser enviada quando a reserva (`stale_after`) expirar. Várias réplicas podem
+despachar ao mesmo tempo; a reserva de cada mensagem é atômica e leva o
+identificador da instância (`claimed_by`), para que um desligamento
+interrompido devolva à fila tudo o que ela reservou.
+
+Mensagens enfileiradas juntas podem levar um identificador de lote
+(`batch`): `batch_status` diz quantas ainda faltam e quais falharam, o que
+permite mostrar o resultado de um envio em massa. Mensagens entregues são
+apagadas; as que falharam ficam para consulta até `prune_failed`.
+"""
+import asyncio
+import json
+import logging
+import random
+import time
+from collections import namedtuple
+
+from telegram import InlineKeyboardMarkup
+from telegram.error import BadRequest, Forbidden, RetryAfter
+
+from broadcast import retry_after_seconds
+from leader import default_holder_id
+
+logger = logging.getLogger(__name__)
+
+OutboxMessage = namedtuple('OutboxMessage', 'id chat_id payload attempts')
+
+
+def create_outbox_tables(cursor):
+    """Cria a tabela de envios pendentes"""
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS outbox (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            chat_id INTEGER NOT NULL,
+            payload TEXT NOT NULL,
+            status TEXT NOT NULL DEFAULT 'pending',
+            attempts INTEGER NOT NULL DEFAULT 0,
+            next_attempt_at REAL NOT NULL,
+            claimed_at REAL,
+            last_error TEXT,
+            created_at REAL NOT NULL,
+            batch TEXT,
+            claimed_by TEXT
+        )
+    ''')
+
+    # Tabelas criadas antes dos lotes e do dono da reserva
+    columns = {row[1] for row in cursor.execute('PRAGMA table_info(outbox)').fetchall()}
+    if 'batch' not in columns:
+        cursor.execute('ALTER TABLE outbox ADD COLUMN batch TEXT')
+    if 'claimed_by' not in columns:
+        cursor.execute('ALTER TABLE outbox ADD COLUMN claimed_by TEXT')
+
+    # Cabeça de cada chat (menor id não entregue) sem varrer a tabela
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_outbox_status_chat ON outbox (status, chat_id, id)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_outbox_batch ON outbox (batch) WHERE batch IS NOT NULL')
+
+
+def encode_payload(text, reply_markup=None, **kwargs):
+    """Argumentos do send_message em JSON (o teclado vai como dicionário)"""
+    payload = dict(kwargs, text=text)
+    if reply_markup is not None:
+        payload['reply_markup'] = reply_markup.to_dict()
+    return json.dumps(payload, ensure_ascii=False)
+
+
+def insert_messages(conn, chat_ids, payload, batch=None, now=None):
+    now = time.time() if now is None else now
+    conn.executemany('''
+        INSERT INTO outbox (chat_id, payload, next_attempt_at, created_at, batch) VALUES (?, ?, ?, ?, ?)
+    ''', [(chat_id, payload, now, now, batch) for chat_id in chat_ids])
+
+
+def claim_ready(conn, now, limit, busy_chats=(), stale_after=120, holder=None):
+    """Reserva até `limit` mensagens prontas, no máximo uma por chat e só a mais antiga de cada"""
+    # Reservas abandonadas (processo que caiu no meio do envio) voltam para a fila
+    conn.execute('''
+        UPDATE outbox SET status = 'pending' WHERE status = 'sending' AND claimed_at < ?
+    ''', (now - stale_after,))
+
+    rows = conn.execute('''
+        SELECT o.id, o.chat_id, o.payload, o.attempts
+        FROM (
+            SELECT MIN(id) AS id FROM outbox
+            WHERE status IN ('pending', 'sending')
+            GROUP BY chat_id
+        ) heads
+        JOIN outbox o ON o.id = heads.id
+        WHERE o.status = 'pending' AND o.next_attempt_at <= ?
+        ORDER BY o.id
+        LIMIT ?
+    ''', (now, limit + len(busy_chats))).fetchall()
+
+    claimed = []
+    for row in rows:
+        message = OutboxMessage(*row)
+        if message.chat_id in busy_chats:
+            continue
+        cursor = conn.execute('''
+            UPDATE outbox SET status = 'sending', claimed_at = ?, claimed_by = ? WHERE id = ? AND status = 'pending'
+        ''', (now, holder, message.id))
+        if cursor.rowcount == 1:
+            claimed.append(message)
+            if len(claimed) >= limit:
+                break
+    return claimed
+
+
+def release_claims(conn, holder):
+    """Devolve para a fila as mensagens reservadas por `holder`; retorna quantas"""
+    cursor = conn.execute('''
+        UPDATE outbox SET status = 'pending', claimed_at = NULL, claimed_by = NULL
+        WHERE status = 'sending' AND claimed_by = ?
+    ''', (holder,))
+    return cursor.rowcount
+
+
+def complete_message(conn, message_id):
+    conn.execute('DELETE FROM outbox WHERE id = ?', (message_id,))
+
+
+def reschedule_message(conn, message_id, next_attempt_at, attempts, error=None):
+    conn.execute('''
+        UPDATE outbox SET status = 'pending', next_attempt_at = ?, attempts = ?, last_error = ?, claimed_at = NULL
+        WHERE id = ?
+    ''', (next_attempt_at, attempts, error, message_id))
+
+
+def fail_message(conn, message_id, attempts, error):
+    conn.execute('''
+        UPDATE outbox SET status = 'failed', attempts = ?, last_error = ?, claimed_at = NULL WHERE id = ?
+    ''', (attempts, error, message_id))
+
+
+def batch_status(conn, batch):
+    """(mensagens ainda na fila, {chat_id: erro} das que falharam) de um lote"""
+    rows = conn.execute(
+        'SELECT chat_id, status, last_error FROM outbox WHERE batch = ?', (batch,)
+    ).fetchall()
+    remaining = sum(1 for _, status, _ in rows if status != 'failed')
+    failed = {chat_id: error for chat_id, status, error in rows if status == 'failed'}
+    return remaining, failed
+
+
+def prune_failed(conn, before):
+    """Apaga as mensagens que falharam criadas antes de `before` (timestamp)"""
+    return conn.execute(
+        "DELETE FROM outbox WHERE status = 'failed' AND created_at < ?", (before,)
+    ).rowcount
+
+
+def outbox_counts(conn):
+    """Quantidade de mensagens por status ('pending', 'sending', 'failed')"""
+    return dict(conn.execute('SELECT status, COUNT(*) FROM outbox GROUP BY status').fetchall())
+
+
+class Outbox:
+    """Despachante assíncrono da tabela `outbox`"""
+
+    def __init__(self, db, async_db, limiter, workers=10, max_attempts=5,
+                 base_delay=2.0, max_delay=300.0, poll_interval=1.0, stale_after=120, holder=None):
+        self.db = db
+        self.async_db = async_db
+        self.limiter = limiter
+        self.workers = workers
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.poll_interval = poll_interval
+        self.stale_after = stale_after
+        self.holder = holder or default_holder_id()
+        self.sent = 0
+        self.retried = 0
+        self.failed = 0
+        self._bot = None
+        self._task = None
+        self._wake = None
+        self._closing = False
+        # chat_id -> (id da mensagem, task) dos envios em andamento
+        self._inflight = {}
+
+    @property
+    def running(self):
+        return self._task is not None and not self._task.done()
+
+    @property
+    def inflight(self):
+        return len(self._inflight)
+
+    def start(self, bot):
+        """Inicia o despachante no event loop atual (idempotente)"""
+        if self.running:
+            return
+        self._bot = bot
+        self._closing = False
+        self._wake = asyncio.Event()
+        self._task = asyncio.get_running_loop().create_task(self._run())
+
+    def wake(self):
+        if self._wake is not None:
+            self._wake.set()
+
+    async def enqueue(self, chat_ids, text, reply_markup=None, batch=None, **kwargs):
+        """Grava uma mensagem para cada chat; retorna sem esperar o envio"""
+        chat_ids = list(dict.fromkeys(chat_ids))
+        payload = encode_payload(text, reply_markup, **kwargs)
+        await self.async_db.write(self._insert, chat_ids, payload, batch)
+        self.wake()
+        return len(chat_ids)
+
+    async def stop(self, timeout=5.0):
+        """Entrega o que já está pronto por até `timeout` segundos; o resto fica para o próximo início"""
+        if not self.running:
+            return
+        self._closing = True
+        self.wake()
+        try:
+            await asyncio.wait_for(asyncio.shield(self._task), timeout)
+        except asyncio.TimeoutError:
+            self._task.cancel()
+            for _, task in list(self._inflight.values()):
+                task.cancel()
+            # Devolve as reservas desta instância para a fila sem esperar `stale_after`, inclusive as
+            # de uma reserva que ainda estava em andamento: a gravação roda depois dela na thread de escrita
+            released = await self.async_db.write(self._transaction, release_claims, self.holder)
+            logger.warning(f"Outbox encerrada com {released} envio(s) interrompido(s) devolvido(s) à fila")
+
+    async def _run(self):
+        while True:
+            free = self.workers - len(self._inflight)
+            batch = []
+            if free > 0:
+                try:
+                    batch = await self.async_db.write(self._claim, time.time(), free, set(self._inflight))
+                except Exception as e:
+                    logger.error(f"Erro ao ler a outbox: {e}")
+            for message in batch:
+                task = asyncio.get_running_loop().create_task(self._deliver(message))
+                self._inflight[message.chat_id] = (message.id, task)
+
+            if self._closing and not batch and not self._inflight:
+                return
+
+            # Acordado por um enqueue, por um envio concluído ou pelo próximo poll
+            self._wake.clear()
+            try:
+                await asyncio.wait_for(self._wake.wait(), self.poll_interval)
+            except asyncio.TimeoutError:
+                pass
+
+    async def _deliver(self, message):
+        payload = json.loads(message.payload)
+        if payload.get('reply_markup') is not None:
+            payload['reply_markup'] = InlineKeyboardMarkup.de_json(payload['reply_markup'], self._bot)
+
+        try:
+            await self.limiter.throttle(message.chat_id)
+            await self._bot.send_message(chat_id=message.chat_id, **payload)
+        except RetryAfter as e:
+            wait = retry_after_seconds(e)
+            self.limiter.pause(wait)
+            self.retried += 1
+            logger.warning(f"Outbox: RetryAfter de {wait}s para o chat {message.chat_id}, mensagem {message.id} reagendada")
+            await self._write(reschedule_message, message.id, time.time() + wait, message.attempts, str(e))
+        except (BadRequest, Forbidden) as e:
+            self.failed += 1
+            logger.error(f"Outbox: mensagem {message.id} para o chat {message.chat_id} descartada: {e}")
+            await self._write(fail_message, message.id, message.attempts + 1, str(e))
+        except Exception as e:
+            attempts = message.attempts + 1
+            if attempts >= self.max_attempts:
+                self.failed += 1
+                logger.error(f"Outbox: mensagem {message.id} para o chat {message.chat_id} falhou {attempts} vezes: {e}")
+                await self._write(fail_message, message.id, attempts, str(e))
+            else:
+                delay = min(self.base_delay * 2 ** (attempts - 1), self.max_delay) * random.uniform(0.5, 1.0)
+                self.retried += 1
+                logger.warning(f"Outbox: erro ao enviar mensagem {message.id} para o chat {message.chat_id} ({e}), nova tentativa em {delay:.1f}s")
+                await self._write(reschedule_message, message.id, time.time() + delay, attempts, str(e))
+        else:
+            self.sent += 1
+            await self._write(complete_message, message.id)
+        finally:
+            self._inflight.pop(message.chat_id, None)
+            self.wake()
+
+    async def _write(self, fn, *args):
+        try:
+            await self.async_db.write(self._transaction, fn, *args)
+        except Exception as e:
+            logger.error(f"Erro ao atualizar a outbox: {e}")
+
+    def _transaction(self, fn, *args):
+        with self.db.transaction() as conn:
+            return fn(conn, *args)
+
+    def _insert(self, chat_ids, payload, batch):
+        with self.db.transaction() as conn:
+            insert_messages(conn, chat_ids, payload, batch)
+
+    def _claim(self, now, limit, busy_chats):
+        with self.db.transaction() as conn:
+            return claim_ready(conn, now, limit, busy_chats, self.stale_after, self.holder)
+
+    def counts(self):
+        with self.db.connection() as conn:
+            return outbox_counts(conn)
+
+    def batch_status(self, batch):
+        with self.db.connection() as conn:
+            return batch_status(conn, batch)
+
+    def prune_failed(self, max_age):
+        with self.db.transaction() as conn:
+            return prune_failed(conn, time.time() - max_age)
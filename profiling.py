@@ -0,0 +1,147 @@
+"""Rastreamento de updates lentos e perfil sob demanda.
+
+`SlowUpdateTracer` envolve os handlers e, para cada update, acumula o tempo
+gasto no banco e na Bot API (via `record_db_time`/`record_api_time`, chamados
+pelo observador do `Database` e pelo `MetricsRequest`). Updates acima do
+limite são registrados no log com chat, comando e essa divisão.
+
+`profile_loop` liga o cProfile na thread do event loop por alguns segundos e
+devolve um relatório com as funções mais custosas. Trabalho feito nas
+threads do banco aparece apenas como espera no loop.
+
+`StartupTimer` registra no log quanto cada fase da inicialização levou.
+"""
+import asyncio
+import contextvars
+import functools
+import io
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+_current_trace = contextvars.ContextVar('update_trace', default=None)
+
+
+class UpdateTrace:
+    """Tempo de banco e de Bot API acumulado durante um update"""
+    __slots__ = ('db_seconds', 'db_ops', 'api_seconds', 'api_calls')
+
+    def __init__(self):
+        self.db_seconds = 0.0
+        self.db_ops = 0
+        self.api_seconds = 0.0
+        self.api_calls = 0
+
+
+def record_db_time(seconds):
+    """Soma uma operação do banco ao update em andamento (se houver)"""
+    trace = _current_trace.get()
+    if trace is not None:
+        trace.db_seconds += seconds
+        trace.db_ops += 1
+
+
+def record_api_time(seconds):
+    """Soma uma chamada à Bot API ao update em andamento (se houver)"""
+    trace = _current_trace.get()
+    if trace is not None:
+        trace.api_seconds += seconds
+        trace.api_calls += 1
+
+
+def describe_update(update):
+    """Chat e comando (ou tipo de mensagem) de um update, para o log"""
+    chat = getattr(update, 'effective_chat', None)
+    message = getattr(update, 'effective_message', None)
+    chat_id = chat.id if chat else None
+    if message is None:
+        return chat_id, '-'
+    if message.text and message.text.startswith('/'):
+        return chat_id, message.text.split()[0]
+    if message.new_chat_members:
+        return chat_id, 'new_chat_members'
+    return chat_id, 'text' if message.text else 'other'
+
+
+class SlowUpdateTracer:
+    """Mede cada handler e registra no log os updates acima de `threshold` segundos"""
+
+    def __init__(self, threshold=2.0):
+        self.threshold = threshold
+        self.slow_count = 0
+
+    def wrap(self, callback, name=None):
+        name = name or getattr(callback, '__name__', repr(callback))
+
+        @functools.wraps(callback)
+        async def traced(update, context):
+            trace = UpdateTrace()
+            token = _current_trace.set(trace)
+            start = time.perf_counter()
+            try:
+                return await callback(update, context)
+            finally:
+                elapsed = time.perf_counter() - start
+                _current_trace.reset(token)
+                if elapsed >= self.threshold:
+                    self._log_slow(name, update, elapsed, trace)
+
+        return traced
+
+    def instrument_handlers(self, application):
+        """Passa a rastrear todos os handlers já registrados na Application"""
+        for handlers in application.handlers.values():
+            for handler in handlers:
+                handler.callback = self.wrap(handler.callback)
+
+    def _log_slow(self, name, update, elapsed, trace):
+        self.slow_count += 1
+        chat_id, command = describe_update(update)
+        other = max(elapsed - trace.db_seconds - trace.api_seconds, 0.0)
+        logger.warning(
+            f"Update lento: {name} levou {elapsed:.3f}s (chat {chat_id}, {command}) - "
+            f"banco {trace.db_seconds:.3f}s em {trace.db_ops} operações, "
+            f"Bot API {trace.api_seconds:.3f}s em {trace.api_calls} chamadas, "
+            f"restante {other:.3f}s"
+        )
+
+
+async def profile_loop(seconds, limit=40):
+    """Perfila a thread do event loop por `seconds` segundos e retorna o relatório em texto"""
+    import cProfile
+    import pstats
+
+    profiler = cProfile.Profile()
+    started = time.perf_counter()
+    profiler.enable()
+    try:
+        await asyncio.sleep(seconds)
+    finally:
+        profiler.disable()
+    elapsed = time.perf_counter() - started
+
+    output = io.StringIO()
+    output.write(f"Perfil do event loop por {elapsed:.1f}s\n\n")
+    stats = pstats.Stats(profiler, stream=output)
+    stats.strip_dirs()
+    output.write("=== Por tempo próprio (tottime) ===\n")
+    stats.sort_stats('tottime').print_stats(limit)
+    output.write("\n=== Por tempo acumulado (cumtime) ===\n")
+    stats.sort_stats('cumulative').print_stats(limit)
+    return output.getvalue()
+
+
+class StartupTimer:
+    """Registra as fases da inicialização em relação a `origin` (time.monotonic)"""
+
+    def __init__(self, origin=None):
+        self.origin = origin if origin is not None else time.monotonic()
+        self.phases = []
+        self._last = self.origin
+
+    def mark(self, phase):
+        now = time.monotonic()
+        self.phases.append((phase, now - self.origin))
+        logger.info(f"Inicialização: {phase} em {now - self.origin:.3f}s (+{now - self._last:.3f}s)")
+        self._last = now
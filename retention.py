@@ -0,0 +1,193 @@
+"""Retenção da tabela `messages` com arquivo compactado e particionado por mês.
+
+Mensagens mais antigas que o horizonte configurado são movidas, em lotes,
+para uma tabela por mês (`messages_archive_AAAAMM`), com `message_text`
+compactado com zlib. Um mês inteiro sai do banco com `drop_archive_month`
+(um DROP TABLE, sem varrer nada). A view `messages_all` junta a tabela
+quente e todas as partições e é recriada sempre que uma partição surge ou
+some; ela depende da função SQL `unzip_text`, registrada nas conexões do bot
+(`SQL_FUNCTIONS`).
+
+Uso pela linha de comando para compactar fora do bot:
+    python retention.py [dias] [caminho_do_banco]
+    python retention.py drop AAAA-MM [caminho_do_banco]
+"""
+import logging
+import sys
+import zlib
+
+logger = logging.getLogger(__name__)
+
+
+def compress_text(text):
+    """Compacta o texto; mantém o original quando a compactação não compensa"""
+    if text is None:
+        return None
+    compressed = zlib.compress(text.encode('utf-8'), 6)
+    return compressed if len(compressed) < len(text.encode('utf-8')) else text
+
+
+def unzip_text(value):
+    """Inverso de compress_text (usado como função SQL)"""
+    if isinstance(value, bytes):
+        return zlib.decompress(value).decode('utf-8')
+    return value
+
+
+# Funções SQL que toda conexão precisa ter para consultar o arquivo
+SQL_FUNCTIONS = (
+    ('unzip_text', 1, unzip_text),
+)
+
+
+ARCHIVE_PREFIX = 'messages_archive_'
+LEGACY_ARCHIVE = 'messages_archive'  # Arquivo antigo, em uma tabela só com a coluna `month`
+
+
+def archive_table(message_date):
+    """'AAAA-MM-DD ...' -> nome da partição do mês ('messages_archive_AAAAMM')"""
+    return ARCHIVE_PREFIX + str(message_date)[:7].replace('-', '')
+
+
+def list_archive_tables(conn):
+    """Partições do arquivo, da mais antiga para a mais recente"""
+    rows = conn.execute(
+        "SELECT name FROM sqlite_master WHERE type = 'table' AND name GLOB ? ORDER BY name",
+        (ARCHIVE_PREFIX + '[0-9][0-9][0-9][0-9][0-9][0-9]',)
+    ).fetchall()
+    return [row[0] for row in rows]
+
+
+def _create_partition(conn, table):
+    conn.execute(f'''
+        CREATE TABLE IF NOT EXISTS {table} (
+            id INTEGER PRIMARY KEY,
+            user_id INTEGER,
+            message_text,
+            message_date TIMESTAMP,
+            group_id INTEGER
+        )
+    ''')
+
+
+def rebuild_archive_view(conn):
+    """Recria `messages_all` com a tabela quente e as partições existentes"""
+    parts = ['SELECT id, user_id, message_text, message_date, group_id FROM messages']
+    parts += [
+        f'SELECT id, user_id, unzip_text(message_text), message_date, group_id FROM {table}'
+        for table in list_archive_tables(conn)
+    ]
+    conn.execute('DROP VIEW IF EXISTS messages_all')
+    conn.execute('CREATE VIEW messages_all AS ' + ' UNION ALL '.join(parts))
+
+
+def create_archive_tables(cursor):
+    """Cria o índice usado pelo compactador, migra o arquivo antigo e a view unificada"""
+    # Permite ao compactador achar as mensagens antigas sem varrer a tabela
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_messages_date
+        ON messages (message_date)
+    ''')
+
+    legacy = cursor.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (LEGACY_ARCHIVE,)
+    ).fetchone()
+    if legacy:
+        # Arquivo de antes das partições: cada mês vai para a sua tabela (texto já compactado)
+        cursor.execute('DROP VIEW IF EXISTS messages_all')
+        months = [row[0] for row in cursor.execute(f'SELECT DISTINCT month FROM {LEGACY_ARCHIVE}').fetchall()]
+        for month in months:
+            table = archive_table(month)
+            _create_partition(cursor, table)
+            cursor.execute(f'''
+                INSERT OR REPLACE INTO {table} (id, user_id, message_text, message_date, group_id)
+                SELECT id, user_id, message_text, message_date, group_id FROM {LEGACY_ARCHIVE} WHERE month = ?
+            ''', (month,))
+        cursor.execute(f'DROP TABLE {LEGACY_ARCHIVE}')
+        logger.info(f"Arquivo de mensagens migrado para {len(months)} partição(ões) mensal(is)")
+
+    rebuild_archive_view(cursor)
+
+
+def archive_batch(conn, cutoff, batch_size=5000):
+    """Move até `batch_size` mensagens anteriores a `cutoff` para as partições do mês.
+
+    Retorna a quantidade movida; deve ser chamada dentro de uma transação.
+    """
+    rows = conn.execute('''
+        SELECT id, user_id, message_text, message_date, group_id
+        FROM messages
+        WHERE message_date < ?
+        ORDER BY message_date
+        LIMIT ?
+    ''', (cutoff, batch_size)).fetchall()
+
+    if not rows:
+        return 0
+
+    by_table = {}
+    for message_id, user_id, text, message_date, group_id in rows:
+        by_table.setdefault(archive_table(message_date), []).append(
+            (message_id, user_id, compress_text(text), message_date, group_id)
+        )
+
+    existing = set(list_archive_tables(conn))
+    for table, archived in by_table.items():
+        _create_partition(conn, table)
+        conn.executemany(f'''
+            INSERT OR REPLACE INTO {table} (id, user_id, message_text, message_date, group_id)
+            VALUES (?, ?, ?, ?, ?)
+        ''', archived)
+    if not existing.issuperset(by_table):
+        rebuild_archive_view(conn)
+
+    conn.executemany('DELETE FROM messages WHERE id = ?', [(row[0],) for row in rows])
+    return len(rows)
+
+
+def drop_archive_month(conn, month):
+    """Apaga a partição do mês 'AAAA-MM'; retorna quantas mensagens ela tinha (0 se não existe)"""
+    table = archive_table(month)
+    if table not in list_archive_tables(conn):
+        return 0
+    count = conn.execute(f'SELECT COUNT(*) FROM {table}').fetchone()[0]
+    conn.execute(f'DROP TABLE {table}')
+    rebuild_archive_view(conn)
+    return count
+
+
+if __name__ == '__main__':
+    from database import Database
+
+    logging.basicConfig(
+        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+        level=logging.INFO
+    )
+    if len(sys.argv) > 2 and sys.argv[1] == 'drop':
+        month = sys.argv[2]
+        db_path = sys.argv[3] if len(sys.argv) > 3 else './data/bot.db'
+        db = Database(db_path, pool_size=1, functions=SQL_FUNCTIONS)
+        with db.transaction() as conn:
+            removed = drop_archive_month(conn, month)
+        logger.info(f"Partição {month} removida do arquivo ({removed} mensagens)")
+        db.close()
+        sys.exit(0)
+
+    days = int(sys.argv[1]) if len(sys.argv) > 1 else 90
+    db_path = sys.argv[2] if len(sys.argv) > 2 else './data/bot.db'
+    db = Database(db_path, pool_size=1, functions=SQL_FUNCTIONS)
+
+    with db.connection() as conn:
+        cutoff = conn.execute("SELECT datetime('now', ?)", (f'-{days} days',)).fetchone()[0]
+
+    with db.transaction() as conn:
+        create_archive_tables(conn.cursor())
+    total = 0
+    while True:
+        with db.transaction() as conn:
+            moved = archive_batch(conn, cutoff)
+        total += moved
+        if not moved:
+            break
+    logger.info(f"{total} mensagens anteriores a {cutoff} movidas para o arquivo")
+    db.close()
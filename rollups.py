@@ -0,0 +1,188 @@
+"""Agregados incrementais usados pelo /stats.
+
+Em vez de varrer a tabela `messages` a cada consulta, mantemos:
+- `daily_message_counts`: mensagens por dia (UTC) e por grupo
+- `daily_active_users`: usuários que escreveram em cada dia
+- `stats_totals`: contadores corridos (total de mensagens e de usuários)
+
+Os agregados de mensagens são atualizados no mesmo caminho (e na mesma
+transação) em que as mensagens são gravadas. O total de usuários é mantido
+por trigger, já que o upsert não informa se a linha foi inserida.
+
+Uso pela linha de comando para recalcular a partir do histórico:
+    python rollups.py [caminho_do_banco]
+"""
+import logging
+import sys
+from collections import Counter
+
+from retention import list_archive_tables
+
+logger = logging.getLogger(__name__)
+
+
+def create_rollup_tables(cursor):
+    """Cria as tabelas de agregados e o trigger de contagem de usuários"""
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS daily_message_counts (
+            day TEXT NOT NULL,
+            group_id INTEGER NOT NULL,
+            message_count INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (day, group_id)
+        ) WITHOUT ROWID
+    ''')
+
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS daily_active_users (
+            day TEXT NOT NULL,
+            user_id INTEGER NOT NULL,
+            PRIMARY KEY (day, user_id)
+        ) WITHOUT ROWID
+    ''')
+
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS stats_totals (
+            name TEXT PRIMARY KEY,
+            value INTEGER NOT NULL DEFAULT 0
+        )
+    ''')
+
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS users_total_insert AFTER INSERT ON users
+        BEGIN
+            INSERT INTO stats_totals (name, value) VALUES ('users', 1)
+            ON CONFLICT(name) DO UPDATE SET value = value + 1;
+        END
+    ''')
+
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS users_total_delete AFTER DELETE ON users
+        BEGIN
+            UPDATE stats_totals SET value = value - 1 WHERE name = 'users';
+        END
+    ''')
+
+
+def needs_backfill(conn):
+    """Indica se os agregados ainda não foram calculados neste banco"""
+    row = conn.execute("SELECT 1 FROM stats_totals WHERE name = 'messages'").fetchone()
+    return row is None
+
+
+def apply_message_rollups(conn, messages):
+    """Atualiza os agregados para um lote de mensagens recém-gravadas.
+
+    `messages` é uma lista de tuplas (user_id, message_text, message_date, group_id),
+    com message_date no formato 'AAAA-MM-DD HH:MM:SS' (UTC).
+    """
+    if not messages:
+        return
+
+    day_counts = Counter()
+    active = set()
+    for user_id, _, message_date, group_id in messages:
+        day = message_date[:10]
+        day_counts[(day, group_id)] += 1
+        active.add((day, user_id))
+
+    conn.executemany('''
+        INSERT INTO daily_message_counts (day, group_id, message_count)
+        VALUES (?, ?, ?)
+        ON CONFLICT(day, group_id) DO UPDATE SET
+            message_count = message_count + excluded.message_count
+    ''', [(day, group_id, count) for (day, group_id), count in day_counts.items()])
+
+    conn.executemany('''
+        INSERT OR IGNORE INTO daily_active_users (day, user_id) VALUES (?, ?)
+    ''', list(active))
+
+    conn.execute('''
+        INSERT INTO stats_totals (name, value) VALUES ('messages', ?)
+        ON CONFLICT(name) DO UPDATE SET value = value + excluded.value
+    ''', (len(messages),))
+
+
+def history_source(conn):
+    """Subconsulta com o histórico completo (tabela quente + partições do arquivo)"""
+    tables = ['messages'] + list_archive_tables(conn)
+    if len(tables) == 1:
+        return 'messages'
+    union = '\n        UNION ALL\n        '.join(
+        f'SELECT user_id, message_date, group_id FROM {table}' for table in tables
+    )
+    return f'''(
+        {union}
+    )'''
+
+
+def backfill_rollups(conn):
+    """Recalcula todos os agregados a partir do histórico de mensagens e da tabela `users`"""
+    source = history_source(conn)
+
+    conn.execute('DELETE FROM daily_message_counts')
+    conn.execute('DELETE FROM daily_active_users')
+    conn.execute('DELETE FROM stats_totals')
+
+    conn.execute(f'''
+        INSERT INTO daily_message_counts (day, group_id, message_count)
+        SELECT date(message_date), group_id, COUNT(*)
+        FROM {source}
+        GROUP BY date(message_date), group_id
+    ''')
+
+    conn.execute(f'''
+        INSERT OR IGNORE INTO daily_active_users (day, user_id)
+        SELECT DISTINCT date(message_date), user_id
+        FROM {source}
+    ''')
+
+    conn.execute(f'''
+        INSERT INTO stats_totals (name, value)
+        SELECT 'messages', COUNT(*) FROM {source}
+        UNION ALL
+        SELECT 'users', COUNT(*) FROM users
+    ''')
+
+    total = conn.execute("SELECT value FROM stats_totals WHERE name = 'messages'").fetchone()[0]
+    logger.info(f"Agregados de estatísticas recalculados ({total} mensagens)")
+    return total
+
+
+def read_stats(conn):
+    """Lê os números do /stats a partir dos agregados"""
+    totals = dict(conn.execute('SELECT name, value FROM stats_totals').fetchall())
+
+    active_users = conn.execute('''
+        SELECT COUNT(DISTINCT user_id) FROM daily_active_users
+        WHERE day >= date('now', '-30 days')
+    ''').fetchone()[0]
+
+    today_messages = conn.execute('''
+        SELECT COALESCE(SUM(message_count), 0) FROM daily_message_counts
+        WHERE day = date('now')
+    ''').fetchone()[0]
+
+    return {
+        'total_users': totals.get('users', 0),
+        'active_users': active_users,
+        'total_messages': totals.get('messages', 0),
+        'today_messages': today_messages
+    }
+
+
+if __name__ == '__main__':
+    from analytics import create_analytics_tables, backfill_analytics
+    from database import Database
+
+    logging.basicConfig(
+        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+        level=logging.INFO
+    )
+    db_path = sys.argv[1] if len(sys.argv) > 1 else './data/bot.db'
+    db = Database(db_path, pool_size=1)
+    with db.transaction() as conn:
+        create_rollup_tables(conn.cursor())
+        backfill_rollups(conn)
+        create_analytics_tables(conn.cursor())
+        backfill_analytics(conn)
+    db.close()
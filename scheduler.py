@@ -0,0 +1,241 @@
+"""Envio agendado de mensagens predefinidas com expressões cron.
+
+Os agendamentos ficam na tabela `scheduled_posts` (template, grupos,
+expressão cron e fuso). Na inicialização todos são lidos em uma única
+consulta e colocados em um heap ordenado pelo próximo horário; um único
+timer (um job do JobQueue) dispara no primeiro vencimento, envia o que
+venceu e é rearmado para o seguinte.
+
+Cada agendamento guarda em `last_run_at` o último horário tratado. Ao
+voltar de uma parada, o horário perdido mais recente é enviado uma vez se
+estiver dentro de `misfire_grace` segundos; os anteriores (e os mais
+antigos que isso) são descartados.
+
+Expressões cron com 5 campos (minuto hora dia mês dia-da-semana), com
+`*`, listas, intervalos e passos (`*/15`, `1-5`, `0,30`). Dia da semana
+0 ou 7 é domingo; como no cron, se dia do mês e dia da semana forem
+restritos, basta um deles coincidir.
+"""
+import heapq
+import logging
+from collections import namedtuple
+from datetime import datetime, timedelta
+
+import pytz
+
+logger = logging.getLogger(__name__)
+
+ScheduledPost = namedtuple('ScheduledPost', 'id template_key chat_ids cron timezone last_run_at')
+
+
+def create_schedule_tables(cursor):
+    """Cria a tabela de agendamentos"""
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS scheduled_posts (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            template_key TEXT NOT NULL,
+            chat_ids TEXT NOT NULL,
+            cron TEXT NOT NULL,
+            timezone TEXT NOT NULL,
+            last_run_at REAL,
+            created_by INTEGER,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+
+
+def _row_to_post(row):
+    post_id, template_key, chat_ids, cron, timezone, last_run_at = row
+    return ScheduledPost(post_id, template_key, [int(c) for c in chat_ids.split(',') if c], cron, timezone, last_run_at)
+
+
+def load_posts(conn):
+    """Todos os agendamentos, em uma consulta"""
+    rows = conn.execute('''
+        SELECT id, template_key, chat_ids, cron, timezone, last_run_at
+        FROM scheduled_posts ORDER BY id
+    ''').fetchall()
+    return [_row_to_post(row) for row in rows]
+
+
+def posts_fingerprint(conn):
+    """(quantidade, maior id): muda quando um agendamento é criado ou removido"""
+    return tuple(conn.execute('SELECT COUNT(*), COALESCE(MAX(id), 0) FROM scheduled_posts').fetchone())
+
+
+def insert_post(conn, template_key, chat_ids, cron, timezone, created_by=None, now=None):
+    """Grava um agendamento novo; o primeiro envio é o próximo horário após `now`"""
+    cursor = conn.execute('''
+        INSERT INTO scheduled_posts (template_key, chat_ids, cron, timezone, last_run_at, created_by)
+        VALUES (?, ?, ?, ?, ?, ?)
+    ''', (template_key, ','.join(str(c) for c in chat_ids), cron, timezone, now, created_by))
+    return ScheduledPost(cursor.lastrowid, template_key, list(chat_ids), cron, timezone, now)
+
+
+def delete_post(conn, post_id):
+    return conn.execute('DELETE FROM scheduled_posts WHERE id = ?', (post_id,)).rowcount == 1
+
+
+def mark_post_run(conn, post_id, run_at):
+    conn.execute('UPDATE scheduled_posts SET last_run_at = ? WHERE id = ?', (run_at, post_id))
+
+
+class CronExpression:
+    """Expressão cron de 5 campos avaliada em um fuso horário"""
+
+    # (nome, mínimo, máximo)
+    FIELDS = (('minuto', 0, 59), ('hora', 0, 23), ('dia', 1, 31), ('mês', 1, 12), ('dia da semana', 0, 7))
+
+    def __init__(self, expression):
+        parts = expression.split()
+        if len(parts) != 5:
+            raise ValueError("A expressão cron precisa de 5 campos: minuto hora dia mês dia-da-semana")
+        self.expression = ' '.join(parts)
+        fields = [self._parse_field(part, *spec) for part, spec in zip(parts, self.FIELDS)]
+        self.minutes, self.hours, self.days, self.months, weekdays = fields
+        self.weekdays = {day % 7 for day in weekdays}
+        self.days_restricted = parts[2] != '*'
+        self.weekdays_restricted = parts[4] != '*'
+
+    @staticmethod
+    def _parse_field(text, name, low, high):
+        values = set()
+        for item in text.split(','):
+            value_range, _, step = item.partition('/')
+            try:
+                step = int(step) if step else 1
+                if value_range == '*':
+                    start, end = low, high
+                elif '-' in value_range:
+                    start, end = (int(v) for v in value_range.split('-', 1))
+                else:
+                    start = int(value_range)
+                    end = high if step > 1 else start
+            except ValueError:
+                raise ValueError(f"Campo {name} inválido: {text}") from None
+            if step < 1 or start < low or end > high or start > end:
+                raise ValueError(f"Campo {name} fora do intervalo {low}-{high}: {text}")
+            values.update(range(start, end + 1, step))
+        return values
+
+    def _day_matches(self, moment):
+        in_days = moment.day in self.days
+        in_weekdays = (moment.weekday() + 1) % 7 in self.weekdays
+        if self.days_restricted and self.weekdays_restricted:
+            return in_days or in_weekdays
+        return in_days and in_weekdays
+
+    def next_after(self, timestamp, tz):
+        """Próximo horário (timestamp) estritamente depois de `timestamp`, no fuso `tz`"""
+        local = datetime.fromtimestamp(timestamp, tz).replace(tzinfo=None, second=0, microsecond=0)
+        local += timedelta(minutes=1)
+        limit = local.year + 5
+
+        while local.year <= limit:
+            if local.month not in self.months:
+                year, month = (local.year + 1, 1) if local.month == 12 else (local.year, local.month + 1)
+                local = local.replace(year=year, month=month, day=1, hour=0, minute=0)
+            elif not self._day_matches(local):
+                local = (local + timedelta(days=1)).replace(hour=0, minute=0)
+            elif local.hour not in self.hours:
+                local = (local + timedelta(hours=1)).replace(minute=0)
+            elif local.minute not in self.minutes:
+                local += timedelta(minutes=1)
+            else:
+                # Horários inexistentes (início do horário de verão) caem na hora seguinte
+                return tz.normalize(tz.localize(local, is_dst=False)).timestamp()
+
+        raise ValueError(f"A expressão '{self.expression}' nunca executa")
+
+
+class PostScheduler:
+    """Heap com o próximo envio de cada agendamento"""
+
+    def __init__(self, misfire_grace=3600):
+        self.misfire_grace = misfire_grace
+        self._posts = {}
+        self._next = {}
+        self._heap = []
+
+    def __len__(self):
+        return len(self._posts)
+
+    def load(self, posts, now):
+        """Substitui todos os agendamentos (inicialização ou troca de líder)"""
+        self._posts.clear()
+        self._next.clear()
+        self._heap = []
+        for post in posts:
+            try:
+                self.add(post, now)
+            except (ValueError, pytz.UnknownTimeZoneError) as e:
+                logger.error(f"Agendamento {post.id} ignorado: {e}")
+
+    def add(self, post, now):
+        """Inclui ou atualiza um agendamento, tratando o horário perdido desde `last_run_at`"""
+        cron = CronExpression(post.cron)
+        tz = pytz.timezone(post.timezone)
+        last_run = post.last_run_at if post.last_run_at is not None else now
+
+        # Só a janela de tolerância é percorrida: depois de uma parada longa, um cron
+        # de minuto em minuto não precisa passar por cada horário perdido
+        grace_start = now - self.misfire_grace
+        if last_run < grace_start and cron.next_after(last_run, tz) <= grace_start:
+            logger.warning(f"Agendamento {post.id} ({post.template_key}): envios perdidos fora do prazo descartados")
+        next_run = cron.next_after(max(last_run, grace_start), tz)
+
+        if next_run <= now:
+            # Perdido durante a parada (dentro do prazo): só o mais recente
+            latest = next_run
+            while True:
+                candidate = cron.next_after(latest, tz)
+                if candidate > now:
+                    break
+                latest = candidate
+            next_run = latest
+            logger.info(f"Agendamento {post.id} ({post.template_key}) perdido às {self.format_time(latest, post.timezone)}, enviando agora")
+
+        self._posts[post.id] = (post, cron, tz)
+        self._schedule(post.id, next_run)
+        return next_run
+
+    def remove(self, post_id):
+        # A entrada no heap é descartada quando chegar ao topo
+        self._next.pop(post_id, None)
+        return self._posts.pop(post_id, None) is not None
+
+    def next_run_time(self):
+        """Timestamp do próximo envio, ou None"""
+        self._discard_stale()
+        return self._heap[0][0] if self._heap else None
+
+    def next_run_of(self, post_id):
+        return self._next.get(post_id)
+
+    def pop_due(self, now):
+        """Remove e retorna os envios vencidos [(post, horário)], já agendando os próximos"""
+        due = []
+        while True:
+            self._discard_stale()
+            if not self._heap or self._heap[0][0] > now:
+                break
+            run_at, post_id = heapq.heappop(self._heap)
+            post, cron, tz = self._posts[post_id]
+            due.append((post, run_at))
+            self._schedule(post_id, cron.next_after(max(run_at, now), tz))
+        return due
+
+    def posts(self):
+        return [entry[0] for entry in self._posts.values()]
+
+    def _schedule(self, post_id, run_at):
+        self._next[post_id] = run_at
+        heapq.heappush(self._heap, (run_at, post_id))
+
+    def _discard_stale(self):
+        while self._heap and self._next.get(self._heap[0][1]) != self._heap[0][0]:
+            heapq.heappop(self._heap)
+
+    @staticmethod
+    def format_time(timestamp, timezone):
+        return datetime.fromtimestamp(timestamp, pytz.timezone(timezone)).strftime('%d/%m/%Y %H:%M')
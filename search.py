@@ -0,0 +1,146 @@
+"""Busca de texto completo nas mensagens registradas (SQLite FTS5).
+
+`messages_fts` é um índice FTS5 de conteúdo externo sobre
+`messages.message_text`, mantido por triggers: toda gravação (buffer de
+escrita) e a retenção, que apaga as mensagens arquivadas,
+o atualizam sem código extra. Mensagens já movidas para o arquivo
+compactado não entram na busca.
+
+Os resultados são ordenados por relevância (bm25) entre todas as
+ocorrências da tabela quente; entre pontuações iguais, a mais recente vem
+primeiro. A paginação é por chave (score, id): cada página parte do
+último/primeiro item da anterior, e a busca fica presa ao maior id que
+casava quando foi feita, para as páginas não mudarem com mensagens novas.
+"""
+import logging
+import uuid
+from collections import OrderedDict, namedtuple
+
+logger = logging.getLogger(__name__)
+
+# Marcadores do trecho destacado (substituídos na formatação da resposta)
+HIGHLIGHT_START = '\x02'
+HIGHLIGHT_END = '\x03'
+
+SearchResult = namedtuple('SearchResult', 'message_id score snippet message_date group_id user_id first_name username')
+SearchPage = namedtuple('SearchPage', 'results has_prev has_next')
+
+
+def create_search_tables(cursor):
+    """Cria o índice FTS5 e as triggers; retorna True se o índice é novo (precisa de backfill)"""
+    exists = cursor.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'messages_fts'"
+    ).fetchone()
+
+    cursor.execute('''
+        CREATE VIRTUAL TABLE IF NOT EXISTS messages_fts USING fts5(
+            message_text,
+            content = 'messages',
+            content_rowid = 'id',
+            tokenize = 'unicode61 remove_diacritics 2'
+        )
+    ''')
+
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS messages_fts_insert AFTER INSERT ON messages BEGIN
+            INSERT INTO messages_fts (rowid, message_text) VALUES (new.id, new.message_text);
+        END
+    ''')
+
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS messages_fts_delete AFTER DELETE ON messages BEGIN
+            INSERT INTO messages_fts (messages_fts, rowid, message_text) VALUES ('delete', old.id, old.message_text);
+        END
+    ''')
+
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS messages_fts_update AFTER UPDATE OF message_text ON messages BEGIN
+            INSERT INTO messages_fts (messages_fts, rowid, message_text) VALUES ('delete', old.id, old.message_text);
+            INSERT INTO messages_fts (rowid, message_text) VALUES (new.id, new.message_text);
+        END
+    ''')
+
+    return exists is None
+
+
+def rebuild_search_index(conn):
+    """Reconstrói o índice a partir da tabela `messages`"""
+    conn.execute("INSERT INTO messages_fts (messages_fts) VALUES ('rebuild')")
+    total = conn.execute('SELECT COUNT(*) FROM messages').fetchone()[0]
+    logger.info(f"Índice de busca reconstruído ({total} mensagens)")
+    return total
+
+
+def build_match_query(term):
+    """Converte o texto digitado em uma consulta FTS5 segura (todas as palavras, como frases)"""
+    words = term.split()
+    return ' '.join('"' + word.replace('"', '""') + '"' for word in words)
+
+
+def latest_match(conn, match):
+    """Maior id que casa com a consulta (None se nenhuma mensagem casa)"""
+    return conn.execute(
+        'SELECT MAX(rowid) FROM messages_fts WHERE messages_fts MATCH ?', (match,)
+    ).fetchone()[0]
+
+
+def search_page(conn, match, high, after=None, before=None, page_size=5):
+    """Uma página de resultados com id até `high`, por relevância e depois recência.
+
+    `after`/`before` são cursores (score, id) do último/primeiro item da
+    página atual, para avançar ou voltar.
+    """
+    sql = f'''
+        SELECT f.rowid, bm25(messages_fts) AS score,
+               snippet(messages_fts, 0, '{HIGHLIGHT_START}', '{HIGHLIGHT_END}', '…', 16),
+               m.message_date, m.group_id, m.user_id, u.first_name, u.username
+        FROM messages_fts f
+        JOIN messages m ON m.id = f.rowid
+        LEFT JOIN users u ON u.user_id = m.user_id
+        WHERE messages_fts MATCH ? AND f.rowid <= ?
+    '''
+    params = [match, high]
+
+    if before is not None:
+        sql += ' AND (score < ? OR (score = ? AND f.rowid > ?)) ORDER BY score DESC, f.rowid LIMIT ?'
+        params += [before[0], before[0], before[1], page_size + 1]
+    else:
+        if after is not None:
+            sql += ' AND (score > ? OR (score = ? AND f.rowid < ?))'
+            params += [after[0], after[0], after[1]]
+        sql += ' ORDER BY score, f.rowid DESC LIMIT ?'
+        params.append(page_size + 1)
+
+    rows = [SearchResult(*row) for row in conn.execute(sql, params).fetchall()]
+    has_more = len(rows) > page_size
+    rows = rows[:page_size]
+
+    if before is not None:
+        rows.reverse()
+        return SearchPage(rows, has_prev=has_more, has_next=True)
+    return SearchPage(rows, has_prev=after is not None, has_next=has_more)
+
+
+class SearchSessions:
+    """Buscas recentes (termo e maior id) referenciadas pelos botões de página.
+
+    O callback_data do Telegram tem no máximo 64 bytes, então os botões levam
+    só um id curto e o cursor; o resto fica aqui, com descarte LRU.
+    """
+
+    def __init__(self, max_size=256):
+        self.max_size = max_size
+        self._sessions = OrderedDict()
+
+    def create(self, term, match, high):
+        session_id = uuid.uuid4().hex[:8]
+        self._sessions[session_id] = (term, match, high)
+        if len(self._sessions) > self.max_size:
+            self._sessions.popitem(last=False)
+        return session_id
+
+    def get(self, session_id):
+        session = self._sessions.get(session_id)
+        if session is not None:
+            self._sessions.move_to_end(session_id)
+        return session
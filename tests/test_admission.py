@@ -0,0 +1,53 @@
+import asyncio
+from types import SimpleNamespace
+
+from admission import PRIORITIES, PriorityUpdateProcessor
+from dedup import UpdateDeduplicator
+
+
+def test_queued_message_survives_watermark_sync_behind_higher_id_admin_updates():
+    dedup = UpdateDeduplicator()
+    processed = []
+
+    def classify(update):
+        return PRIORITIES.index(update.kind)
+
+    def duplicate(update):
+        return dedup.check(update.update_id) is not None
+
+    processor = PriorityUpdateProcessor(classify, shed=lambda update: None, duplicate=duplicate, concurrency=1)
+
+    async def main():
+        release = asyncio.Event()
+
+        async def handle(update, wait=False):
+            if wait:
+                await release.wait()
+            processed.append(update.update_id)
+
+        def submit(update_id, kind, wait=False):
+            update = SimpleNamespace(update_id=update_id, kind=kind)
+            return asyncio.ensure_future(processor.process_update(update, handle(update, wait)))
+
+        # Ocupa a única vaga; a mensagem (id 2) fica na fila atrás dos comandos de admin (ids 3..5)
+        tasks = [submit(1, 'admin', wait=True), submit(2, 'message')]
+        tasks += [submit(update_id, 'admin') for update_id in (3, 4, 5)]
+        await asyncio.sleep(0)
+        assert processor.depth_of('message') == 1
+
+        # Duas gravações da marca d'água enquanto a mensagem ainda espera
+        for _ in range(2):
+            dedup.adopt_floor(dedup.highest)
+        assert dedup.floor == 5
+
+        release.set()
+        await asyncio.gather(*tasks)
+
+        # Um reenvio do mesmo update continua sendo descartado
+        await submit(2, 'message')
+
+    asyncio.run(main())
+
+    assert sorted(processed) == [1, 2, 3, 4, 5]
+    assert processed.index(2) > processed.index(5)
+    assert dedup.duplicates == 1
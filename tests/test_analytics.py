@@ -0,0 +1,64 @@
+from datetime import datetime, timedelta, timezone
+
+from analytics import (
+    activity_slot, apply_activity_counters, backfill_analytics, create_analytics_tables, read_activity, read_ranking
+)
+from database import Database
+
+
+def _db(path):
+    db = Database(str(path), pool_size=1)
+    with db.transaction() as conn:
+        conn.execute('CREATE TABLE users (user_id INTEGER PRIMARY KEY, username TEXT, first_name TEXT)')
+        conn.execute('CREATE TABLE messages (id INTEGER PRIMARY KEY AUTOINCREMENT, user_id INTEGER, '
+                     'message_text TEXT, message_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP, group_id INTEGER)')
+        conn.executemany('INSERT INTO users (user_id, username, first_name) VALUES (?, ?, ?)',
+                         [(1, 'ana', 'Ana'), (2, 'bia', 'Bia'), (3, None, 'Caio')])
+        create_analytics_tables(conn.cursor())
+    return db
+
+
+def _days_ago(days, hour=12):
+    moment = datetime.now(timezone.utc).replace(hour=hour, minute=0, second=0) - timedelta(days=days)
+    return moment.strftime('%Y-%m-%d %H:%M:%S')
+
+
+def _log(db, messages):
+    with db.transaction() as conn:
+        conn.executemany('INSERT INTO messages (user_id, message_text, message_date, group_id) VALUES (?, ?, ?, ?)',
+                         messages)
+        apply_activity_counters(conn, messages)
+
+
+def test_ranking_counts_only_the_requested_days(tmp_path):
+    db = _db(tmp_path / 'bot.db')
+    try:
+        _log(db, [(1, 'a', _days_ago(0), -100), (1, 'b', _days_ago(1), -100), (2, 'c', _days_ago(2), -100)])
+        _log(db, [(3, 'd', _days_ago(30), -100)] * 5)
+        with db.connection() as conn:
+            assert read_ranking(conn, days=7) == [(1, 'Ana', 'ana', 2), (2, 'Bia', 'bia', 1)]
+            assert read_ranking(conn, days=60, limit=1) == [(3, 'Caio', None, 5)]
+    finally:
+        db.close()
+
+
+def test_activity_heatmap_shifts_to_local_time_and_matches_backfill(tmp_path):
+    db = _db(tmp_path / 'bot.db')
+    try:
+        # 2024-03-04 é uma segunda-feira; 02h UTC é domingo 23h em UTC-3
+        _log(db, [(1, 'a', '2024-03-04 02:15:00', -100), (2, 'b', '2024-03-04 02:45:00', -100),
+                  (1, 'c', '2024-03-06 18:00:00', -200)])
+        assert activity_slot('2024-03-04 02:15:00') == 2
+
+        with db.connection() as conn:
+            utc = read_activity(conn, -100)
+            local = read_activity(conn, -100, utc_offset_hours=-3)
+            incremental = conn.execute('SELECT * FROM activity_buckets ORDER BY 1, 2').fetchall()
+        assert utc[2] == 2 and sum(utc) == 2
+        assert local[6 * 24 + 23] == 2
+
+        with db.transaction() as conn:
+            assert backfill_analytics(conn) == 3
+            assert conn.execute('SELECT * FROM activity_buckets ORDER BY 1, 2').fetchall() == incremental
+    finally:
+        db.close()
@@ -0,0 +1,40 @@
+from antiflood import FloodGuard, FloodLimits, parse_group_limits
+
+LIMITS = FloodLimits(max_messages=3, window=10.0, max_repeats=2, mute_seconds=60)
+
+
+def test_flood_starts_a_burst_until_the_user_goes_quiet():
+    guard = FloodGuard(LIMITS)
+    results = [guard.check(-100, 1, f'msg {i}', now=float(i)) for i in range(5)]
+    # A 4ª mensagem em menos de 10s passa do limite; as seguintes fazem parte da rajada
+    assert results == [None, None, None, 'flood', 'burst']
+    assert guard.bursts == 1 and guard.suppressed == 2
+
+    # Outro usuário no mesmo chat não é afetado
+    assert guard.check(-100, 2, 'oi', now=4.0) is None
+
+    # Depois de uma janela em silêncio, volta ao normal
+    assert guard.check(-100, 1, 'voltei', now=20.0) is None
+
+
+def test_repeated_text_is_flagged_after_max_repeats():
+    guard = FloodGuard(LIMITS)
+    assert [guard.check(-100, 1, 'compre agora', now=t) for t in (0.0, 5.0, 10.0)] == [None, None, 'repeat']
+
+
+def test_group_limits_override_the_default():
+    limits = parse_group_limits('-200:1::0:0, -300:0', LIMITS)
+    assert limits[-200] == FloodLimits(1, 10.0, 0, 0)
+    guard = FloodGuard(LIMITS, group_limits=limits)
+    assert [guard.check(-200, 1, f'{i}', now=float(i)) for i in range(2)] == [None, 'flood']
+    # max_messages 0 desativa a verificação no grupo
+    assert all(guard.check(-300, 1, 'x', now=0.0) is None for _ in range(10))
+
+
+def test_idle_users_are_evicted():
+    guard = FloodGuard(LIMITS, max_tracked=2)
+    for user_id in range(3):
+        guard.check(-100, user_id, 'oi', now=0.0)
+    assert len(guard) == 2
+    guard.check(-100, 9, 'oi', now=100.0)
+    assert len(guard) == 1
@@ -0,0 +1,54 @@
+from database import Database
+from dedup import WATERMARK_MAX_AGE, UpdateDeduplicator, create_dedup_tables, sync_watermark
+
+
+def _db(path):
+    db = Database(str(path), pool_size=1)
+    with db.transaction() as conn:
+        create_dedup_tables(conn.cursor())
+    return db
+
+
+def test_recent_ids_are_dropped_and_out_of_order_ids_pass():
+    dedup = UpdateDeduplicator(capacity=3)
+    assert [dedup.check(i) for i in (10, 12, 11)] == [None, None, None]
+    assert dedup.check(12) == 'recent'
+    assert dedup.duplicates_recent == 1
+    assert dedup.highest == 12
+
+
+def test_watermark_survives_restart(tmp_path):
+    db = _db(tmp_path / 'bot.db')
+    try:
+        first = UpdateDeduplicator()
+        for update_id in (100, 101, 102):
+            first.check(update_id)
+        with db.transaction() as conn:
+            assert sync_watermark(conn, first.highest) is None
+
+        # Nova instância (reinício ou outra réplica): adota o piso salvo
+        second = UpdateDeduplicator()
+        with db.transaction() as conn:
+            second.adopt_floor(sync_watermark(conn, second.highest))
+        assert second.check(101) == 'watermark'
+        assert second.check(103) is None
+        assert second.duplicates_watermark == 1
+
+        # A marca nunca recua
+        with db.transaction() as conn:
+            assert sync_watermark(conn, 50) == 102
+            assert sync_watermark(conn, None) == 102
+    finally:
+        db.close()
+
+
+def test_stale_watermark_is_ignored(tmp_path):
+    db = _db(tmp_path / 'bot.db')
+    try:
+        with db.transaction() as conn:
+            sync_watermark(conn, 500, now=0)
+            # Uma semana sem updates: os ids podem ter sido sorteados de novo
+            assert sync_watermark(conn, 7, now=WATERMARK_MAX_AGE + 1) is None
+            assert sync_watermark(conn, None, now=WATERMARK_MAX_AGE + 2) == 7
+    finally:
+        db.close()
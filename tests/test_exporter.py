@@ -0,0 +1,79 @@
+import csv
+
+from database import Database, UPSERT_USER_SQL
+from exporter import create_export_tables, export, get_last_exported_id, set_last_exported_id, state_key
+
+
+def _users_db(path):
+    db = Database(str(path), pool_size=1)
+    with db.transaction() as conn:
+        conn.execute('''
+            CREATE TABLE users (
+                user_id INTEGER PRIMARY KEY,
+                username TEXT,
+                first_name TEXT,
+                last_name TEXT,
+                join_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                is_active BOOLEAN DEFAULT 1
+            )
+        ''')
+        create_export_tables(conn.cursor())
+    return db
+
+
+def _add_user(db, user_id):
+    with db.transaction() as conn:
+        conn.execute(UPSERT_USER_SQL, (user_id, None, f'user{user_id}', None))
+
+
+def _exported_ids(path):
+    with open(path, newline='', encoding='utf-8') as f:
+        return [int(row['user_id']) for row in csv.DictReader(f)]
+
+
+def _incremental(db, tmp_path, name):
+    key = state_key('users', 'test')
+    with db.connection() as conn:
+        since = get_last_exported_id(conn, key)
+    result = export(db, 'users', str(tmp_path / name), 'csv', since_id=since)
+    if result.rows:
+        with db.transaction() as conn:
+            set_last_exported_id(conn, key, result.last_id)
+    return _exported_ids(tmp_path / name)
+
+
+def test_incremental_users_export_includes_new_member_with_lower_id(tmp_path):
+    db = _users_db(tmp_path / 'bot.db')
+    try:
+        for user_id in (500, 900):
+            _add_user(db, user_id)
+        assert _incremental(db, tmp_path, 'first.csv') == [500, 900]
+
+        # Membro novo com id do Telegram menor que o último exportado
+        _add_user(db, 100)
+        # Atualização de um usuário já exportado não o coloca de novo na fila
+        with db.transaction() as conn:
+            conn.execute(UPSERT_USER_SQL, (900, 'renamed', 'user900', None))
+
+        assert _incremental(db, tmp_path, 'second.csv') == [100]
+        assert _incremental(db, tmp_path, 'third.csv') == []
+    finally:
+        db.close()
+
+
+def test_existing_user_cursor_is_converted(tmp_path):
+    db = Database(str(tmp_path / 'bot.db'), pool_size=1)
+    try:
+        with db.transaction() as conn:
+            conn.execute('CREATE TABLE users (user_id INTEGER PRIMARY KEY, username TEXT, first_name TEXT, '
+                         'last_name TEXT, join_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP, is_active BOOLEAN DEFAULT 1)')
+            conn.executemany('INSERT INTO users (user_id) VALUES (?)', [(10,), (20,), (30,)])
+            conn.execute('CREATE TABLE export_state (name TEXT PRIMARY KEY, last_id INTEGER NOT NULL, '
+                         'exported_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP) WITHOUT ROWID')
+            # Marcador antigo: último user_id exportado
+            set_last_exported_id(conn, state_key('users', 'test'), 20)
+            create_export_tables(conn.cursor())
+
+        assert _incremental(db, tmp_path, 'next.csv') == [30]
+    finally:
+        db.close()
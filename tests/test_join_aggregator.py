@@ -0,0 +1,44 @@
+import asyncio
+
+from join_aggregator import JoinBurstAggregator
+
+
+def test_burst_of_joins_is_welcomed_once():
+    batches = []
+
+    async def send_batch(bot, chat_id, members):
+        batches.append((chat_id, list(members)))
+
+    aggregator = JoinBurstAggregator(send_batch, window=0.05, burst_threshold=2, rate_window=60)
+
+    async def main():
+        individual = [aggregator.add('bot', -100, [name]) for name in ('ana', 'bia')]
+        grouped = [aggregator.add('bot', -100, [name]) for name in ('caio', 'duda', 'edu')]
+        other_chat = aggregator.add('bot', -200, ['fabi'])
+        pending = aggregator.pending_count
+        await asyncio.sleep(0.1)
+        return individual, grouped, other_chat, pending
+
+    individual, grouped, other_chat, pending = asyncio.run(main())
+    assert individual == [True, True]
+    assert grouped == [False, False, False]
+    assert other_chat is True
+    assert pending == 3
+    assert batches == [(-100, ['caio', 'duda', 'edu'])]
+    assert aggregator.pending_count == 0
+
+
+def test_flush_all_sends_pending_welcomes_on_shutdown():
+    batches = []
+
+    async def send_batch(bot, chat_id, members):
+        batches.append((chat_id, list(members)))
+
+    aggregator = JoinBurstAggregator(send_batch, window=60, burst_threshold=0)
+
+    async def main():
+        assert aggregator.add('bot', -100, ['ana', 'bia']) is False
+        await aggregator.flush_all()
+
+    asyncio.run(main())
+    assert batches == [(-100, ['ana', 'bia'])]
@@ -0,0 +1,62 @@
+import time
+
+from database import Database
+from leader import JobRunLog, LeaderElector, SqliteLeaseBackend, create_lease_tables
+
+
+def _db(path):
+    db = Database(str(path), pool_size=1)
+    with db.transaction() as conn:
+        create_lease_tables(conn.cursor())
+    return db
+
+
+def test_replica_takes_over_an_expired_lease(tmp_path):
+    db = _db(tmp_path / 'bot.db')
+    try:
+        backend = SqliteLeaseBackend(db)
+        first = LeaderElector(backend, holder='a', ttl=0.2)
+        second = LeaderElector(backend, holder='b', ttl=0.2)
+
+        assert first.renew()
+        assert not second.renew()
+        assert first.renew()  # Renovação pelo dono
+
+        # O líder para de renovar: o lease expira e a outra réplica assume
+        time.sleep(0.3)
+        assert second.renew()
+        assert not first.renew()
+        assert not first.is_leader
+    finally:
+        db.close()
+
+
+def test_released_lease_is_taken_immediately(tmp_path):
+    db = _db(tmp_path / 'bot.db')
+    try:
+        backend = SqliteLeaseBackend(db)
+        first = LeaderElector(backend, holder='a', ttl=60)
+        second = LeaderElector(backend, holder='b', ttl=60)
+        assert first.renew()
+        first.release()
+        assert second.renew()
+    finally:
+        db.close()
+
+
+def test_job_run_is_claimed_once(tmp_path):
+    db = _db(tmp_path / 'bot.db')
+    try:
+        runs = JobRunLog(db)
+        assert runs.claim('lembrete:2024-05-01', 'a')
+        # Outro processo que também se acha líder, ou o mesmo depois de reiniciar
+        assert not runs.claim('lembrete:2024-05-01', 'b')
+        assert not runs.claim('lembrete:2024-05-01', 'a')
+        assert runs.claim('lembrete:2024-05-02', 'b')
+
+        runs.finish('lembrete:2024-05-01', 'done')
+        with db.connection() as conn:
+            assert conn.execute("SELECT holder, status FROM job_runs WHERE run_key = 'lembrete:2024-05-01'"
+                                ).fetchone() == ('a', 'done')
+    finally:
+        db.close()
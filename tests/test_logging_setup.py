@@ -0,0 +1,37 @@
+import logging
+import random
+
+from logging_setup import HOT, HotPathSampler, parse_levels
+
+
+def _record(hot=True):
+    record = logging.LogRecord('bot', logging.DEBUG, __file__, 1, 'mensagem', (), None)
+    if hot:
+        record.__dict__.update(HOT)
+    return record
+
+
+def test_sampling_keeps_roughly_the_configured_fraction():
+    random.seed(1)
+    sampler = HotPathSampler(sample=0.25, rate=0)
+    kept = sum(sampler.filter(_record()) for _ in range(4000))
+    assert 850 < kept < 1150
+
+
+def test_rate_limit_reports_omitted_lines_on_the_next_kept_one(monkeypatch):
+    clock = [100.0]
+    monkeypatch.setattr('logging_setup.time.monotonic', lambda: clock[0])
+    sampler = HotPathSampler(sample=1.0, rate=3)
+
+    assert [sampler.filter(_record()) for _ in range(5)] == [True, True, True, False, False]
+    # Registros fora do caminho quente nunca são descartados
+    assert sampler.filter(_record(hot=False))
+
+    clock[0] = 101.0
+    record = _record()
+    assert sampler.filter(record)
+    assert record.omitted == 2
+
+
+def test_parse_levels():
+    assert parse_levels('httpx=warning, bot=DEBUG,invalido') == {'httpx': 'WARNING', 'bot': 'DEBUG'}
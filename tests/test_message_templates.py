@@ -0,0 +1,49 @@
+import os
+
+from message_templates import TemplateRegistry, load_templates_file
+
+SHIPPED_MD = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'mensagens_prontas_auge_traders.md')
+LINKS = {'mentoria_link': 'https://mentoria', 'duvidas_link': 'https://duvidas'}
+
+
+def _registry(tmp_path, content, builtin=None):
+    path = tmp_path / 'mensagens.md'
+    path.write_text(content, encoding='utf-8')
+    builtin = builtin or {'morning_alert': 'padrão', 'market_alert': 'padrão'}
+    return TemplateRegistry(builtin, LINKS, source_path=str(path))
+
+
+def test_md_heading_overrides_builtin_template(tmp_path):
+    templates = _registry(tmp_path, '### Mensagem 3 - Aviso Matinal\n```\nBom dia editado\n```\n')
+    assert templates.get('morning_alert').text == 'Bom dia editado'
+    assert templates.get('market_alert').text == 'padrão'
+
+
+def test_md_key_marker_overrides_builtin_template(tmp_path):
+    content = (
+        '### Alerta reescrito\n<!-- key: market_alert -->\n```\nAlerta {mentoria_link}\n```\n'
+        '### Mensagem 2 - Boas-vindas Alternativa\n```\nOlá {name}\n```\n'
+    )
+    templates = _registry(tmp_path, content)
+    assert templates.get('market_alert').text == 'Alerta https://mentoria'
+    assert templates.render('boas_vindas_alternativa', name='Ana').text == 'Olá Ana'
+
+
+def test_shipped_md_replaces_builtin_keys():
+    loaded = load_templates_file(SHIPPED_MD)
+    assert {'welcome_main', 'morning_alert', 'market_alert', 'weekend'} <= set(loaded)
+
+
+def test_shipped_md_uses_configured_links():
+    loaded = load_templates_file(SHIPPED_MD)
+    assert not any('mentoriaaugetraders.com.br' in text or 't.me/+' in text for text in loaded.values())
+
+    templates = TemplateRegistry({}, LINKS, source_path=SHIPPED_MD)
+    welcome = templates.render('welcome_main', name='Ana').text
+    assert '(https://mentoria)' in welcome and '(https://duvidas)' in welcome
+    assert '{' not in welcome
+
+
+def test_stray_braces_fall_back_to_raw_text(tmp_path):
+    templates = _registry(tmp_path, '### Aviso\n<!-- key: morning_alert -->\n```\nUse {0} ou } e {mentoria_link} {name}\n```\n')
+    assert templates.render('morning_alert', name='Ana').text == 'Use {0} ou } e https://mentoria Ana'
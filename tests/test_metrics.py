@@ -0,0 +1,28 @@
+import urllib.error
+import urllib.request
+
+import pytest
+
+from metrics import BotMetrics, MetricsServer, authorized
+
+
+def test_authorized_requires_matching_bearer_token():
+    assert authorized('Bearer s3cr3t', 's3cr3t')
+    assert not authorized('Bearer errado', 's3cr3t')
+    assert not authorized('Basic s3cr3t', 's3cr3t')
+    assert not authorized(None, 's3cr3t')
+
+
+def test_metrics_server_rejects_requests_without_token():
+    server = MetricsServer(BotMetrics(), 0, host='127.0.0.1', token='s3cr3t').start()
+    url = f'http://127.0.0.1:{server.port}/metrics'
+    try:
+        with pytest.raises(urllib.error.HTTPError) as error:
+            urllib.request.urlopen(url, timeout=5)
+        assert error.value.code == 401
+
+        request = urllib.request.Request(url, headers={'Authorization': 'Bearer s3cr3t'})
+        with urllib.request.urlopen(request, timeout=5) as response:
+            assert response.status == 200
+    finally:
+        server.stop()
@@ -0,0 +1,83 @@
+import asyncio
+import time
+
+from telegram.error import Forbidden
+
+from broadcast import SendLimiter
+from database import AsyncDatabase, Database
+from outbox import Outbox, create_outbox_tables
+
+
+class FakeBot:
+    def __init__(self, forbidden=()):
+        self.forbidden = set(forbidden)
+        self.sent = []
+
+    async def send_message(self, chat_id, text, **kwargs):
+        if chat_id in self.forbidden:
+            raise Forbidden('bot was kicked')
+        self.sent.append((chat_id, text))
+
+
+def test_batch_status_reports_failures_and_failed_rows_are_pruned(tmp_path):
+    db = Database(str(tmp_path / 'bot.db'), pool_size=1)
+    async_db = AsyncDatabase()
+    with db.transaction() as conn:
+        create_outbox_tables(conn.cursor())
+    outbox = Outbox(db, async_db, SendLimiter(global_rate=100, per_chat_per_minute=600), poll_interval=0.05)
+    bot = FakeBot(forbidden={2})
+
+    async def main():
+        outbox.start(bot)
+        await outbox.enqueue([1, 2, 3], 'oi', batch='lote')
+        for _ in range(100):
+            remaining, failed = outbox.batch_status('lote')
+            if not remaining:
+                break
+            await asyncio.sleep(0.05)
+        await outbox.stop()
+        return remaining, failed
+
+    try:
+        remaining, failed = asyncio.run(main())
+        assert remaining == 0
+        assert list(failed) == [2] and 'kicked' in failed[2]
+        assert sorted(chat_id for chat_id, _ in bot.sent) == [1, 3]
+
+        assert outbox.prune_failed(max_age=3600) == 0
+        time.sleep(0.01)
+        assert outbox.prune_failed(max_age=0) == 1
+        assert outbox.counts() == {}
+    finally:
+        async_db.close()
+        db.close()
+
+
+class HangingBot:
+    async def send_message(self, chat_id, text, **kwargs):
+        await asyncio.Event().wait()
+
+
+def test_stop_timeout_releases_every_claim_of_this_instance(tmp_path):
+    db = Database(str(tmp_path / 'bot.db'), pool_size=1)
+    async_db = AsyncDatabase()
+    with db.transaction() as conn:
+        create_outbox_tables(conn.cursor())
+    outbox = Outbox(db, async_db, SendLimiter(global_rate=100, per_chat_per_minute=600), workers=1, poll_interval=0.05)
+
+    async def main():
+        outbox.start(HangingBot())
+        await outbox.enqueue([1, 2], 'oi')
+        while not outbox.inflight:
+            await asyncio.sleep(0.01)
+        # Reserva que terminou no banco mas cujo resultado o despachante não chegou a receber
+        claimed = await async_db.write(outbox._claim, time.time(), 1, {1})
+        assert [message.chat_id for message in claimed] == [2]
+        await outbox.stop(timeout=0.1)
+
+    try:
+        asyncio.run(main())
+        assert outbox.counts() == {'pending': 2}
+    finally:
+        async_db.close()
+        db.close()
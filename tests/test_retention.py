@@ -0,0 +1,67 @@
+from database import Database
+from retention import SQL_FUNCTIONS, archive_batch, create_archive_tables, list_archive_tables, unzip_text
+from rollups import apply_message_rollups, backfill_rollups, create_rollup_tables
+from search import create_search_tables
+
+MESSAGES = [
+    (1, 'bom dia pessoal ' * 10, '2024-01-10 09:00:00', -100),
+    (2, 'análise do mercado hoje', '2024-01-20 14:30:00', -100),
+    (1, 'mercado em alta', '2024-02-03 11:00:00', -200),
+    (3, 'mercado recente', '2030-05-01 08:00:00', -100),
+]
+
+
+def _db(path):
+    db = Database(str(path), pool_size=1, functions=SQL_FUNCTIONS)
+    with db.transaction() as conn:
+        conn.execute('CREATE TABLE users (user_id INTEGER PRIMARY KEY, username TEXT, first_name TEXT, '
+                     'last_name TEXT, join_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP, is_active BOOLEAN DEFAULT 1)')
+        conn.execute('CREATE TABLE messages (id INTEGER PRIMARY KEY AUTOINCREMENT, user_id INTEGER, '
+                     'message_text TEXT, message_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP, group_id INTEGER)')
+        create_archive_tables(conn.cursor())
+        create_rollup_tables(conn.cursor())
+        create_search_tables(conn.cursor())
+        conn.executemany('INSERT INTO messages (user_id, message_text, message_date, group_id) VALUES (?, ?, ?, ?)',
+                         MESSAGES)
+        apply_message_rollups(conn, MESSAGES)
+    return db
+
+
+def _daily_counts(conn):
+    return conn.execute('SELECT day, group_id, message_count FROM daily_message_counts ORDER BY 1, 2').fetchall()
+
+
+def test_archive_round_trip_keeps_search_and_rollups_consistent(tmp_path):
+    db = _db(tmp_path / 'bot.db')
+    try:
+        with db.connection() as conn:
+            counts_before = _daily_counts(conn)
+
+        with db.transaction() as conn:
+            assert archive_batch(conn, '2025-01-01 00:00:00') == 3
+
+        with db.connection() as conn:
+            assert conn.execute('SELECT message_text FROM messages').fetchall() == [('mercado recente',)]
+            assert list_archive_tables(conn) == ['messages_archive_202401', 'messages_archive_202402']
+
+            archived = conn.execute('SELECT user_id, message_text, message_date, group_id FROM messages_archive_202401 '
+                                    'UNION ALL SELECT user_id, message_text, message_date, group_id '
+                                    'FROM messages_archive_202402 ORDER BY message_date').fetchall()
+            # O texto longo foi compactado e volta exatamente igual
+            assert isinstance(archived[0][1], bytes)
+            assert [(u, unzip_text(t), d, g) for u, t, d, g in archived] == MESSAGES[:3]
+            assert conn.execute('SELECT COUNT(*) FROM messages_all').fetchone()[0] == len(MESSAGES)
+
+            # O índice de busca acompanha a tabela quente
+            conn.execute("INSERT INTO messages_fts (messages_fts) VALUES ('integrity-check')")
+            hits = conn.execute("SELECT rowid FROM messages_fts WHERE messages_fts MATCH 'mercado'").fetchall()
+            assert hits == [(4,)]
+
+            # Arquivar não muda os agregados, que continuam batendo com o histórico completo
+            assert _daily_counts(conn) == counts_before
+
+        with db.transaction() as conn:
+            backfill_rollups(conn)
+            assert _daily_counts(conn) == counts_before
+    finally:
+        db.close()
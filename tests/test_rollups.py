@@ -0,0 +1,76 @@
+from analytics import activity_slot, apply_activity_counters, create_analytics_tables
+from database import Database
+from rollups import apply_message_rollups, create_rollup_tables, read_stats
+from write_buffer import WriteBehindBuffer
+
+
+def _db(path):
+    db = Database(str(path), pool_size=1)
+    with db.transaction() as conn:
+        conn.execute('CREATE TABLE users (user_id INTEGER PRIMARY KEY, username TEXT, first_name TEXT, '
+                     'last_name TEXT, join_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP, is_active BOOLEAN DEFAULT 1)')
+        conn.execute('CREATE TABLE messages (id INTEGER PRIMARY KEY AUTOINCREMENT, user_id INTEGER, '
+                     'message_text TEXT, message_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP, group_id INTEGER)')
+        create_rollup_tables(conn.cursor())
+        create_analytics_tables(conn.cursor())
+    return db
+
+
+def _assert_rollups_match_messages(conn):
+    assert conn.execute('SELECT day, group_id, message_count FROM daily_message_counts ORDER BY 1, 2').fetchall() == \
+        conn.execute('SELECT date(message_date), group_id, COUNT(*) FROM messages GROUP BY 1, 2 ORDER BY 1, 2').fetchall()
+    assert conn.execute('SELECT day, user_id FROM daily_active_users ORDER BY 1, 2').fetchall() == \
+        conn.execute('SELECT DISTINCT date(message_date), user_id FROM messages ORDER BY 1, 2').fetchall()
+    assert conn.execute("SELECT value FROM stats_totals WHERE name = 'messages'").fetchone()[0] == \
+        conn.execute('SELECT COUNT(*) FROM messages').fetchone()[0]
+
+    hourly = {}
+    for message_date, group_id in conn.execute('SELECT message_date, group_id FROM messages').fetchall():
+        key = (group_id, activity_slot(message_date))
+        hourly[key] = hourly.get(key, 0) + 1
+    assert dict(((g, s), c) for g, s, c in conn.execute(
+        'SELECT group_id, slot, message_count FROM activity_buckets').fetchall()) == hourly
+
+
+def test_buffer_flush_updates_rollups_in_the_same_batch(tmp_path):
+    db = _db(tmp_path / 'bot.db')
+    buffer = WriteBehindBuffer(db, max_batch=1000, flush_interval=3600)
+    try:
+        for user_id, group_id in [(1, -100), (2, -100), (1, -100), (3, -200)]:
+            buffer.add_user(user_id, None, f'user{user_id}', None)
+            buffer.add_message(user_id, 'oi', group_id)
+        assert buffer.flush() == 7
+
+        with db.connection() as conn:
+            _assert_rollups_match_messages(conn)
+            stats = read_stats(conn)
+        assert stats['total_users'] == 3
+        assert stats['total_messages'] == 4
+        assert stats['today_messages'] == 4
+        assert stats['active_users'] == 3
+    finally:
+        buffer.close()
+        db.close()
+
+
+def test_rollups_split_batches_by_day_and_hour(tmp_path):
+    db = _db(tmp_path / 'bot.db')
+    batches = [
+        [(1, 'a', '2024-03-10 23:59:59', -100), (2, 'b', '2024-03-11 00:00:00', -100)],
+        [(1, 'c', '2024-03-11 00:30:00', -100), (1, 'd', '2024-03-11 13:00:00', -200)],
+    ]
+    try:
+        for batch in batches:
+            with db.transaction() as conn:
+                conn.executemany('INSERT INTO messages (user_id, message_text, message_date, group_id) '
+                                 'VALUES (?, ?, ?, ?)', batch)
+                apply_message_rollups(conn, batch)
+                apply_activity_counters(conn, batch)
+
+        with db.connection() as conn:
+            _assert_rollups_match_messages(conn)
+            assert conn.execute(
+                "SELECT message_count FROM daily_message_counts WHERE day = '2024-03-11' AND group_id = -100"
+            ).fetchone()[0] == 2
+    finally:
+        db.close()
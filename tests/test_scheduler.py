@@ -0,0 +1,44 @@
+import pytz
+
+from scheduler import CronExpression, PostScheduler, ScheduledPost
+
+TZ = 'America/Sao_Paulo'
+NOW = 1760000000.0  # 2025-10-09 09:53:20 UTC
+
+
+def _post(cron, last_run_at):
+    return ScheduledPost(1, 'morning_alert', [-100], cron, TZ, last_run_at)
+
+
+def test_long_outage_only_scans_grace_window(monkeypatch):
+    calls = []
+    next_after = CronExpression.next_after
+
+    def counting(self, timestamp, tz):
+        calls.append(timestamp)
+        return next_after(self, timestamp, tz)
+
+    monkeypatch.setattr(CronExpression, 'next_after', counting)
+    scheduler = PostScheduler(misfire_grace=3600)
+    next_run = scheduler.add(_post('* * * * *', NOW - 30 * 86400), NOW)
+
+    # Uma parada de 30 dias não percorre ~43 mil minutos, só a última hora
+    assert len(calls) <= 64
+    assert NOW - 60 < next_run <= NOW
+
+
+def test_missed_run_outside_grace_is_skipped():
+    scheduler = PostScheduler(misfire_grace=600)
+    # Diário às 06:00 local; o último envio foi há dois dias e o de hoje venceu há mais de 10 min
+    next_run = scheduler.add(_post('0 6 * * *', NOW - 2 * 86400), NOW)
+    assert next_run > NOW
+    assert next_run == CronExpression('0 6 * * *').next_after(NOW, pytz.timezone(TZ))
+
+
+def test_missed_run_inside_grace_is_sent_once():
+    scheduler = PostScheduler(misfire_grace=3600)
+    due_at = CronExpression('*/15 * * * *').next_after(NOW - 1800, pytz.timezone(TZ))
+    next_run = scheduler.add(_post('*/15 * * * *', NOW - 1800), NOW)
+    assert due_at <= next_run <= NOW
+    assert len(scheduler.pop_due(NOW)) == 1
+    assert scheduler.next_run_time() > NOW
@@ -0,0 +1,65 @@
+from database import Database
+from search import build_match_query, create_search_tables, latest_match, search_page
+
+
+def _db(path, texts):
+    db = Database(str(path), pool_size=1)
+    with db.transaction() as conn:
+        conn.execute('CREATE TABLE users (user_id INTEGER PRIMARY KEY, username TEXT, first_name TEXT)')
+        conn.execute('CREATE TABLE messages (id INTEGER PRIMARY KEY AUTOINCREMENT, user_id INTEGER, '
+                     'message_text TEXT, message_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP, group_id INTEGER)')
+        create_search_tables(conn.cursor())
+        conn.executemany('INSERT INTO messages (user_id, message_text, group_id) VALUES (1, ?, -100)',
+                         [(text,) for text in texts])
+    return db
+
+
+def _all_pages(conn, match, high, page_size):
+    ids, after = [], None
+    while True:
+        page = search_page(conn, match, high, after=after, page_size=page_size)
+        ids += [result.message_id for result in page.results]
+        if not page.has_next:
+            return ids
+        last = page.results[-1]
+        after = (last.score, last.message_id)
+
+
+def test_relevant_old_message_outranks_many_recent_matches(tmp_path):
+    # A mensagem mais relevante é a primeira; depois vêm milhares de ocorrências fracas
+    texts = ['stop loss stop loss stop loss']
+    texts += [f'mensagem {i} sobre o mercado e um stop qualquer no meio do texto' for i in range(3000)]
+    db = _db(tmp_path / 'bot.db', texts)
+    try:
+        match = build_match_query('stop')
+        with db.connection() as conn:
+            high = latest_match(conn, match)
+            page = search_page(conn, match, high, page_size=3)
+        assert page.results[0].message_id == 1
+        # Empate de relevância: a mais recente primeiro
+        assert [r.message_id for r in page.results[1:]] == [3001, 3000]
+    finally:
+        db.close()
+
+
+def test_pages_cover_every_match_once_in_both_directions(tmp_path):
+    db = _db(tmp_path / 'bot.db', ['alta', 'alta alta', 'baixa', 'alta', 'alta no fechamento', 'alta'])
+    try:
+        match = build_match_query('alta')
+        with db.connection() as conn:
+            high = latest_match(conn, match)
+            ids = _all_pages(conn, match, high, page_size=2)
+            assert sorted(ids) == [1, 2, 4, 5, 6]
+
+            # Mensagem nova não entra nas páginas de uma busca já feita
+            conn.execute("INSERT INTO messages (user_id, message_text, group_id) VALUES (1, 'alta', -100)")
+            assert _all_pages(conn, match, high, page_size=2) == ids
+
+            first = search_page(conn, match, high, page_size=2)
+            last = first.results[-1]
+            second = search_page(conn, match, high, after=(last.score, last.message_id), page_size=2)
+            back = search_page(conn, match, high, before=(second.results[0].score, second.results[0].message_id),
+                               page_size=2)
+            assert [r.message_id for r in back.results] == [r.message_id for r in first.results]
+    finally:
+        db.close()
@@ -0,0 +1,49 @@
+from database import Database
+from user_cache import UserCache
+from write_buffer import WriteBehindBuffer
+
+
+def test_failing_batches_are_dropped_after_max_retries(tmp_path):
+    # Banco sem as tabelas: todo flush falha
+    db = Database(str(tmp_path / 'bot.db'), pool_size=1)
+    drops = []
+    buffer = WriteBehindBuffer(
+        db, max_batch=1000, flush_interval=3600, max_retries=3, max_pending=5,
+        on_drop=lambda reason, count, user_ids: drops.append((reason, count))
+    )
+    try:
+        for i in range(8):
+            buffer.add_message(i, f'mensagem {i}', -100)
+        assert buffer.depth == 5
+        assert drops == [('overflow', 1)] * 3
+
+        for _ in range(2):
+            assert buffer.flush() == 0
+            assert buffer.depth == 5
+        assert buffer.flush() == 0
+        assert buffer.depth == 0
+        assert drops[-1] == ('retries', 5)
+        assert buffer.dropped == 8
+    finally:
+        buffer.close()
+
+
+def test_dropped_users_are_forgotten_by_the_cache(tmp_path):
+    db = Database(str(tmp_path / 'bot.db'), pool_size=1)
+    cache = UserCache()
+
+    def on_drop(reason, count, user_ids):
+        for user_id in user_ids:
+            cache.invalidate(user_id)
+
+    buffer = WriteBehindBuffer(db, max_batch=1000, flush_interval=3600, max_retries=1, on_drop=on_drop)
+    try:
+        assert cache.should_write(42, 'ana', 'Ana', None)
+        buffer.add_user(42, 'ana', 'Ana', None)
+        assert not cache.should_write(42, 'ana', 'Ana', None)
+
+        assert buffer.flush() == 0
+        assert buffer.depth == 0
+        assert cache.should_write(42, 'ana', 'Ana', None)
+    finally:
+        buffer.close()
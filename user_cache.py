@@ -0,0 +1,48 @@
+import threading
+from collections import OrderedDict
+
+
+class UserCache:
+    """Cache LRU com os últimos dados gravados de cada usuário.
+
+    Usado para pular a escrita no banco quando username e nome não mudaram
+    desde a última gravação. O tamanho é limitado por `max_size`; os usuários
+    menos recentes são descartados primeiro.
+    """
+
+    def __init__(self, max_size=10000):
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    @property
+    def hit_rate(self):
+        """Fração das consultas que evitaram uma escrita"""
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+    def should_write(self, user_id, username=None, first_name=None, last_name=None):
+        """Retorna True se os dados mudaram (e já os registra como gravados)"""
+        data = (username, first_name, last_name)
+        with self._lock:
+            if self._entries.get(user_id) == data:
+                self._entries.move_to_end(user_id)
+                self.hits += 1
+                return False
+
+            self.misses += 1
+            self._entries[user_id] = data
+            self._entries.move_to_end(user_id)
+            if len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+            return True
+
+    def invalidate(self, user_id):
+        """Esquece o usuário (ex.: a gravação falhou)"""
+        with self._lock:
+            self._entries.pop(user_id, None)
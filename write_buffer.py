@@ -0,0 +1,167 @@
+import logging
+import threading
+import time
+
+from database import UPSERT_USER_SQL
+from rollups import apply_message_rollups
+from analytics import apply_activity_counters
+
+logger = logging.getLogger(__name__)
+
+
+class WriteBehindBuffer:
+    """Buffer de escrita em lote (write-behind) para usuários e mensagens.
+
+    Os handlers apenas enfileiram; uma thread em background grava tudo em
+    uma única transação quando o lote atinge `max_batch` itens ou quando
+    `flush_interval` segundos se passam desde o último flush. Se um
+    `async_db` for informado, o flush roda na thread de escrita dele, mantendo
+    a ordem em relação às demais escritas do bot.
+
+    Um lote que falha volta para a fila, mas com limites: depois de
+    `max_retries` falhas seguidas o lote é descartado, e a fila nunca passa
+    de `max_pending` registros (as mensagens mais antigas saem primeiro).
+    Descartes são registrados no log como erro e informados a `on_drop`
+    (motivo, quantidade, user_ids dos usuários descartados), se houver: quem
+    marcou esses usuários como gravados (ex.: `UserCache`) precisa esquecê-los.
+    """
+
+    def __init__(self, db, max_batch=200, flush_interval=1.0, async_db=None,
+                 max_retries=5, max_pending=50000, on_drop=None):
+        self.db = db
+        self.async_db = async_db
+        self.max_batch = max_batch
+        self.flush_interval = flush_interval
+        self.max_retries = max_retries
+        self.max_pending = max_pending
+        self.on_drop = on_drop
+        self.dropped = 0
+        self._failures = 0
+
+        # Usuários pendentes por user_id (só a última versão importa)
+        self._users = {}
+        self._messages = []
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._closed = threading.Event()
+
+        self._thread = threading.Thread(target=self._run, name='write-behind', daemon=True)
+        self._thread.start()
+
+    @property
+    def depth(self):
+        """Quantidade de registros aguardando gravação"""
+        with self._lock:
+            return len(self._users) + len(self._messages)
+
+    def add_user(self, user_id, username=None, first_name=None, last_name=None):
+        """Enfileira a gravação de um usuário"""
+        with self._lock:
+            self._users[user_id] = (user_id, username, first_name, last_name)
+            pending = len(self._users) + len(self._messages)
+        if pending >= self.max_batch:
+            self._wake.set()
+
+    def add_message(self, user_id, message_text, group_id):
+        """Enfileira a gravação de uma mensagem"""
+        # Registrar o horário do recebimento, não o do flush (UTC, mesmo formato do CURRENT_TIMESTAMP)
+        message_date = time.strftime('%Y-%m-%d %H:%M:%S', time.gmtime())
+        with self._lock:
+            self._messages.append((user_id, message_text, message_date, group_id))
+            pending = len(self._users) + len(self._messages)
+            if pending > self.max_pending:
+                pending -= self._trim_locked()
+        if pending >= self.max_batch:
+            self._wake.set()
+
+    def flush(self):
+        """Grava todos os registros pendentes em uma única transação"""
+        with self._flush_lock:
+            with self._lock:
+                users, self._users = self._users, {}
+                messages, self._messages = self._messages, []
+
+            if not users and not messages:
+                return 0
+
+            try:
+                with self.db.transaction() as conn:
+                    conn.executemany(UPSERT_USER_SQL, list(users.values()))
+                    conn.executemany('''
+                        INSERT INTO messages (user_id, message_text, message_date, group_id)
+                        VALUES (?, ?, ?, ?)
+                    ''', messages)
+                    apply_message_rollups(conn, messages)
+                    apply_activity_counters(conn, messages)
+            except Exception as e:
+                self._failures += 1
+                logger.error(
+                    f"Erro ao gravar lote ({len(users)} usuários, {len(messages)} mensagens, "
+                    f"falha {self._failures}/{self.max_retries}): {e}"
+                )
+                if self._failures >= self.max_retries:
+                    # O banco continua recusando o lote: descartar em vez de acumular para sempre
+                    self._failures = 0
+                    self._record_drop('retries', len(users) + len(messages), list(users))
+                    return 0
+                # Devolver o lote para a fila para tentar de novo no próximo flush
+                with self._lock:
+                    for user_id, row in users.items():
+                        self._users.setdefault(user_id, row)
+                    self._messages[:0] = messages
+                    self._trim_locked()
+                return 0
+
+            self._failures = 0
+            return len(users) + len(messages)
+
+    def _trim_locked(self):
+        """Descarta os registros mais antigos acima de `max_pending` (chamar com `_lock`)"""
+        excess = len(self._users) + len(self._messages) - self.max_pending
+        if excess <= 0:
+            return 0
+        dropped_messages = min(excess, len(self._messages))
+        del self._messages[:dropped_messages]
+        # Só sobram usuários acima do limite se a fila não tiver mais mensagens
+        dropped_users = list(self._users)[:excess - dropped_messages]
+        for user_id in dropped_users:
+            del self._users[user_id]
+        self._record_drop('overflow', excess, dropped_users)
+        return excess
+
+    def _record_drop(self, reason, count, user_ids):
+        self.dropped += count
+        if reason == 'retries':
+            logger.error(f"Lote descartado após {self.max_retries} falhas seguidas: {count} registros perdidos")
+        else:
+            logger.error(f"Buffer de escrita cheio ({self.max_pending}): {count} registros mais antigos descartados")
+        if self.on_drop is not None:
+            self.on_drop(reason, count, user_ids)
+
+    def _flush_on_writer(self):
+        """Executa o flush na thread de escrita do banco, se houver"""
+        if self.async_db is None:
+            return self.flush()
+        try:
+            return self.async_db.submit_write(self.flush).result()
+        except RuntimeError:
+            # Thread de escrita já encerrada (desligamento): gravar direto
+            return self.flush()
+
+    def _run(self):
+        """Loop da thread de flush"""
+        while not self._closed.is_set():
+            self._wake.wait(self.flush_interval)
+            self._wake.clear()
+            self._flush_on_writer()
+
+    def close(self):
+        """Para a thread de flush e grava o que ainda estiver pendente"""
+        if self._closed.is_set():
+            return
+        self._closed.set()
+        self._wake.set()
+        self._thread.join(timeout=10)
+        written = self._flush_on_writer()
+        logger.info(f"Buffer de escrita encerrado ({written} registros gravados no flush final)")